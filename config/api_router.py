@@ -5,6 +5,7 @@ from rest_framework.routers import SimpleRouter
 
 from flash.users.api.views import UserViewSet
 from news.api.views import ArticlesView
+from news.api.views import FeedBreakerViewSet
 from news.api.views import FeedPollingViewSet
 from news.api.views import FeedsView
 from news.api.views import ImageUploadView
@@ -22,6 +23,7 @@ router.register("profile", ProfileView, basename="profile")
 router.register("user-feeds", UserFeedsView, basename="user-feeds")
 router.register("lists", UserArticleListsView, basename="lists")
 router.register("feed-polling", FeedPollingViewSet)
+router.register("feed-breakers", FeedBreakerViewSet)
 
 app_name = "api"
 urlpatterns = [
@@ -5,6 +5,7 @@ import django
 from celery import Celery
 from celery.schedules import crontab
 from celery.signals import setup_logging
+from django.conf import settings
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.local")
@@ -12,8 +13,10 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.local")
 django.setup()
 
 from news.tasks import embeddings  # noqa: E402
-from news.tasks import poll  # noqa: E402
+from news.tasks import maintain_article_partitions  # noqa: E402
+from news.tasks import poll_due  # noqa: E402
 from news.tasks import precompute  # noqa: E402
+from news.tasks import reconcile_articles_data  # noqa: E402
 from news.tasks import run_mastodon_bots  # noqa: E402
 
 app = Celery("flash")
@@ -28,9 +31,9 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 @app.on_after_configure.connect
 def setup_periodic_tasks(sender, **kwargs):
     sender.add_periodic_task(
-        crontab(minute="04"),
-        poll.s(),
-        name="poll feeds",
+        settings.POLLER_SCHEDULE_TICK,
+        poll_due.s(),
+        name="poll due feeds",
     )
     sender.add_periodic_task(
         crontab(minute="34"),
@@ -42,6 +45,16 @@ def setup_periodic_tasks(sender, **kwargs):
         embeddings.s(),
         name="embeddings",
     )
+    sender.add_periodic_task(
+        crontab(minute="24", hour="3"),
+        reconcile_articles_data.s(),
+        name="reconcile articles data",
+    )
+    sender.add_periodic_task(
+        crontab(minute="14", hour="2"),
+        maintain_article_partitions.s(),
+        name="maintain article partitions",
+    )
     sender.add_periodic_task(
         crontab(minute="0", hour="*/1"),  # Runs at the start of every hour
         run_mastodon_bots.s(),
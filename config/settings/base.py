@@ -3,6 +3,7 @@
 
 import ssl
 from pathlib import Path
+from urllib.parse import urlsplit
 
 import environ
 from django.utils.translation import gettext_lazy as _
@@ -51,6 +52,13 @@ DATABASES = {
     "default": env.db("DATABASE_URL"),
 }
 DATABASES["default"]["ATOMIC_REQUESTS"] = True
+# Read replicas, comma separated URLs; see news.replicas for what reads from them
+for index, url in enumerate(env.list("DATABASE_REPLICA_URLS", default=[])):
+    DATABASES[f"replica{index}"] = env.db_url_config(url)
+    DATABASES[f"replica{index}"]["TEST"] = {"MIRROR": "default"}
+DATABASE_ROUTERS = ["news.replicas.ReplicaRouter"]
+# Seconds after a write during which the reads of the same client stay on the primary
+DATABASE_REPLICA_PIN_SECONDS = env.int("DATABASE_REPLICA_PIN_SECONDS", default=10)
 # https://docs.djangoproject.com/en/stable/ref/settings/#std:setting-DEFAULT_AUTO_FIELD
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -150,6 +158,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "allauth.account.middleware.AccountMiddleware",
+    "news.replicas.ReplicaMiddleware",
 ]
 
 # STATIC
@@ -324,6 +333,30 @@ CACHES = {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
         },
     },
+    # the embeddings of queries, in a database of their own so that they
+    # survive the clearing of the default cache after each poll
+    "embeddings": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": env(
+            "EMBEDDINGS_CACHE_URL",
+            default=urlsplit(REDIS_URL)._replace(path="/1").geturl(),
+        ),
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        },
+    },
+    # the users pinned to the primary after their writes, see news.replicas;
+    # also kept out of the default cache, which each poll clears
+    "replica_pins": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": env(
+            "REPLICA_PINS_CACHE_URL",
+            default=urlsplit(REDIS_URL)._replace(path="/2").geturl(),
+        ),
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        },
+    },
 }
 
 # django-allauth
@@ -371,3 +404,93 @@ SPECTACULAR_SETTINGS = {
 }
 # Your stuff...
 # ------------------------------------------------------------------------------
+
+# Feed polling
+# ------------------------------------------------------------------------------
+# Maximum number of feeds polled concurrently
+POLLER_CONCURRENCY = env.int("POLLER_CONCURRENCY", default=20)
+# Maximum number of concurrent requests to the same host
+POLLER_PER_HOST_CONCURRENCY = env.int("POLLER_PER_HOST_CONCURRENCY", default=2)
+# Number of worker processes normalizing the HTML of the articles (0: in the event loop)
+POLLER_NORMALIZE_WORKERS = env.int("POLLER_NORMALIZE_WORKERS", default=4)
+# Seconds between the runs picking the feeds due to be polled
+POLLER_SCHEDULE_TICK = env.int("POLLER_SCHEDULE_TICK", default=60)
+# Bounds in seconds of the polling interval of each feed, adapted to its publishing rate
+POLLER_MIN_INTERVAL = env.int("POLLER_MIN_INTERVAL", default=300)
+POLLER_MAX_INTERVAL = env.int("POLLER_MAX_INTERVAL", default=86400)
+# Polling interval in seconds of the feeds with no publishing history
+POLLER_DEFAULT_INTERVAL = env.int("POLLER_DEFAULT_INTERVAL", default=3600)
+# Seconds the feeds claimed by a run are held for if it dies before rescheduling them,
+# longer than the time limit of the poll_due task
+POLLER_CLAIM_LEASE = env.int("POLLER_CLAIM_LEASE", default=3600)
+# Consecutive failed polls after which a feed is parked
+POLLER_BREAKER_THRESHOLD = env.int("POLLER_BREAKER_THRESHOLD", default=3)
+# Seconds a feed is first parked for, doubled at each further failure up to the maximum
+POLLER_BREAKER_BASE_DELAY = env.int("POLLER_BREAKER_BASE_DELAY", default=3600)
+POLLER_BREAKER_MAX_DELAY = env.int("POLLER_BREAKER_MAX_DELAY", default=7 * 86400)
+
+# Readability service, used to extract the full text of articles of incomplete feeds
+READABILITY_URL = env("READABILITY_URL", default="http://readability:8081")
+# Maximum number of extractions in flight
+READABILITY_CONCURRENCY = env.int("READABILITY_CONCURRENCY", default=8)
+# Timeout in seconds of each extraction request
+READABILITY_TIMEOUT = env.float("READABILITY_TIMEOUT", default=30.0)
+# Number of retries of extraction requests failing with connection errors or timeouts
+READABILITY_RETRIES = env.int("READABILITY_RETRIES", default=2)
+
+# Articles
+# ------------------------------------------------------------------------------
+# Months after which the monthly partitions of articles are detached (0: never)
+ARTICLES_RETENTION_MONTHS = env.int("ARTICLES_RETENTION_MONTHS", default=0)
+
+# Embeddings
+# ------------------------------------------------------------------------------
+# Number of articles embedded and written back at a time
+EMBEDDINGS_BATCH_SIZE = env.int("EMBEDDINGS_BATCH_SIZE", default=1000)
+# Maximum number of connections of the pool used by the embedding jobs
+EMBEDDINGS_POOL_SIZE = env.int("EMBEDDINGS_POOL_SIZE", default=4)
+# Number of batches buffered between the stages of the embedding pipeline
+EMBEDDINGS_QUEUE_SIZE = env.int("EMBEDDINGS_QUEUE_SIZE", default=2)
+# Seconds a worker has to embed the articles it claimed before others may claim them
+EMBEDDINGS_CLAIM_SECONDS = env.int("EMBEDDINGS_CLAIM_SECONDS", default=900)
+# Articles embedded at a time as soon as they are stored
+EMBEDDINGS_INGEST_BATCH_SIZE = env.int("EMBEDDINGS_INGEST_BATCH_SIZE", default=64)
+# Seconds a stored article waits at most for its batch to fill up before being embedded
+EMBEDDINGS_INGEST_MAX_WAIT = env.float("EMBEDDINGS_INGEST_MAX_WAIT", default=5.0)
+# Inference backend of the embedding model: torch, onnx or onnx-int8 (see news.services)
+EMBEDDINGS_BACKEND = env("EMBEDDINGS_BACKEND", default="torch")
+# Threads running the operators of the model (0: the default of the backend)
+EMBEDDINGS_THREADS = env.int("EMBEDDINGS_THREADS", default=0)
+# Sentences encoded by the model at a time
+EMBEDDINGS_ENCODE_BATCH_SIZE = env.int("EMBEDDINGS_ENCODE_BATCH_SIZE", default=32)
+# Instruction set the int8 model is quantized for: arm64, avx2, avx512 or avx512_vnni
+EMBEDDINGS_QUANTIZATION = env("EMBEDDINGS_QUANTIZATION", default="avx2")
+# Directory the quantized model is exported to, the first time it is loaded
+EMBEDDINGS_MODEL_DIR = env(
+    "EMBEDDINGS_MODEL_DIR",
+    default=str(Path(MEDIA_ROOT) / "models" / "use-cmlm-multilingual"),
+)
+# Text of long articles fed to the model: head, head_tail or chunks (see news.embedding_text)
+EMBEDDINGS_TEXT_STRATEGY = env("EMBEDDINGS_TEXT_STRATEGY", default="head")
+# Maximum number of chunks averaged per article by the chunks strategy
+EMBEDDINGS_MAX_CHUNKS = env.int("EMBEDDINGS_MAX_CHUNKS", default=4)
+# Embeddings of queries and whitelists kept in each process by the query cache
+EMBEDDINGS_CACHE_SIZE = env.int("EMBEDDINGS_CACHE_SIZE", default=1024)
+# Seconds the embeddings of queries and whitelists are kept in the shared cache
+EMBEDDINGS_CACHE_TIMEOUT = env.int("EMBEDDINGS_CACHE_TIMEOUT", default=7 * 86400)
+# Embedding server holding the model for the other processes, http://host:port or
+# unix:/path (empty: each process loads its own copy of the model)
+EMBEDDING_SERVER_URL = env("EMBEDDING_SERVER_URL", default="")
+# Address the embedding server listens on
+EMBEDDING_SERVER_BIND = env("EMBEDDING_SERVER_BIND", default="http://0.0.0.0:8090")
+# Seconds the clients wait for the embedding server, long enough for a batch of the backfill
+EMBEDDING_SERVER_TIMEOUT = env.float("EMBEDDING_SERVER_TIMEOUT", default=600.0)
+# Seconds the searches wait for the embedding server to embed their query
+EMBEDDING_SERVER_QUERY_TIMEOUT = env.float(
+    "EMBEDDING_SERVER_QUERY_TIMEOUT",
+    default=5.0,
+)
+# Maximum number of inputs the embedding server encodes at a time
+EMBEDDING_SERVER_MAX_BATCH = env.int("EMBEDDING_SERVER_MAX_BATCH", default=64)
+# Seconds the embedding server waits for more inputs to fill a batch
+EMBEDDING_SERVER_MAX_DELAY = env.float("EMBEDDING_SERVER_MAX_DELAY", default=0.01)
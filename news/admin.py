@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from .models import FeedBreaker
 from .models import Feeds
 from .models import Profile
 
@@ -70,3 +71,18 @@ class ProfileAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Feeds)
+
+
+@admin.register(FeedBreaker)
+class FeedBreakerAdmin(admin.ModelAdmin):
+    list_display = (
+        "feed",
+        "state",
+        "failures",
+        "last_status",
+        "reason",
+        "opened_until",
+    )
+    list_filter = ("state",)
+    search_fields = ("feed__title", "feed__url")
+    ordering = ("-opened_until",)
@@ -4,6 +4,7 @@ from rest_framework import serializers
 
 from news.models import Articles
 from news.models import ArticlesCombined
+from news.models import FeedBreaker
 from news.models import FeedPolling
 from news.models import Feeds
 from news.models import FeedsCombined
@@ -39,8 +40,6 @@ class ArticleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Articles
         exclude = [
-            "paraphrase_multilingual_mpnet_base_v2",
-            "use_cmlm_multilingual",
             "tsv",
         ]
 
@@ -57,8 +56,6 @@ class ArticleReadSerializer(serializers.ModelSerializer):
         exclude = [
             "content",
             "content_original",
-            "paraphrase_multilingual_mpnet_base_v2",
-            "use_cmlm_multilingual",
             "tsv",
         ]
 
@@ -73,8 +70,6 @@ class ArticleSerializerFull(serializers.ModelSerializer):
     class Meta:
         model = ArticlesCombined
         exclude = [
-            "paraphrase_multilingual_mpnet_base_v2",
-            "use_cmlm_multilingual",
             "tsv",
         ]
 
@@ -107,3 +102,9 @@ class FeedPollingSerializer(serializers.ModelSerializer):
     class Meta:
         model = FeedPolling
         fields = "__all__"
+
+
+class FeedBreakerSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = FeedBreaker
+        fields = "__all__"
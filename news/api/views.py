@@ -11,7 +11,11 @@ from django.conf import settings
 from django.contrib.postgres.aggregates import ArrayAgg
 from django.contrib.postgres.search import SearchVector
 from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
 from django.core.files.storage import FileSystemStorage
+from django.db import connections
+from django.db.models import OuterRef
+from django.db.models import Subquery
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from django.shortcuts import render
@@ -21,7 +25,6 @@ from django_filters import rest_framework as filters
 from drf_spectacular.utils import extend_schema
 from ebooklib import epub
 from feedgen.feed import FeedGenerator
-from pgvector.django import CosineDistance
 from PIL import Image
 from requests import Request
 from rest_framework import mixins
@@ -39,6 +42,7 @@ import poller
 from news.api.serializers import ArticleReadSerializer
 from news.api.serializers import ArticleSerializer
 from news.api.serializers import ArticleSerializerFull
+from news.api.serializers import FeedBreakerSerializer
 from news.api.serializers import FeedCreateSerializer
 from news.api.serializers import FeedPollingSerializer
 from news.api.serializers import FeedSerializer
@@ -47,8 +51,10 @@ from news.api.serializers import ProfileSerializer
 from news.api.serializers import UserArticleListsSerializer
 from news.api.serializers import UserArticleListsSerializerFull
 from news.api.serializers import UserFeedSerializer
+from news.models import ArticleEmbeddings
 from news.models import Articles
 from news.models import ArticlesCombined
+from news.models import FeedBreaker
 from news.models import FeedIcons
 from news.models import FeedPolling
 from news.models import Feeds
@@ -56,6 +62,8 @@ from news.models import FeedsCombined
 from news.models import UserArticleLists
 from news.models import UserArticles
 from news.models import UserFeeds
+from news.models import hnsw_candidates
+from news.normalizer import normalize_content
 from news.services import TextEmbeddingService
 
 
@@ -78,10 +86,94 @@ class FeedPermissions(permissions.BasePermission):
         return bool(request.user and request.user.is_staff)
 
 
+# number of articles nearest to the query returned by search
+SEARCH_CANDIDATES = 1000
+
+
 class StandardResultsSetPagination(pagination.PageNumberPagination):
     page_size = 200
 
 
+def estimate_count(queryset):
+    """Number of rows of the queryset estimated by the planner, without running it."""
+    # on the database the queryset reads from, such as a replica
+    try:
+        sql, params = queryset.order_by().query.get_compiler(queryset.db).as_sql()
+    except EmptyResultSet:
+        # such as filter(id__in=[]), which Django does not even run
+        return 0
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class KeysetPagination(pagination.CursorPagination):
+    """
+    Pagination on the ordering of the queryset with opaque cursors carrying
+    the position of the last row, so that any page costs the same as the
+    first one. The total is only returned, as an estimate, with ?count=true.
+    """
+
+    page_size = 200
+    ordering = "-id"
+    count_query_param = "count"
+
+    def get_ordering(self, request, queryset, view):
+        # keep the ordering of the view, such as the distance for search
+        ordering = queryset.query.order_by
+        if ordering and all(isinstance(field, str) for field in ordering):
+            return tuple(ordering)
+        return super().get_ordering(request, queryset, view)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ("1", "true"):
+            self.count = estimate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = {
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        }
+        if self.count is not None:
+            response["count"] = self.count
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"]["count"] = {
+            "type": "integer",
+            "example": 123,
+            "description": "Estimated number of results, only with count=true",
+        }
+        return response_schema
+
+
+class ArticlesPagination(StandardResultsSetPagination):
+    """Page number pagination, or keyset pagination with ?pagination=cursor."""
+
+    mode_query_param = "pagination"
+
+    def __init__(self):
+        super().__init__()
+        self.keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.mode_query_param) == "cursor":
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.keyset = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
 def get_epub(
     articles,
     list_name,
@@ -302,7 +394,9 @@ class ArticlesView(
     queryset = ArticlesCombined.objects.all().order_by("-id")
     permission_classes = [ArticlePermissions]
     filterset_class = ArticlesFilter
-    pagination_class = StandardResultsSetPagination
+    pagination_class = ArticlesPagination
+    # safe requests read from a replica, see news.replicas
+    replica_reads = True
 
     @action(detail=False, methods=["get"])
     def favorites(self, request, *args, **kwargs):
@@ -317,11 +411,7 @@ class ArticlesView(
             rating=5,
         ).values_list("feed_id", flat=True)
 
-        if not favorite_feed_ids:
-            return Response(
-                {"count": 0, "next": None, "previous": None, "results": []},
-            )  # Standard paginated empty response
-
+        # without favorites, an empty page in the shape of the pagination mode
         queryset = (
             self.get_queryset()
             .filter(feed_id__in=list(favorite_feed_ids))
@@ -360,14 +450,12 @@ class ArticlesView(
         queryset = ArticlesCombined.objects
         article = get_object_or_404(queryset, pk=pk)
         serializer = ArticleSerializerFull(article, context={"request": request})
-        user = request.user
-        user_articles = user.userarticles_set.filter(article_id=article.id)
-        if user_articles.exists():
-            user_article = user_articles.first()
-            user_article.read = True
-            user_article.save()
-        else:
-            user.userarticles_set.create(article_id=article.id, read=True)
+        # looked up on the primary, whereas the article may come from a replica
+        UserArticles.objects.update_or_create(
+            user=request.user,
+            article_id=article.id,
+            defaults={"read": True},
+        )
         return Response(serializer.data)
 
     def update(self, request, *args, **kwargs):
@@ -390,7 +478,7 @@ class ArticlesView(
             decoded_content = (
                 content.decode() if isinstance(content, bytes) else content
             )
-            modified_data["content"] = poller.normalize_content(decoded_content, php)
+            modified_data["content"] = normalize_content(decoded_content, php)
         elif request.data["content_original"]:
             content_original = request.data["content_original"]
             decoded_content = (
@@ -398,7 +486,7 @@ class ArticlesView(
                 if isinstance(content_original, bytes)
                 else content_original
             )
-            modified_data["content_original"] = poller.normalize_content(
+            modified_data["content_original"] = normalize_content(
                 decoded_content,
                 php,
             )
@@ -494,16 +582,21 @@ class ArticlesView(
     def related(self, request, pk=None):
         queryset = ArticlesCombined.objects
         article = get_object_or_404(queryset, pk=pk)
-        if article.use_cmlm_multilingual is None:
+        embedding = ArticleEmbeddings.objects.filter(
+            article_id=article.id,
+            model=ArticleEmbeddings.USE_CMLM_MULTILINGUAL,
+        ).first()
+        if embedding is None:
             results = []
         else:
+            nearest = ArticleEmbeddings.objects.nearest(
+                embedding.embedding,
+                ArticleEmbeddings.USE_CMLM_MULTILINGUAL,
+            ).values_list("article_id", flat=True)[1:100]
+            with hnsw_candidates(100, nearest.db):
+                nearest = list(nearest)
             serializer = self.get_serializer(
-                queryset.order_by(
-                    CosineDistance(
-                        "use_cmlm_multilingual",
-                        article.use_cmlm_multilingual,
-                    ),
-                )[1:100],
+                queryset.filter(id__in=nearest),
                 many=True,
             )
             results = sorted(serializer.data, key=lambda x: x["id"], reverse=True)[:10]
@@ -513,20 +606,31 @@ class ArticlesView(
     def search(self, request, pk=None):
         queryset = self.get_queryset()
         embedding_service = TextEmbeddingService()
-        q_embedding = embedding_service.get_embedding(pk)
-        queryset = queryset.order_by(
-            CosineDistance(
-                "use_cmlm_multilingual",
-                q_embedding,
-            ),
+        q_embedding = embedding_service.embed_query(pk)
+        # the nearest articles are found with the HNSW index on the embeddings
+        nearest = ArticleEmbeddings.objects.nearest(
+            q_embedding,
+            ArticleEmbeddings.USE_CMLM_MULTILINGUAL,
         )
-        # Paginate the results
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        queryset = (
+            queryset.filter(
+                id__in=nearest.values("article_id")[:SEARCH_CANDIDATES],
+            )
+            .annotate(
+                distance=Subquery(
+                    nearest.filter(article_id=OuterRef("id")).values("distance")[:1],
+                ),
+            )
+            .order_by("distance", "id")
+        )
+        with hnsw_candidates(SEARCH_CANDIDATES, queryset.db):
+            # Paginate the results
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                serializer = self.get_serializer(page, many=True)
+                return self.get_paginated_response(serializer.data)
+            serializer = self.get_serializer(queryset, many=True)
+            return Response(serializer.data)
 
 
 class FeedsView(
@@ -564,6 +668,8 @@ class FeedsView(
     )
     serializer_class = FeedSerializer
     permission_classes = [FeedPermissions]
+    # safe requests read from a replica, see news.replicas
+    replica_reads = True
 
     @extend_schema(
         responses=FeedSerializerSimple,
@@ -607,7 +713,7 @@ class FeedsView(
         queryset = Feeds.objects
         feed = get_object_or_404(queryset, pk=pk)
         p = poller.Poller(feed)
-        p.poll()
+        p.poll(force=True)
         data = {
             "retrieved": p.retrieved,
             "failed": p.failed,
@@ -1007,6 +1113,13 @@ class FeedPollingViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_fields = ["feed_id"]
 
 
+class FeedBreakerViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = FeedBreaker.objects.all().order_by("-opened_until", "feed_id")
+    serializer_class = FeedBreakerSerializer
+    permission_classes = [permissions.IsAdminUser]
+    filterset_fields = ["feed_id", "state"]
+
+
 class ImageUploadView(APIView):
     def post(self, request):
         # Get the uploaded file
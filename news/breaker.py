@@ -0,0 +1,154 @@
+import datetime
+import email.utils
+import logging
+import random
+
+from django.conf import settings
+from django.utils import timezone
+
+from news.models import FeedBreaker
+from news.models import FeedPolling
+from news.models import Feeds
+
+logger = logging.getLogger(__name__)
+
+# number of recent polls in which the consecutive failures are counted
+FAILURE_WINDOW = 20
+# the backoff is randomly shortened or lengthened by up to this fraction, so
+# that feeds which failed together are not all probed again at once
+JITTER = 0.2
+REASONS = {
+    -100: "HTTP error",
+    -40: "exception",
+    -30: "request error",
+    -20: "connection error",
+    -10: "timeout",
+    -5: "invalid feed",
+}
+
+
+def is_failure(http_status_code: int) -> bool:
+    """Check whether a poll outcome, as recorded in FeedPolling, is a failure."""
+    return http_status_code < 0 or http_status_code >= 400  # noqa: PLR2004
+
+
+def describe(http_status_code: int) -> str:
+    return REASONS.get(http_status_code, f"HTTP status {http_status_code}")
+
+
+def parse_retry_after(value: str | None) -> datetime.datetime | None:
+    """Parse a Retry-After header, either a number of seconds or an HTTP date."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return timezone.now() + datetime.timedelta(seconds=int(value))
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.UTC)
+    return when
+
+
+def consecutive_failures(feed: Feeds) -> int:
+    """Count the failed polls of the feed since the last successful one."""
+    failures = 0
+    for http_status_code in (
+        FeedPolling.objects.filter(feed=feed)
+        .order_by("-poll_start_time")
+        .values_list("http_status_code", flat=True)[:FAILURE_WINDOW]
+    ):
+        if not is_failure(http_status_code):
+            break
+        failures += 1
+    return failures
+
+
+def backoff(failures: int) -> datetime.timedelta:
+    """Time the circuit of a feed stays open after the given failures."""
+    exponent = max(0, failures - settings.POLLER_BREAKER_THRESHOLD)
+    seconds = settings.POLLER_BREAKER_BASE_DELAY * 2**exponent
+    seconds *= random.uniform(1 - JITTER, 1 + JITTER)  # noqa: S311
+    return datetime.timedelta(
+        seconds=min(seconds, settings.POLLER_BREAKER_MAX_DELAY),
+    )
+
+
+def allow(feed: Feeds) -> FeedBreaker | None:
+    """
+    Check whether the feed may be polled now: return None if so, or the
+    breaker that keeps it parked. Once the backoff has elapsed, an open
+    circuit turns half-open and lets a single probe poll through: the probe
+    is claimed with a conditional UPDATE which also pushes opened_until
+    POLLER_CLAIM_LEASE seconds forward, so that the other pollers stay
+    parked until its outcome is recorded, or the lease expires.
+    """
+    breaker = FeedBreaker.objects.filter(feed=feed).first()
+    if breaker is None or breaker.state == FeedBreaker.CLOSED:
+        return None
+    now = timezone.now()
+    claimed = FeedBreaker.objects.filter(
+        pk=breaker.pk,
+        state__in=(FeedBreaker.OPEN, FeedBreaker.HALF_OPEN),
+        opened_until__lte=now,
+    ).update(
+        state=FeedBreaker.HALF_OPEN,
+        opened_until=now + datetime.timedelta(seconds=settings.POLLER_CLAIM_LEASE),
+    )
+    if claimed:
+        logger.info(f"== probing feed {feed.id} after {breaker.failures} failures")
+        return None
+    # still open, or another poller is probing the feed
+    breaker.refresh_from_db()
+    if breaker.state == FeedBreaker.CLOSED:
+        return None
+    return breaker
+
+
+def record(
+    feed: Feeds,
+    http_status_code: int,
+    retry_after: str | None = None,
+) -> FeedBreaker:
+    """
+    Update the breaker of the feed with the outcome of the poll just
+    recorded in FeedPolling: close the circuit after a success, open it
+    after too many consecutive failures or when the server asked to retry
+    later, and open it again if the half-open probe failed.
+    """
+    breaker, _ = FeedBreaker.objects.get_or_create(feed=feed)
+    breaker.last_status = http_status_code
+    if not is_failure(http_status_code):
+        if breaker.state != FeedBreaker.CLOSED:
+            logger.info(f"== circuit of feed {feed.id} closed")
+        breaker.state = FeedBreaker.CLOSED
+        breaker.failures = 0
+        breaker.reason = ""
+        breaker.opened_until = None
+        breaker.save()
+        return breaker
+
+    breaker.failures = consecutive_failures(feed)
+    breaker.reason = describe(http_status_code)
+    opened_until = None
+    if (
+        breaker.state == FeedBreaker.HALF_OPEN
+        or breaker.failures >= settings.POLLER_BREAKER_THRESHOLD
+    ):
+        opened_until = timezone.now() + backoff(breaker.failures)
+    retry_at = parse_retry_after(retry_after)
+    if retry_at is not None:
+        opened_until = max(opened_until or retry_at, retry_at)
+        breaker.reason += f", retry after {retry_after}"
+    if opened_until is not None:
+        breaker.state = FeedBreaker.OPEN
+        breaker.opened_until = opened_until
+        logger.warning(
+            f"== circuit of feed {feed.id} open until "
+            f"{opened_until:%Y-%m-%d %H:%M} after {breaker.failures} failures: "
+            f"{breaker.reason}",
+        )
+    breaker.save()
+    return breaker
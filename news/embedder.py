@@ -0,0 +1,528 @@
+import logging
+import os
+import queue
+import socket
+import statistics
+import threading
+import time
+from contextlib import closing
+from dataclasses import dataclass
+
+import psycopg
+from django.conf import settings
+from django.db import connections
+from pgvector.psycopg import register_vector
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool
+
+from news.models import ArticleEmbeddings
+from news.services import TextEmbeddingService
+
+logger = logging.getLogger(__name__)
+
+# the next articles with no embedding for a model, newest first, skipping
+# those claimed by a worker
+EMBEDDING_CANDIDATES_SQL = """
+    SELECT id
+    FROM articles
+    WHERE id < %(below)s
+        AND NOT EXISTS (
+            SELECT 1
+            FROM article_embeddings
+            WHERE article_embeddings.article_id = articles.id
+                AND article_embeddings.model = %(model)s
+        )
+        AND NOT EXISTS (
+            SELECT 1
+            FROM embedding_claims
+            WHERE embedding_claims.article_id = articles.id
+                AND embedding_claims.model = %(model)s
+                AND embedding_claims.expires_at > now()
+        )
+    ORDER BY id DESC
+    LIMIT %(n)s
+"""
+
+# claim the candidates, unless another worker got there first
+EMBEDDING_CLAIM_SQL = """
+    INSERT INTO embedding_claims (article_id, model, worker, expires_at)
+    SELECT
+        article_id,
+        %(model)s,
+        %(worker)s,
+        now() + make_interval(secs => %(lease)s)
+    FROM unnest(%(ids)s::bigint[]) AS article_id
+    ON CONFLICT (article_id, model) DO UPDATE
+    SET worker = EXCLUDED.worker, expires_at = EXCLUDED.expires_at
+    WHERE embedding_claims.expires_at <= now()
+    RETURNING article_id
+"""
+
+EMBEDDING_ARTICLES_SQL = """
+    SELECT
+        id,
+        (CASE
+            WHEN language = 'it' THEN title
+            ELSE title_original END
+        ) as title,
+        (CASE
+            WHEN language = 'it' THEN content
+            ELSE content_original END
+        ) AS content
+    FROM articles
+    WHERE id = ANY(%(ids)s)
+    ORDER BY id DESC
+"""
+
+# take the oldest queued articles nobody else is embedding, returning how
+# long they waited
+EMBEDDING_QUEUE_TAKE_SQL = """
+    DELETE FROM embedding_queue
+    WHERE article_id IN (
+        SELECT article_id
+        FROM embedding_queue
+        ORDER BY queued_at
+        LIMIT %(n)s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING
+        article_id,
+        extract(epoch FROM clock_timestamp() - queued_at)::float AS waited
+"""
+
+EMBEDDING_QUEUE_PENDING_SQL = """
+    SELECT
+        count(*) AS pending,
+        extract(epoch FROM clock_timestamp() - min(queued_at))::float AS oldest
+    FROM embedding_queue
+"""
+
+# seconds an idle ingest worker waits for a notification before looking
+# at the queue anyway
+LISTEN_TIMEOUT = 60.0
+
+# above the id of any article
+MAX_ID = 2**63 - 1
+
+# seconds the stages wait on their queues before checking whether to stop
+POLL_TIMEOUT = 0.1
+
+# marks the end of the batches flowing through the pipeline
+_DONE = object()
+
+_embedding_pool = None
+# the embedding threads may all ask for the pool at once
+_embedding_pool_lock = threading.Lock()
+
+
+def configure_embedding_connection(conn):
+    register_vector(conn)
+    # the staging table of the embeddings lives as long as the connection
+    conn.execute(
+        """
+        CREATE TEMPORARY TABLE IF NOT EXISTS article_embeddings_temp (
+            article_id BIGINT,
+            embedding halfvec
+        ) ON COMMIT DELETE ROWS
+        """,
+    )
+    conn.commit()
+
+
+def embedding_conninfo():
+    database = connections["default"].settings_dict
+    return make_conninfo(
+        dbname=database["NAME"],
+        user=database["USER"] or None,
+        password=database["PASSWORD"] or None,
+        host=database["HOST"] or None,
+        port=database["PORT"] or None,
+    )
+
+
+def embedding_pool():
+    """Return the pool of connections of the embedding jobs, opening it once."""
+    global _embedding_pool  # noqa: PLW0603
+    with _embedding_pool_lock:
+        if _embedding_pool is None:
+            _embedding_pool = ConnectionPool(
+                conninfo=embedding_conninfo(),
+                kwargs={"row_factory": dict_row},
+                configure=configure_embedding_connection,
+                min_size=1,
+                max_size=settings.EMBEDDINGS_POOL_SIZE,
+                name="embeddings",
+                open=True,
+            )
+        return _embedding_pool
+
+
+def close_embedding_pool():
+    global _embedding_pool  # noqa: PLW0603
+    with _embedding_pool_lock:
+        if _embedding_pool is not None:
+            _embedding_pool.close()
+            _embedding_pool = None
+
+
+def write_embeddings(conn, model, ids, vectors):
+    # the embeddings have a table of their own, writing them leaves
+    # articles and its triggers alone
+    with conn.cursor() as cur:
+        with cur.copy(
+            """
+            COPY article_embeddings_temp (
+                    article_id,
+                    embedding
+                )
+            FROM STDIN WITH (FORMAT BINARY)""",
+        ) as copy:
+            # use set_types for binary copy
+            # https://www.psycopg.org/psycopg3/docs/basic/copy.html#binary-copy
+            copy.set_types(["bigint", "halfvec"])
+            for article_id, vector in zip(ids, vectors, strict=True):
+                copy.write_row([article_id, vector])
+
+        cur.execute(
+            """
+            INSERT INTO article_embeddings (article_id, stamp, model, embedding)
+            SELECT article_id, articles.stamp, %(model)s, embedding
+            FROM article_embeddings_temp
+            JOIN articles ON articles.id = article_embeddings_temp.article_id
+            ON CONFLICT (article_id, model, stamp) DO UPDATE
+            SET embedding = EXCLUDED.embedding
+            """,
+            {"model": model},
+        )
+        cur.execute(
+            """
+            DELETE FROM embedding_claims
+            WHERE model = %(model)s AND article_id = ANY(%(ids)s)
+            """,
+            {"model": model, "ids": list(ids)},
+        )
+        # the articles embedded by the backfill need not wait in the queue
+        cur.execute(
+            "DELETE FROM embedding_queue WHERE article_id = ANY(%(ids)s)",
+            {"ids": list(ids)},
+        )
+    conn.commit()
+
+
+@dataclass
+class StageStats:
+    name: str
+    articles: int = 0
+    batches: int = 0
+    # seconds spent working, as opposed to waiting on the queues
+    busy: float = 0.0
+
+    def add(self, articles, seconds):
+        self.articles += articles
+        self.batches += 1
+        self.busy += seconds
+
+    def report(self, elapsed):
+        rate = self.articles / self.busy if self.busy else 0.0
+        share = 100 * self.busy / elapsed if elapsed else 0.0
+        return (
+            f"{self.name}: {self.articles} articles in {self.batches} batches, "
+            f"{rate:.1f} articles/s, busy {share:.0f}% of the time"
+        )
+
+
+class EmbeddingPipeline:
+    """
+    Embed the articles with no embedding yet, as a streaming pipeline.
+
+    Four stages run concurrently, each in a thread of its own, connected by
+    bounded queues: fetch claims batches of articles, clean prepares their
+    text, encode runs the model and write copies the embeddings back,
+    releasing the claims and committing each batch. Any number of workers,
+    on any node, can split the backlog: each claims the newest articles
+    nobody else has claimed, for EMBEDDINGS_CLAIM_SECONDS, after which the
+    articles of a worker that died become claimable again. The model
+    releases the GIL while encoding, so that the database I/O and the
+    cleaning overlap with inference; the bounded queues keep the fast stages
+    from running ahead of the slowest one. If a stage fails all the others
+    stop, and the batches already written stay committed.
+    """
+
+    def __init__(
+        self,
+        model: str = ArticleEmbeddings.USE_CMLM_MULTILINGUAL,
+        batch_size: int | None = None,
+        queue_size: int | None = None,
+        worker: str | None = None,
+    ):
+        self.model = model
+        self.worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+        self.batch_size = batch_size or settings.EMBEDDINGS_BATCH_SIZE
+        self.queue_size = queue_size or settings.EMBEDDINGS_QUEUE_SIZE
+        self.embedding_service = TextEmbeddingService()
+        self.stop = threading.Event()
+        self.errors: list[BaseException] = []
+        self.stats: dict[str, StageStats] = {}
+
+    def connection(self):
+        return embedding_pool().connection()
+
+    def fetch(self):
+        """Claim and yield the batches of articles to embed."""
+        below = MAX_ID
+        with self.connection() as conn:
+            # the expired claims are claimable anyway, forget them
+            conn.execute("DELETE FROM embedding_claims WHERE expires_at <= now()")
+            conn.commit()
+            while not self.stop.is_set():
+                params = {
+                    "model": self.model,
+                    "worker": self.worker,
+                    "lease": settings.EMBEDDINGS_CLAIM_SECONDS,
+                    "n": self.batch_size,
+                    "below": below,
+                }
+                candidates = [
+                    row["id"] for row in conn.execute(EMBEDDING_CANDIDATES_SQL, params)
+                ]
+                if not candidates:
+                    break
+                # carry on below the candidates seen so far, rather than
+                # scanning again past the articles embedded in the meantime
+                below = candidates[-1]
+                params["ids"] = candidates
+                claimed = [
+                    row["article_id"]
+                    for row in conn.execute(EMBEDDING_CLAIM_SQL, params)
+                ]
+                articles = (
+                    conn.execute(EMBEDDING_ARTICLES_SQL, {"ids": claimed}).fetchall()
+                    if claimed
+                    else []
+                )
+                conn.commit()
+                if articles:
+                    yield articles
+
+    def clean(self, articles):
+        ids = [article["id"] for article in articles]
+        return ids, [
+            self.embedding_service.prepare(article["title"], article["content"])
+            for article in articles
+        ]
+
+    def encode(self, batch):
+        ids, texts = batch
+        return ids, self.embedding_service.embed_texts(texts)
+
+    def write(self, conn, batch):
+        ids, vectors = batch
+        write_embeddings(conn, self.model, ids, vectors)
+        written = self.stats["write"]
+        logger.info(
+            f"  {self.worker} embedded {written.articles + len(ids)} articles "
+            f"down to id {ids[-1]}",
+        )
+
+    def run(self) -> int:
+        """Run the pipeline to the end, returning the number of articles embedded."""
+        fetched = queue.Queue(self.queue_size)
+        cleaned = queue.Queue(self.queue_size)
+        encoded = queue.Queue(self.queue_size)
+        self.stop.clear()
+        self.errors = []
+        self.stats = {
+            name: StageStats(name) for name in ("fetch", "clean", "encode", "write")
+        }
+        threads = [
+            threading.Thread(target=self._source, args=(fetched,)),
+            threading.Thread(
+                target=self._stage,
+                args=("clean", self.clean, fetched, cleaned),
+            ),
+            threading.Thread(
+                target=self._stage,
+                args=("encode", self.encode, cleaned, encoded),
+            ),
+            threading.Thread(target=self._sink, args=(encoded,)),
+        ]
+        start_time = time.perf_counter()
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            # also reached when the task hits its time limit while waiting
+            self.stop.set()
+            for thread in threads:
+                if thread.is_alive():
+                    thread.join()
+        elapsed = time.perf_counter() - start_time
+        for stats in self.stats.values():
+            logger.info(f"  {self.worker} {stats.report(elapsed)}")
+        if self.errors:
+            raise self.errors[0]
+        return self.stats["write"].articles
+
+    def _get(self, inbox):
+        while not self.stop.is_set():
+            try:
+                return inbox.get(timeout=POLL_TIMEOUT)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _put(self, outbox, item):
+        while not self.stop.is_set():
+            try:
+                outbox.put(item, timeout=POLL_TIMEOUT)
+            except queue.Full:
+                continue
+            else:
+                return True
+        return False
+
+    def _fail(self, error):
+        logger.exception("  embedding pipeline stage failed")
+        self.errors.append(error)
+        self.stop.set()
+
+    def _source(self, outbox):
+        stats = self.stats["fetch"]
+        try:
+            # closing the generator gives its connection back to the pool
+            with closing(self.fetch()) as batches:
+                start = time.perf_counter()
+                for articles in batches:
+                    stats.add(len(articles), time.perf_counter() - start)
+                    if not self._put(outbox, articles):
+                        return
+                    start = time.perf_counter()
+            self._put(outbox, _DONE)
+        except Exception as e:  # noqa: BLE001
+            self._fail(e)
+
+    def _stage(self, name, func, inbox, outbox):
+        stats = self.stats[name]
+        try:
+            while (batch := self._get(inbox)) is not _DONE:
+                start = time.perf_counter()
+                result = func(batch)
+                stats.add(len(result[0]), time.perf_counter() - start)
+                if not self._put(outbox, result):
+                    return
+            self._put(outbox, _DONE)
+        except Exception as e:  # noqa: BLE001
+            self._fail(e)
+
+    def _sink(self, inbox):
+        stats = self.stats["write"]
+        try:
+            with self.connection() as conn:
+                while (batch := self._get(inbox)) is not _DONE:
+                    start = time.perf_counter()
+                    self.write(conn, batch)
+                    stats.add(len(batch[0]), time.perf_counter() - start)
+        except Exception as e:  # noqa: BLE001
+            self._fail(e)
+
+
+class IngestEmbedder:
+    """
+    Embed the articles as soon as they are stored.
+
+    A trigger on articles queues the ids of the new articles in
+    embedding_queue and notifies the channel of the same name. The worker
+    listens on it and drains the queue in micro-batches, flushing as soon
+    as EMBEDDINGS_INGEST_BATCH_SIZE articles are waiting or when the oldest
+    one has waited EMBEDDINGS_INGEST_MAX_WAIT seconds. A batch leaves the
+    queue in the transaction that stores its embeddings, and is skipped by
+    the other workers meanwhile, so that a failure puts it back; the hourly
+    backfill remains as a safety net. Each flush logs the latency from
+    ingestion to embedding of its articles.
+    """
+
+    def __init__(
+        self,
+        model: str = ArticleEmbeddings.USE_CMLM_MULTILINGUAL,
+        batch_size: int | None = None,
+        max_wait: float | None = None,
+    ):
+        self.model = model
+        self.batch_size = batch_size or settings.EMBEDDINGS_INGEST_BATCH_SIZE
+        self.max_wait = (
+            settings.EMBEDDINGS_INGEST_MAX_WAIT if max_wait is None else max_wait
+        )
+        self.embedding_service = TextEmbeddingService()
+        self.stop = threading.Event()
+        self.embedded = 0
+
+    def run(self) -> None:
+        """Embed the queued articles until stopped."""
+        with psycopg.connect(embedding_conninfo(), autocommit=True) as listener:
+            listener.execute("LISTEN embedding_queue")
+            while not self.stop.is_set():
+                timeout = self.flush_due()
+                if timeout is None:
+                    continue
+                # wait for new articles, or for the oldest to be due
+                for _ in listener.notifies(timeout=timeout, stop_after=1):
+                    pass
+
+    def flush_due(self) -> float | None:
+        """
+        Flush the queue if due; otherwise return how long to wait for it to
+        be, at most LISTEN_TIMEOUT seconds.
+        """
+        with embedding_pool().connection() as conn:
+            queue_state = conn.execute(EMBEDDING_QUEUE_PENDING_SQL).fetchone()
+        pending, oldest = queue_state["pending"], queue_state["oldest"]
+        if pending >= self.batch_size or (pending and oldest >= self.max_wait):
+            # nothing flushed: all taken by other workers, wait for news
+            return None if self.flush() else LISTEN_TIMEOUT
+        if pending:
+            return min(self.max_wait - oldest, LISTEN_TIMEOUT)
+        return LISTEN_TIMEOUT
+
+    def flush(self) -> int:
+        """Embed a batch of queued articles, returning how many."""
+        start = time.perf_counter()
+        with embedding_pool().connection() as conn:
+            waited = {
+                row["article_id"]: row["waited"]
+                for row in conn.execute(
+                    EMBEDDING_QUEUE_TAKE_SQL,
+                    {"n": self.batch_size},
+                )
+            }
+            if not waited:
+                return 0
+            articles = conn.execute(
+                EMBEDDING_ARTICLES_SQL,
+                {"ids": list(waited)},
+            ).fetchall()
+            ids = [article["id"] for article in articles]
+            if ids:
+                vectors = self.embedding_service.embed_texts(
+                    [
+                        self.embedding_service.prepare(
+                            article["title"],
+                            article["content"],
+                        )
+                        for article in articles
+                    ],
+                )
+                write_embeddings(conn, self.model, ids, vectors)
+        elapsed = time.perf_counter() - start
+        latencies = sorted(waited[article_id] + elapsed for article_id in ids)
+        self.embedded += len(ids)
+        if latencies:
+            logger.info(
+                f"  ingest embedded {len(ids)} articles in {elapsed:.2f} s, "
+                f"{self.embedded} in all; ingest-to-embedded latency: "
+                f"median {statistics.median(latencies):.1f} s, "
+                f"max {latencies[-1]:.1f} s",
+            )
+        return len(waited)
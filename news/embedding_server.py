@@ -0,0 +1,170 @@
+import asyncio
+import itertools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from aiohttp import web
+from django.conf import settings
+
+from news.services import MODEL_NAME
+from news.services import load_model
+
+logger = logging.getLogger(__name__)
+
+# header of the responses giving the shape of the float32 embeddings in the body
+SHAPE_HEADER = "X-Embedding-Shape"
+
+
+class EmbeddingServer:
+    """
+    Serve the embedding model to the other processes of the application,
+    which then need no copy of their own.
+
+    POST /embed takes {"inputs": [...]} and returns the float32 embeddings
+    of the inputs, in order, with their shape in the X-Embedding-Shape
+    header; GET /info describes the model. The inputs of all the requests
+    in flight are queued one by one and gathered into dynamic batches: a
+    batch is encoded as soon as it holds EMBEDDING_SERVER_MAX_BATCH inputs
+    or EMBEDDING_SERVER_MAX_DELAY seconds after its first input was taken,
+    so that a lone query waits at most that long while concurrent ones are
+    encoded together. The inputs of the smaller requests go first, so that
+    search queries do not wait behind a batch of the backfill.
+    """
+
+    def __init__(self, max_batch: int | None = None, max_delay: float | None = None):
+        self.max_batch = max_batch or settings.EMBEDDING_SERVER_MAX_BATCH
+        self.max_delay = (
+            settings.EMBEDDING_SERVER_MAX_DELAY if max_delay is None else max_delay
+        )
+        self.model = None
+        # a single thread encodes, the event loop keeps taking requests
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.sequence = itertools.count()
+        self.queue: asyncio.PriorityQueue | None = None
+        self.batches = 0
+        self.inputs = 0
+
+    def encode(self, texts):
+        return self.model.encode(
+            texts,
+            batch_size=self.max_batch,
+            convert_to_numpy=True,
+        ).astype(np.float32)
+
+    def application(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024**2)
+        app.router.add_post("/embed", self.embed)
+        app.router.add_get("/info", self.info)
+        app.cleanup_ctx.append(self.batching)
+        return app
+
+    async def batching(self, app):
+        self.model = await asyncio.get_running_loop().run_in_executor(
+            self.executor,
+            lambda: load_model(
+                settings.EMBEDDINGS_BACKEND,
+                threads=settings.EMBEDDINGS_THREADS,
+                quantization=settings.EMBEDDINGS_QUANTIZATION,
+            ),
+        )
+        self.queue = asyncio.PriorityQueue()
+        task = asyncio.create_task(self.batch_loop())
+        logger.info(f"Embedding server ready, {settings.EMBEDDINGS_BACKEND} backend")
+        yield
+        task.cancel()
+        self.executor.shutdown(cancel_futures=True)
+
+    async def take_batch(self):
+        """Wait for an input, then gather more until the batch is due."""
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except TimeoutError:
+                break
+        return batch
+
+    async def batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.take_batch()
+            # the requests given up by their clients need no encoding
+            batch = [item for item in batch if not item[3].done()]
+            if not batch:
+                continue
+            try:
+                embeddings = await loop.run_in_executor(
+                    self.executor,
+                    self.encode,
+                    [text for _, _, text, _ in batch],
+                )
+            except Exception as e:
+                logger.exception("Encoding failed")
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (*_, future), embedding in zip(batch, embeddings, strict=True):
+                if not future.done():
+                    future.set_result(embedding)
+            self.batches += 1
+            self.inputs += len(batch)
+
+    async def embed(self, request: web.Request) -> web.Response:
+        try:
+            inputs = (await request.json())["inputs"]
+        except (ValueError, KeyError, TypeError):
+            raise web.HTTPBadRequest(text='Expected {"inputs": [...]}') from None
+        if not isinstance(inputs, list) or not all(
+            isinstance(text, str) for text in inputs
+        ):
+            raise web.HTTPBadRequest(text="The inputs must be a list of strings")
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in inputs:
+            future = loop.create_future()
+            self.queue.put_nowait((len(inputs), next(self.sequence), text, future))
+            futures.append(future)
+        try:
+            embeddings = await asyncio.gather(*futures)
+        finally:
+            for future in futures:
+                future.cancel()
+        array = np.stack(embeddings) if embeddings else np.empty((0, 0), np.float32)
+        return web.Response(
+            body=array.tobytes(),
+            content_type="application/octet-stream",
+            headers={SHAPE_HEADER: ",".join(str(size) for size in array.shape)},
+        )
+
+    async def info(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "model": MODEL_NAME,
+                "backend": settings.EMBEDDINGS_BACKEND,
+                "max_seq_length": self.model.max_seq_length,
+                "batches": self.batches,
+                "inputs": self.inputs,
+            },
+        )
+
+
+def serve(url: str) -> None:
+    """Run the embedding server on url: http://host:port or unix:/path."""
+    app = EmbeddingServer().application()
+    if url.startswith("unix:"):
+        web.run_app(app, path=url.removeprefix("unix:"), print=None)
+        return
+    host, _, port = url.removeprefix("http://").rstrip("/").rpartition(":")
+    web.run_app(app, host=host or None, port=int(port), print=None)
@@ -0,0 +1,127 @@
+import html
+import re
+
+# the inputs of the model are cut to its window in characters, at this many
+# characters per token: a bound on the average of the tokenizer on European
+# languages, so that the window is filled nonetheless
+CHARS_PER_TOKEN = 6
+
+# strategies picking the text of a long article fed to the model
+STRATEGIES = ("head", "head_tail", "chunks")
+
+# markup segments: skipped elements, comments, tags (possibly unterminated)
+# and the text in between, including any < starting no tag
+SEGMENT_RE = re.compile(
+    r"<(script|style|noscript|svg)\b.*?</\1\s*>|<!--.*?(?:-->|$)"
+    r"|</?(?P<tag>[a-zA-Z][a-zA-Z0-9]*)[^>]*>?|<[!?][^>]*>?|(?P<text>[^<]+|<)",
+    re.IGNORECASE | re.DOTALL,
+)
+
+# the tags separating words, unlike the inline ones
+BREAKING_TAGS = frozenset(
+    (
+        "address",
+        "article",
+        "aside",
+        "blockquote",
+        "br",
+        "dd",
+        "div",
+        "dl",
+        "dt",
+        "figcaption",
+        "footer",
+        "h1",
+        "h2",
+        "h3",
+        "h4",
+        "h5",
+        "h6",
+        "header",
+        "hr",
+        "li",
+        "main",
+        "nav",
+        "ol",
+        "p",
+        "pre",
+        "section",
+        "table",
+        "td",
+        "th",
+        "tr",
+        "ul",
+    ),
+)
+SPACE_RE = re.compile(r"\s+")
+
+
+def strip_markup(raw_html: str, max_chars: int | None = None) -> str:
+    """
+    Return the text of raw_html with its whitespace collapsed, scanning it
+    only until max_chars characters of text are found.
+    """
+    parts = []
+    length = 0
+    for match in SEGMENT_RE.finditer(raw_html or ""):
+        if match.group("text") is None:
+            tag = match.group("tag")
+            if tag is None or tag.lower() in BREAKING_TAGS:
+                parts.append(" ")
+            continue
+        text = SPACE_RE.sub(" ", html.unescape(match.group("text")))
+        parts.append(text)
+        length += len(text)
+        if max_chars is not None and length >= max_chars:
+            break
+    text = SPACE_RE.sub(" ", "".join(parts)).strip()
+    return text if max_chars is None else text[:max_chars]
+
+
+def strip_markup_tail(raw_html: str, max_chars: int) -> str:
+    """Return the last max_chars characters of the text of raw_html."""
+    raw_html = raw_html or ""
+    window = 4 * max_chars
+    while True:
+        start = max(0, len(raw_html) - window)
+        # start at a tag, rather than in the middle of one
+        if start > 0:
+            start = raw_html.find("<", start)
+            if start < 0:
+                start = len(raw_html) - window
+        text = strip_markup(raw_html[start:])
+        if len(text) >= max_chars or window >= len(raw_html):
+            return text[-max_chars:]
+        window *= 2
+
+
+def prepare_text(
+    title: str | None,
+    content: str | None,
+    strategy: str = "head",
+    max_chars: int = 256 * CHARS_PER_TOKEN,
+    max_chunks: int = 4,
+) -> list[str]:
+    """
+    Return the inputs of the model for an article, each within max_chars
+    characters: its title and the beginning of its text with head, the
+    beginning and the end of the text with head_tail, or the text split in
+    up to max_chunks chunks, whose embeddings are to be averaged, with
+    chunks.
+    """
+    title = title or ""
+    if strategy == "chunks":
+        text = strip_markup(content, max_chars * max_chunks)
+        chunks = [
+            text[start : start + max_chars].strip()
+            for start in range(0, len(text), max_chars)
+        ]
+        return [f"{title} - {chunk}" for chunk in chunks] or [f"{title} - "]
+    text = strip_markup(content, max_chars)
+    if strategy == "head_tail" and len(text) >= max_chars:
+        tail = strip_markup_tail(content, max_chars // 2)
+        text = f"{text[: max_chars - len(tail)].rstrip()} … {tail}"
+    elif strategy not in STRATEGIES:
+        msg = f"Unknown text strategy {strategy}, expected one of {STRATEGIES}"
+        raise ValueError(msg)
+    return [f"{title} - {text}"]
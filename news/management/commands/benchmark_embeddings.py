@@ -0,0 +1,137 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.core.management.base import CommandParser
+
+from news.embedding_text import CHARS_PER_TOKEN
+from news.embedding_text import prepare_text
+from news.models import Articles
+from news.services import BACKENDS
+from news.services import BackendOptions
+from news.services import cosine_similarities
+from news.services import measure_backend
+
+logger = logging.getLogger(__name__)
+
+# the window of use-cmlm-multilingual, in tokens
+MAX_TOKENS = 256
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the throughput and peak memory of the inference backends of "
+        "the embedding model, and checks that their embeddings stay within a "
+        "cosine tolerance of those of the reference PyTorch model."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--articles",
+            type=int,
+            default=500,
+            help="Number of recent articles to embed (default: 500)",
+        )
+        parser.add_argument(
+            "--backends",
+            nargs="+",
+            choices=BACKENDS,
+            default=list(BACKENDS),
+            help="Backends to measure, the first one being the reference "
+            "(default: all)",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=settings.EMBEDDINGS_THREADS,
+            help="Threads running the operators of the model (default: "
+            "EMBEDDINGS_THREADS)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.EMBEDDINGS_ENCODE_BATCH_SIZE,
+            help="Sentences encoded at a time (default: EMBEDDINGS_ENCODE_BATCH_SIZE)",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.98,
+            help="Minimum cosine similarity of each embedding to the reference "
+            "(default: 0.98)",
+        )
+
+    def handle(self, *args, **options):
+        articles = Articles.objects.order_by("-id").values(
+            "title",
+            "title_original",
+            "content",
+            "content_original",
+            "language",
+        )[: options["articles"]]
+        # the inputs the jobs embed, with the head strategy and the window of
+        # the model
+        sentences = [
+            prepare_text(
+                *self._embedding_input(article),
+                max_chars=MAX_TOKENS * CHARS_PER_TOKEN,
+            )[0]
+            for article in articles
+        ]
+        if not sentences:
+            msg = "No articles to embed"
+            raise CommandError(msg)
+        logger.info(f"Embedding {len(sentences)} articles")
+
+        backend_options = BackendOptions(
+            threads=options["threads"],
+            batch_size=options["batch_size"],
+            model_dir=Path(settings.EMBEDDINGS_MODEL_DIR),
+            quantization=settings.EMBEDDINGS_QUANTIZATION,
+        )
+        reference = None
+        failed = []
+        for backend in options["backends"]:
+            # each backend in a fresh process, for its peak memory to be its own
+            with ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context("spawn"),
+            ) as executor:
+                seconds, peak_rss, embeddings = executor.submit(
+                    measure_backend,
+                    backend,
+                    sentences,
+                    backend_options,
+                ).result()
+            line = (
+                f"{backend}: {len(sentences) / seconds:.1f} sentences/s "
+                f"peak RSS: {peak_rss / 1024:.0f} MB"
+            )
+            if reference is None:
+                reference = embeddings
+            else:
+                similarities = cosine_similarities(embeddings, reference)
+                line += (
+                    f" cosine to {options['backends'][0]}: "
+                    f"min {similarities.min():.4f} mean {similarities.mean():.4f}"
+                )
+                if similarities.min() < options["tolerance"]:
+                    failed.append(backend)
+            self.stdout.write(line)
+
+        if failed:
+            msg = (
+                f"Embeddings of {', '.join(failed)} beyond the cosine tolerance "
+                f"of {options['tolerance']}"
+            )
+            raise CommandError(msg)
+
+    def _embedding_input(self, article):
+        """Pick the title and content the embeddings are computed from."""
+        if article["language"] == "it":
+            return article["title"], article["content"]
+        return article["title_original"], article["content_original"]
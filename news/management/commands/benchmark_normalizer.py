@@ -0,0 +1,63 @@
+import logging
+import statistics
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandParser
+
+from news.models import Articles
+from news.normalizer import normalize_content
+
+logger = logging.getLogger(__name__)
+
+CORPUS = Path(__file__).resolve().parents[2] / "tests" / "normalizer_corpus"
+
+
+class Command(BaseCommand):
+    help = "Measures the per-article cost of the HTML normalizer."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--articles",
+            type=int,
+            default=0,
+            help="Number of recent articles to normalize (default: 0, the test corpus)",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=20,
+            help="Times each article is normalized (default: 20)",
+        )
+
+    def handle(self, *args, **options):
+        documents = self._get_documents(options["articles"])
+        repeat = options["repeat"]
+        logger.info(f"Normalizing {len(documents)} articles {repeat} times")
+
+        timings = []
+        for content in documents:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                normalize_content(content, "https://www.example.com/")
+            timings.append((time.perf_counter() - start) / repeat * 1000)
+
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f"articles: {len(timings)} "
+            f"mean: {statistics.fmean(timings):.3f} ms "
+            f"median: {statistics.median(timings):.3f} ms "
+            f"p95: {p95:.3f} ms",
+        )
+
+    def _get_documents(self, count):
+        """Fetch the original content of the most recent articles."""
+        if count <= 0:
+            return [path.read_text() for path in sorted(CORPUS.glob("*.in.html"))]
+        return list(
+            Articles.objects.exclude(content_original__isnull=True)
+            .order_by("-id")
+            .values_list("content_original", flat=True)[:count],
+        )
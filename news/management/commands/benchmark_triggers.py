@@ -0,0 +1,149 @@
+import logging
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.core.management.base import CommandParser
+from django.db import connection
+from django.db import transaction
+
+from news.models import Feeds
+
+logger = logging.getLogger(__name__)
+
+# the row-level triggers replaced by migration 0019, to compare against
+ROW_TRIGGERS_SQL = [
+    "DROP TRIGGER update_articles_data_insert ON articles",
+    "DROP TRIGGER update_articles_data_update ON articles",
+    "DROP TRIGGER update_feeds_data_insert ON articles",
+    "DROP TRIGGER update_feeds_data_update ON articles",
+    "DROP TRIGGER update_feeds_data_delete ON articles",
+    "DROP TRIGGER tsvectorupdate ON articles",
+    """
+    CREATE FUNCTION uad() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO articles_data (id, length, excerpt)
+                VALUES (
+                    NEW.id,
+                    COALESCE(LENGTH(NEW.content), LENGTH(NEW.content_original)),
+                    SUBSTRING((CASE WHEN LENGTH(TRIM(NEW.content)) > 0
+                        THEN NEW.content
+                        ELSE NEW.content_original END) FOR 500)
+                )
+            ON CONFLICT (id) DO UPDATE
+                SET length = EXCLUDED.length, excerpt = EXCLUDED.excerpt;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql STRICT
+    """,
+    """
+    CREATE FUNCTION ufd() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                INSERT INTO feeds_data_dirty VALUES (OLD.feed_id)
+                    ON CONFLICT DO NOTHING;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'INSERT') THEN
+                INSERT INTO feeds_data_dirty VALUES (NEW.feed_id)
+                    ON CONFLICT DO NOTHING;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER tsvectorupdate BEFORE INSERT OR UPDATE ON articles
+        FOR EACH ROW EXECUTE FUNCTION articles_tsv_trigger()
+    """,
+    """
+    CREATE TRIGGER update_articles_data
+        AFTER INSERT OR UPDATE OF content, content_original ON articles
+        FOR EACH ROW EXECUTE FUNCTION uad()
+    """,
+    """
+    CREATE TRIGGER update_feeds_data
+        AFTER INSERT OR UPDATE OF feed_id, stamp OR DELETE ON articles
+        FOR EACH ROW EXECUTE FUNCTION ufd()
+    """,
+]
+
+INSERT_SQL = """
+    INSERT INTO articles (feed_id, url, title, content, language, stamp)
+    SELECT
+        %(feed_id)s,
+        %(prefix)s || i,
+        'Title ' || i,
+        REPEAT('<p>Lorem ipsum dolor sit amet.</p>', 20),
+        'it',
+        now() - i * interval '1 minute'
+    FROM generate_series(1, %(rows)s) AS i
+"""
+
+# a bulk update that touches neither the text nor the feed, as the embeddings
+UPDATE_SQL = """
+    UPDATE articles SET language = 'en' WHERE url LIKE %(prefix)s || '%%'
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the cost of bulk writes to articles with the row-level and the "
+        "statement-level triggers; all the changes are rolled back."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=10000,
+            help="Number of articles inserted by each statement (default: 10000)",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Times each measurement is repeated (default: 3)",
+        )
+
+    def handle(self, *args, **options):
+        feed_id = Feeds.objects.order_by("id").values_list("id", flat=True).first()
+        if feed_id is None:
+            msg = "There are no feeds to insert the articles into"
+            raise CommandError(msg)
+        rows = options["rows"]
+        logger.info(f"Writing {rows} articles {options['repeat']} times per mode")
+
+        for mode in ("row", "statement"):
+            timings: dict[str, list[float]] = {"insert": [], "update": []}
+            for _ in range(options["repeat"]):
+                for step, elapsed in self._measure(mode, feed_id, rows).items():
+                    timings[step].append(elapsed)
+            self.stdout.write(
+                f"{mode}-level triggers: "
+                + " ".join(
+                    f"{step}: {statistics.median(values):.1f} ms "
+                    f"({statistics.median(values) / rows * 1000:.1f} us/row)"
+                    for step, values in timings.items()
+                ),
+            )
+
+    def _measure(self, mode, feed_id, rows):
+        """Time a bulk insert and a bulk update of rows articles, then roll back."""
+        params = {
+            "feed_id": feed_id,
+            "prefix": f"https://benchmark.invalid/{uuid.uuid4()}/",
+            "rows": rows,
+        }
+        timings = {}
+        with transaction.atomic(), connection.cursor() as cursor:
+            if mode == "row":
+                for sql in ROW_TRIGGERS_SQL:
+                    cursor.execute(sql)
+            for step, sql in (("insert", INSERT_SQL), ("update", UPDATE_SQL)):
+                start = time.perf_counter()
+                cursor.execute(sql, params)
+                timings[step] = (time.perf_counter() - start) * 1000
+            transaction.set_rollback(True)
+        return timings
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandParser
+
+from news.embedder import EmbeddingPipeline
+from news.embedder import IngestEmbedder
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs an embedding worker until the backlog is empty; any number of "
+        "workers can run at once, on any node, each claiming its own articles. "
+        "With --follow, embeds the new articles as they are stored instead."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Articles claimed and embedded at a time "
+            "(default: EMBEDDINGS_BATCH_SIZE)",
+        )
+        parser.add_argument(
+            "--worker",
+            default=None,
+            help="Name of the worker in the claims and the logs (default: host:pid)",
+        )
+        parser.add_argument(
+            "--follow",
+            action="store_true",
+            help="Embed the articles queued at ingestion, until interrupted",
+        )
+
+    def handle(self, *args, **options):
+        if options["follow"]:
+            IngestEmbedder(batch_size=options["batch_size"]).run()
+            return
+        pipeline = EmbeddingPipeline(
+            batch_size=options["batch_size"],
+            worker=options["worker"],
+        )
+        embedded = pipeline.run()
+        self.stdout.write(f"{pipeline.worker} embedded {embedded} articles")
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandParser
+
+from news.embedding_server import serve
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the embedding server, holding the one copy of the model used by "
+        "the processes with EMBEDDING_SERVER_URL set."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--bind",
+            default=settings.EMBEDDING_SERVER_BIND,
+            help="Address to listen on, http://host:port or unix:/path "
+            "(default: EMBEDDING_SERVER_BIND)",
+        )
+
+    def handle(self, *args, **options):
+        serve(options["bind"])
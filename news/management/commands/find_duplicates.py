@@ -3,9 +3,8 @@ import logging
 
 from django.core.management.base import BaseCommand
 from django.core.management.base import CommandParser
-from pgvector.django import CosineDistance
 
-from news.models import Articles
+from news.models import ArticleEmbeddings
 
 logger = logging.getLogger(__name__)
 
@@ -50,27 +49,24 @@ class Command(BaseCommand):
         logger.info("Duplicate detection finished.")
 
     def _get_articles_to_process(self, min_id):
-        """Fetch articles with non-null embeddings and ID greater than min_id."""
-        return Articles.objects.filter(
-            use_cmlm_multilingual__isnull=False,
-            id__gt=min_id,
-        ).order_by("id")
+        """Fetch the embeddings of the articles with ID greater than min_id."""
+        return ArticleEmbeddings.objects.filter(
+            model=ArticleEmbeddings.USE_CMLM_MULTILINGUAL,
+            article_id__gt=min_id,
+        ).order_by("article_id")
 
     def _find_potential_duplicates(self, source_article, threshold):
         """Find articles similar to source_article based on embedding similarity."""
         return (
-            Articles.objects.filter(
-                use_cmlm_multilingual__isnull=False,
-                id__gt=source_article.id,
+            ArticleEmbeddings.objects.nearest(
+                source_article.embedding,
+                ArticleEmbeddings.USE_CMLM_MULTILINGUAL,
             )
-            .annotate(
-                distance=CosineDistance(
-                    "use_cmlm_multilingual",
-                    source_article.use_cmlm_multilingual,
-                ),
+            .filter(
+                article_id__gt=source_article.article_id,
+                distance__lt=threshold,
             )
-            .filter(distance__lt=threshold)
-            .order_by("id")
+            .order_by("article_id")
         )
 
     def _find_initial_duplicate_sets(self, articles_to_process, threshold):
@@ -83,11 +79,12 @@ class Command(BaseCommand):
         article_count = articles_to_process.count()
 
         for i, source_article in enumerate(articles_to_process):
-            if source_article.id in processed_article_ids:
+            if source_article.article_id in processed_article_ids:
                 continue  # Already part of a duplicate set
 
             logger.info(
-                f"Processing article {i+1}/{article_count}: ID {source_article.id}",
+                f"Processing article {i + 1}/{article_count}: "
+                f"ID {source_article.article_id}",
             )
 
             potential_duplicates = self._find_potential_duplicates(
@@ -112,7 +109,7 @@ class Command(BaseCommand):
                     duplicate_sets.append(current_duplicate_set)
 
                 # Add source article to processed_article_ids after its group is formed
-                processed_article_ids.add(source_article.id)
+                processed_article_ids.add(source_article.article_id)
 
         return duplicate_sets
 
@@ -124,15 +121,15 @@ class Command(BaseCommand):
         processed_article_ids,
     ):
         """Process found duplicate articles and create a new duplicate set."""
-        current_duplicate_set = {source_article.id}
+        current_duplicate_set = {source_article.article_id}
 
         for target_article in potential_duplicates:
             logger.info(
-                f"  Found duplicate: Article ID {target_article.id} "
+                f"  Found duplicate: Article ID {target_article.article_id} "
                 f"(Distance: {target_article.distance:.4f})",
             )
-            current_duplicate_set.add(target_article.id)
-            processed_article_ids.add(target_article.id)
+            current_duplicate_set.add(target_article.article_id)
+            processed_article_ids.add(target_article.article_id)
 
         return current_duplicate_set
 
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.11 on 2026-10-18 17:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0012_profile_mastodon_list_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedCache',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('etag', models.TextField(blank=True)),
+                ('last_modified', models.TextField(blank=True)),
+                ('content_hash', models.TextField(blank=True)),
+                ('stamp', models.DateTimeField(auto_now=True)),
+                ('feed', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='news.feeds')),
+            ],
+        ),
+    ]
@@ -0,0 +1,175 @@
+from django.db import migrations
+
+
+def merge_duplicates(apps, schema_editor):
+
+    with schema_editor.connection.cursor() as cursor:
+        # each duplicate article is merged into the oldest one with the same URL
+        cursor.execute("""
+                       CREATE TEMPORARY TABLE articles_duplicates ON COMMIT DROP AS
+                            SELECT id, keep
+                            FROM (
+                                SELECT id, MIN(id) OVER (PARTITION BY url) AS keep
+                                FROM articles
+                                WHERE url IS NOT NULL
+                            ) AS candidates
+                            WHERE id <> keep""")
+
+        # the first of the rows of a user for the duplicates moves to the kept
+        # article, unless the user has one already; the others are merged into it
+        cursor.execute("""
+                       UPDATE news_userarticles
+                            SET article_id = articles_duplicates.keep
+                            FROM articles_duplicates
+                            WHERE news_userarticles.article_id = articles_duplicates.id
+                                AND NOT EXISTS (
+                                    SELECT 1 FROM news_userarticles kept
+                                    WHERE kept.user_id = news_userarticles.user_id
+                                        AND kept.article_id = articles_duplicates.keep)
+                                AND news_userarticles.id = (
+                                    SELECT MIN(other.id)
+                                    FROM news_userarticles other
+                                    JOIN articles_duplicates other_duplicates ON other.article_id = other_duplicates.id
+                                    WHERE other.user_id = news_userarticles.user_id
+                                        AND other_duplicates.keep = articles_duplicates.keep)""")
+        cursor.execute("""
+                       UPDATE news_userarticles
+                            SET
+                                read = news_userarticles.read OR merged.read,
+                                rating = GREATEST(news_userarticles.rating, merged.rating),
+                                dismissed = news_userarticles.dismissed OR merged.dismissed,
+                                published = news_userarticles.published OR merged.published
+                            FROM (
+                                SELECT
+                                    user_id,
+                                    keep,
+                                    BOOL_OR(read) AS read,
+                                    MAX(rating) AS rating,
+                                    BOOL_OR(dismissed) AS dismissed,
+                                    BOOL_OR(published) AS published
+                                FROM news_userarticles
+                                JOIN articles_duplicates ON news_userarticles.article_id = articles_duplicates.id
+                                GROUP BY user_id, keep
+                            ) AS merged
+                            WHERE news_userarticles.user_id = merged.user_id
+                                AND news_userarticles.article_id = merged.keep""")
+        cursor.execute("""
+                       DELETE FROM news_userarticles
+                            USING articles_duplicates
+                            WHERE news_userarticles.article_id = articles_duplicates.id""")
+
+        # same for the views of the guests, one row per article
+        cursor.execute("""
+                       UPDATE news_guestarticles
+                            SET article_id = articles_duplicates.keep
+                            FROM articles_duplicates
+                            WHERE news_guestarticles.article_id = articles_duplicates.id
+                                AND NOT EXISTS (
+                                    SELECT 1 FROM news_guestarticles kept
+                                    WHERE kept.article_id = articles_duplicates.keep)
+                                AND news_guestarticles.id = (
+                                    SELECT MIN(other.id)
+                                    FROM news_guestarticles other
+                                    JOIN articles_duplicates other_duplicates ON other.article_id = other_duplicates.id
+                                    WHERE other_duplicates.keep = articles_duplicates.keep)""")
+        cursor.execute("""
+                       UPDATE news_guestarticles
+                            SET views = news_guestarticles.views + merged.views
+                            FROM (
+                                SELECT keep, SUM(views) AS views
+                                FROM news_guestarticles
+                                JOIN articles_duplicates ON news_guestarticles.article_id = articles_duplicates.id
+                                GROUP BY keep
+                            ) AS merged
+                            WHERE news_guestarticles.article_id = merged.keep""")
+        cursor.execute("""
+                       DELETE FROM news_guestarticles
+                            USING articles_duplicates
+                            WHERE news_guestarticles.article_id = articles_duplicates.id""")
+
+        # the lists keep the article once
+        cursor.execute("""
+                       UPDATE news_articlelists
+                            SET article_id = articles_duplicates.keep
+                            FROM articles_duplicates
+                            WHERE news_articlelists.article_id = articles_duplicates.id""")
+        cursor.execute("""
+                       DELETE FROM news_articlelists
+                            USING news_articlelists other
+                            WHERE news_articlelists.list_id = other.list_id
+                                AND news_articlelists.article_id = other.article_id
+                                AND news_articlelists.id > other.id
+                                AND news_articlelists.article_id IN (SELECT keep FROM articles_duplicates)""")
+
+        cursor.execute("""
+                       DELETE FROM articles_data
+                            USING articles_duplicates
+                            WHERE articles_data.id = articles_duplicates.id""")
+        cursor.execute("""
+                       DELETE FROM articles
+                            USING articles_duplicates
+                            WHERE articles.id = articles_duplicates.id""")
+
+        # the triggers do not fire on DELETE: refresh the statistics by hand
+        cursor.execute("""
+                       INSERT INTO articles_data
+                            SELECT articles_data_view.*
+                            FROM articles_data_view
+                            WHERE id IN (SELECT keep FROM articles_duplicates)
+                       ON CONFLICT (id) DO UPDATE
+                            SET
+                                views = EXCLUDED.views,
+                                rating = EXCLUDED.rating,
+                                to_reads = EXCLUDED.to_reads,
+                                length = EXCLUDED.length,
+                                excerpt = EXCLUDED.excerpt""")
+        cursor.execute("""
+                       INSERT INTO feeds_data
+                            SELECT feeds_data_view.*
+                            FROM feeds_data_view
+                            WHERE id IN (
+                                SELECT feed_id FROM articles
+                                WHERE id IN (SELECT keep FROM articles_duplicates))
+                       ON CONFLICT (id) DO UPDATE
+                            SET
+                                last_polled_epoch = EXCLUDED.last_polled_epoch,
+                                article_count = EXCLUDED.article_count,
+                                average_time_from_last_post = EXCLUDED.average_time_from_last_post""")
+
+
+def create_index(apps, schema_editor):
+
+    with schema_editor.connection.cursor() as cursor:
+        # a failed concurrent build (e.g. a duplicate stored meanwhile) leaves
+        # an invalid index behind, which IF NOT EXISTS would not replace
+        cursor.execute("""
+                       SELECT 1 FROM pg_index
+                            WHERE indexrelid = to_regclass('articles_url_key')
+                                AND NOT indisvalid""")
+        if cursor.fetchone():
+            cursor.execute("DROP INDEX CONCURRENTLY articles_url_key")
+        # required by INSERT ... ON CONFLICT (url) DO NOTHING in poller.store_articles;
+        # built without locking the writes to articles
+        cursor.execute("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS articles_url_key ON articles (url)")
+
+
+def drop_index(apps, schema_editor):
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP INDEX CONCURRENTLY IF EXISTS articles_url_key")
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('news', '0013_feedcache'),
+    ]
+
+    operations = [
+        # the merged duplicates cannot be split again
+        migrations.RunPython(merge_duplicates, reverse_code=migrations.RunPython.noop, atomic=True),
+        migrations.RunPython(create_index, reverse_code=drop_index),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.11 on 2026-10-18 18:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0014_articles_url_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedSchedule',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('next_poll', models.DateTimeField(db_index=True)),
+                ('interval', models.IntegerField()),
+                ('stamp', models.DateTimeField(auto_now=True)),
+                ('feed', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='news.feeds')),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.11 on 2026-10-18 19:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0015_feedschedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedBreaker',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('state', models.TextField(choices=[('closed', 'Closed'), ('open', 'Open'), ('half-open', 'Half-open')], default='closed')),
+                ('failures', models.IntegerField(default=0)),
+                ('last_status', models.IntegerField(default=0)),
+                ('reason', models.TextField(blank=True)),
+                ('opened_until', models.DateTimeField(blank=True, null=True)),
+                ('stamp', models.DateTimeField(auto_now=True)),
+                ('feed', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='news.feeds')),
+            ],
+        ),
+    ]
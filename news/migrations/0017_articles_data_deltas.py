@@ -0,0 +1,209 @@
+from django.db import migrations
+
+
+def create_delta_triggers(apps, schema_editor):
+
+    with schema_editor.connection.cursor() as cursor:
+        # running sums, so that the average rating can be updated in constant time
+        cursor.execute("ALTER TABLE articles_data ADD COLUMN rating_sum bigint NOT NULL DEFAULT 0")
+        cursor.execute("ALTER TABLE articles_data ADD COLUMN rating_count bigint NOT NULL DEFAULT 0")
+        cursor.execute("""
+                       UPDATE articles_data
+                            SET
+                                rating_sum = user_stats.rating_sum,
+                                rating_count = user_stats.rating_count
+                            FROM (
+                                SELECT
+                                    article_id,
+                                    SUM(rating) AS rating_sum,
+                                    COUNT(*) AS rating_count
+                                FROM news_userarticles
+                                GROUP BY article_id
+                            ) AS user_stats
+                            WHERE articles_data.id = user_stats.article_id""")
+
+        # length and excerpt only depend on the article itself
+        cursor.execute("DROP TRIGGER IF EXISTS update_articles_data ON articles")
+        cursor.execute("""
+                       CREATE OR REPLACE FUNCTION uad() RETURNS trigger AS $$
+                            BEGIN
+                                INSERT INTO articles_data (id, length, excerpt)
+                                    VALUES (
+                                        NEW.id,
+                                        COALESCE(LENGTH(NEW.content), LENGTH(NEW.content_original), 0),
+                                        SUBSTRING((CASE WHEN LENGTH(TRIM(NEW.content))>0 THEN NEW.content ELSE NEW.content_original END) FOR 500)
+                                    )
+                                ON CONFLICT (id) DO UPDATE
+                                    SET
+                                        length = EXCLUDED.length,
+                                        excerpt = EXCLUDED.excerpt;
+                                RETURN NEW;
+                            END;
+                            $$ LANGUAGE plpgsql STRICT""")
+        cursor.execute("CREATE TRIGGER update_articles_data AFTER INSERT OR UPDATE OF content, content_original ON articles FOR EACH ROW EXECUTE FUNCTION uad()")
+
+        # apply the given deltas to the data of an article
+        cursor.execute("""
+                       CREATE FUNCTION uad_delta(
+                            article_id bigint,
+                            d_views bigint,
+                            d_rating_sum bigint,
+                            d_rating_count bigint,
+                            d_to_reads bigint
+                       ) RETURNS void AS $$
+                            BEGIN
+                                IF d_views = 0 AND d_rating_sum = 0 AND d_rating_count = 0 AND d_to_reads = 0 THEN
+                                    RETURN;
+                                END IF;
+                                INSERT INTO articles_data (id, views, rating, to_reads, rating_sum, rating_count)
+                                    VALUES (
+                                        article_id,
+                                        d_views,
+                                        CASE WHEN d_rating_count > 0 THEN d_rating_sum::numeric / d_rating_count ELSE 0 END,
+                                        d_to_reads,
+                                        d_rating_sum,
+                                        d_rating_count
+                                    )
+                                ON CONFLICT (id) DO UPDATE
+                                    SET
+                                        views = articles_data.views + d_views,
+                                        rating = CASE
+                                            WHEN articles_data.rating_count + d_rating_count > 0
+                                            THEN (articles_data.rating_sum + d_rating_sum)::numeric / (articles_data.rating_count + d_rating_count)
+                                            ELSE 0
+                                        END,
+                                        to_reads = articles_data.to_reads + d_to_reads,
+                                        rating_sum = articles_data.rating_sum + d_rating_sum,
+                                        rating_count = articles_data.rating_count + d_rating_count;
+                            END;
+                            $$ LANGUAGE plpgsql""")
+
+        cursor.execute("DROP TRIGGER IF EXISTS update_articles_data2 ON news_userarticles")
+        cursor.execute("""
+                       CREATE FUNCTION uad_user() RETURNS trigger AS $$
+                            BEGIN
+                                IF TG_OP = 'UPDATE' AND OLD.article_id = NEW.article_id THEN
+                                    PERFORM uad_delta(
+                                        NEW.article_id,
+                                        NEW.read::integer - OLD.read::integer,
+                                        NEW.rating - OLD.rating,
+                                        0,
+                                        0
+                                    );
+                                    RETURN NULL;
+                                END IF;
+                                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                                    PERFORM uad_delta(OLD.article_id, -OLD.read::integer, -OLD.rating, -1, 0);
+                                END IF;
+                                IF TG_OP IN ('UPDATE', 'INSERT') THEN
+                                    PERFORM uad_delta(NEW.article_id, NEW.read::integer, NEW.rating, 1, 0);
+                                END IF;
+                                RETURN NULL;
+                            END;
+                            $$ LANGUAGE plpgsql""")
+        cursor.execute("CREATE TRIGGER update_articles_data_user AFTER INSERT OR UPDATE OR DELETE ON news_userarticles FOR EACH ROW EXECUTE FUNCTION uad_user()")
+
+        cursor.execute("DROP TRIGGER IF EXISTS update_articles_data3 ON news_guestarticles")
+        cursor.execute("""
+                       CREATE FUNCTION uad_guest() RETURNS trigger AS $$
+                            BEGIN
+                                IF TG_OP = 'UPDATE' AND OLD.article_id = NEW.article_id THEN
+                                    PERFORM uad_delta(NEW.article_id, NEW.views - OLD.views, 0, 0, 0);
+                                    RETURN NULL;
+                                END IF;
+                                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                                    PERFORM uad_delta(OLD.article_id, -OLD.views, 0, 0, 0);
+                                END IF;
+                                IF TG_OP IN ('UPDATE', 'INSERT') THEN
+                                    PERFORM uad_delta(NEW.article_id, NEW.views, 0, 0, 0);
+                                END IF;
+                                RETURN NULL;
+                            END;
+                            $$ LANGUAGE plpgsql""")
+        cursor.execute("CREATE TRIGGER update_articles_data_guest AFTER INSERT OR UPDATE OR DELETE ON news_guestarticles FOR EACH ROW EXECUTE FUNCTION uad_guest()")
+
+        # to_reads counts the memberships of the article in non-automatic lists
+        cursor.execute("""
+                       CREATE FUNCTION uad_list() RETURNS trigger AS $$
+                            BEGIN
+                                IF TG_OP IN ('UPDATE', 'DELETE') AND NOT COALESCE(
+                                    (SELECT automatic FROM news_userarticlelists WHERE id = OLD.list_id), TRUE
+                                ) THEN
+                                    PERFORM uad_delta(OLD.article_id, 0, 0, 0, -1);
+                                END IF;
+                                IF TG_OP IN ('UPDATE', 'INSERT') AND NOT COALESCE(
+                                    (SELECT automatic FROM news_userarticlelists WHERE id = NEW.list_id), TRUE
+                                ) THEN
+                                    PERFORM uad_delta(NEW.article_id, 0, 0, 0, 1);
+                                END IF;
+                                RETURN NULL;
+                            END;
+                            $$ LANGUAGE plpgsql""")
+        cursor.execute("CREATE TRIGGER update_articles_data_list AFTER INSERT OR UPDATE OR DELETE ON news_articlelists FOR EACH ROW EXECUTE FUNCTION uad_list()")
+
+        cursor.execute("""
+                       CREATE FUNCTION uad_user_list() RETURNS trigger AS $$
+                            BEGIN
+                                UPDATE articles_data
+                                    SET to_reads = articles_data.to_reads
+                                        + (CASE WHEN NEW.automatic THEN -1 ELSE 1 END) * memberships.count
+                                    FROM (
+                                        SELECT article_id, COUNT(*) AS count
+                                        FROM news_articlelists
+                                        WHERE list_id = NEW.id
+                                        GROUP BY article_id
+                                    ) AS memberships
+                                    WHERE articles_data.id = memberships.article_id;
+                                RETURN NULL;
+                            END;
+                            $$ LANGUAGE plpgsql""")
+        cursor.execute("CREATE TRIGGER update_articles_data_user_list AFTER UPDATE OF automatic ON news_userarticlelists FOR EACH ROW WHEN (OLD.automatic IS DISTINCT FROM NEW.automatic) EXECUTE FUNCTION uad_user_list()")
+
+
+def restore_view_triggers(apps, schema_editor):
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP TRIGGER IF EXISTS update_articles_data_user_list ON news_userarticlelists")
+        cursor.execute("DROP FUNCTION IF EXISTS uad_user_list")
+        cursor.execute("DROP TRIGGER IF EXISTS update_articles_data_list ON news_articlelists")
+        cursor.execute("DROP FUNCTION IF EXISTS uad_list")
+        cursor.execute("DROP TRIGGER IF EXISTS update_articles_data_guest ON news_guestarticles")
+        cursor.execute("DROP FUNCTION IF EXISTS uad_guest")
+        cursor.execute("DROP TRIGGER IF EXISTS update_articles_data_user ON news_userarticles")
+        cursor.execute("DROP FUNCTION IF EXISTS uad_user")
+        cursor.execute("DROP FUNCTION IF EXISTS uad_delta")
+
+        cursor.execute("DROP TRIGGER IF EXISTS update_articles_data ON articles")
+        cursor.execute("""
+                       CREATE OR REPLACE FUNCTION uad() RETURNS trigger AS $$
+                            BEGIN
+                                INSERT INTO articles_data
+                                    SELECT articles_data_view.*
+                                    FROM articles_data_view
+                                    WHERE id = NEW.id
+                                ON CONFLICT (id) DO UPDATE
+                                    SET
+                                        views = EXCLUDED.views,
+                                        rating = EXCLUDED.rating,
+                                        to_reads = EXCLUDED.to_reads,
+                                        length = EXCLUDED.length,
+                                        excerpt = EXCLUDED.excerpt;
+                                RETURN NEW;
+                            END;
+                            $$ LANGUAGE plpgsql STRICT""")
+        cursor.execute("ALTER TABLE articles_data DROP COLUMN rating_sum")
+        cursor.execute("ALTER TABLE articles_data DROP COLUMN rating_count")
+        cursor.execute("CREATE TRIGGER update_articles_data AFTER INSERT OR UPDATE ON articles FOR EACH ROW EXECUTE FUNCTION uad()")
+        cursor.execute("CREATE TRIGGER update_articles_data2 AFTER INSERT OR UPDATE ON news_userarticles FOR EACH ROW EXECUTE FUNCTION uad2()")
+        cursor.execute("CREATE TRIGGER update_articles_data3 AFTER INSERT OR UPDATE ON news_guestarticles FOR EACH ROW EXECUTE FUNCTION uad2()")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0016_feedbreaker'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_delta_triggers, reverse_code=restore_view_triggers),
+    ]
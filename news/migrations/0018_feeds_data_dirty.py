@@ -0,0 +1,101 @@
+from django.db import migrations
+
+
+def create_dirty_queue(apps, schema_editor):
+
+    with schema_editor.connection.cursor() as cursor:
+        # feeds whose article statistics are stale, refreshed once per poll batch
+        cursor.execute("CREATE TABLE feeds_data_dirty (feed_id integer PRIMARY KEY)")
+
+        cursor.execute("DROP TRIGGER IF EXISTS update_feeds_data ON articles")
+        cursor.execute("""
+                       CREATE OR REPLACE FUNCTION ufd() RETURNS trigger AS $$
+                            BEGIN
+                                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                                    INSERT INTO feeds_data_dirty VALUES (OLD.feed_id)
+                                        ON CONFLICT DO NOTHING;
+                                END IF;
+                                IF TG_OP IN ('UPDATE', 'INSERT') THEN
+                                    INSERT INTO feeds_data_dirty VALUES (NEW.feed_id)
+                                        ON CONFLICT DO NOTHING;
+                                END IF;
+                                RETURN NULL;
+                            END;
+                            $$ LANGUAGE plpgsql""")
+        cursor.execute("CREATE TRIGGER update_feeds_data AFTER INSERT OR UPDATE OF feed_id, stamp OR DELETE ON articles FOR EACH ROW EXECUTE FUNCTION ufd()")
+
+        # the time of the last poll is copied as is, the counters are left alone
+        cursor.execute("DROP TRIGGER IF EXISTS update_feeds_data ON feeds")
+        cursor.execute("""
+                       CREATE OR REPLACE FUNCTION ufd2() RETURNS trigger AS $$
+                            BEGIN
+                                INSERT INTO feeds_data (id, last_polled_epoch, article_count)
+                                    VALUES (NEW.id, date_part('epoch', NEW.last_polled), 0)
+                                ON CONFLICT (id) DO UPDATE
+                                    SET last_polled_epoch = EXCLUDED.last_polled_epoch;
+                                RETURN NULL;
+                            END;
+                            $$ LANGUAGE plpgsql""")
+        cursor.execute("CREATE TRIGGER update_feeds_data AFTER INSERT OR UPDATE OF last_polled ON feeds FOR EACH ROW EXECUTE FUNCTION ufd2()")
+
+
+def restore_view_triggers(apps, schema_editor):
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP TRIGGER IF EXISTS update_feeds_data ON articles")
+        cursor.execute("DROP TRIGGER IF EXISTS update_feeds_data ON feeds")
+        cursor.execute("""
+                       CREATE OR REPLACE FUNCTION ufd() RETURNS trigger AS $$
+                            BEGIN
+                                INSERT INTO feeds_data
+                                    SELECT feeds_data_view.*
+                                    FROM feeds_data_view
+                                    WHERE id = NEW.feed_id
+                                ON CONFLICT (id) DO UPDATE
+                                SET
+                                    last_polled_epoch = EXCLUDED.last_polled_epoch,
+                                    article_count = EXCLUDED.article_count,
+                                    average_time_from_last_post = EXCLUDED.average_time_from_last_post;
+                                RETURN NEW;
+                            END;
+                            $$ LANGUAGE plpgsql STRICT""")
+        cursor.execute("""
+                       CREATE OR REPLACE FUNCTION ufd2() RETURNS trigger AS $$
+                            BEGIN
+                                INSERT INTO feeds_data
+                                    SELECT feeds_data_view.*
+                                    FROM feeds_data_view
+                                    WHERE id = NEW.id
+                                ON CONFLICT (id) DO UPDATE
+                                SET
+                                    last_polled_epoch = EXCLUDED.last_polled_epoch,
+                                    article_count = EXCLUDED.article_count,
+                                    average_time_from_last_post = EXCLUDED.average_time_from_last_post;
+                                RETURN NEW;
+                            END;
+                            $$ LANGUAGE plpgsql STRICT""")
+        cursor.execute("CREATE TRIGGER update_feeds_data AFTER INSERT OR UPDATE ON articles FOR EACH ROW EXECUTE FUNCTION ufd()")
+        cursor.execute("CREATE TRIGGER update_feeds_data AFTER INSERT OR UPDATE ON feeds FOR EACH ROW EXECUTE FUNCTION ufd2()")
+        # catch up with the feeds left dirty
+        cursor.execute("""
+                       INSERT INTO feeds_data
+                            SELECT feeds_data_view.*
+                            FROM feeds_data_view
+                            WHERE id IN (SELECT feed_id FROM feeds_data_dirty)
+                       ON CONFLICT (id) DO UPDATE
+                            SET
+                                last_polled_epoch = EXCLUDED.last_polled_epoch,
+                                article_count = EXCLUDED.article_count,
+                                average_time_from_last_post = EXCLUDED.average_time_from_last_post""")
+        cursor.execute("DROP TABLE feeds_data_dirty")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0017_articles_data_deltas'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_dirty_queue, reverse_code=restore_view_triggers),
+    ]
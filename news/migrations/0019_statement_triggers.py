@@ -0,0 +1,157 @@
+from django.db import migrations
+
+
+def create_statement_triggers(apps, schema_editor):
+
+    with schema_editor.connection.cursor() as cursor:
+        # the text search vector only depends on the title and the content, so
+        # that updating the embeddings or the other columns does not recompute it
+        cursor.execute("DROP TRIGGER IF EXISTS tsvectorupdate ON articles")
+        cursor.execute("CREATE TRIGGER tsvectorupdate BEFORE INSERT OR UPDATE OF title, title_original, content, content_original ON articles FOR EACH ROW EXECUTE FUNCTION articles_tsv_trigger()")
+
+        # length and excerpt of the articles written by the statement, in one go
+        cursor.execute("DROP TRIGGER IF EXISTS update_articles_data ON articles")
+        cursor.execute("DROP FUNCTION IF EXISTS uad")
+        cursor.execute("""
+                       CREATE FUNCTION uad_inserted() RETURNS trigger AS $$
+                            BEGIN
+                                INSERT INTO articles_data (id, length, excerpt)
+                                    SELECT
+                                        id,
+                                        COALESCE(LENGTH(content), LENGTH(content_original), 0),
+                                        SUBSTRING((CASE WHEN LENGTH(TRIM(content))>0 THEN content ELSE content_original END) FOR 500)
+                                    FROM new_articles
+                                ON CONFLICT (id) DO UPDATE
+                                    SET
+                                        length = EXCLUDED.length,
+                                        excerpt = EXCLUDED.excerpt;
+                                RETURN NULL;
+                            END;
+                            $$ LANGUAGE plpgsql""")
+        cursor.execute("CREATE TRIGGER update_articles_data_insert AFTER INSERT ON articles REFERENCING NEW TABLE AS new_articles FOR EACH STATEMENT EXECUTE FUNCTION uad_inserted()")
+        # transition tables cannot be combined with a column list, so the
+        # articles whose content did not change are skipped with a join
+        cursor.execute("""
+                       CREATE FUNCTION uad_updated() RETURNS trigger AS $$
+                            BEGIN
+                                INSERT INTO articles_data (id, length, excerpt)
+                                    SELECT
+                                        new_articles.id,
+                                        COALESCE(LENGTH(new_articles.content), LENGTH(new_articles.content_original), 0),
+                                        SUBSTRING((CASE WHEN LENGTH(TRIM(new_articles.content))>0 THEN new_articles.content ELSE new_articles.content_original END) FOR 500)
+                                    FROM new_articles
+                                    JOIN old_articles ON old_articles.id = new_articles.id
+                                    WHERE (new_articles.content, new_articles.content_original)
+                                        IS DISTINCT FROM (old_articles.content, old_articles.content_original)
+                                ON CONFLICT (id) DO UPDATE
+                                    SET
+                                        length = EXCLUDED.length,
+                                        excerpt = EXCLUDED.excerpt;
+                                RETURN NULL;
+                            END;
+                            $$ LANGUAGE plpgsql""")
+        cursor.execute("CREATE TRIGGER update_articles_data_update AFTER UPDATE ON articles REFERENCING OLD TABLE AS old_articles NEW TABLE AS new_articles FOR EACH STATEMENT EXECUTE FUNCTION uad_updated()")
+
+        # queue the feeds of the articles written by the statement, in one go
+        cursor.execute("DROP TRIGGER IF EXISTS update_feeds_data ON articles")
+        cursor.execute("DROP FUNCTION IF EXISTS ufd")
+        cursor.execute("""
+                       CREATE FUNCTION ufd_inserted() RETURNS trigger AS $$
+                            BEGIN
+                                INSERT INTO feeds_data_dirty
+                                    SELECT DISTINCT feed_id FROM new_articles WHERE feed_id IS NOT NULL
+                                ON CONFLICT DO NOTHING;
+                                RETURN NULL;
+                            END;
+                            $$ LANGUAGE plpgsql""")
+        cursor.execute("CREATE TRIGGER update_feeds_data_insert AFTER INSERT ON articles REFERENCING NEW TABLE AS new_articles FOR EACH STATEMENT EXECUTE FUNCTION ufd_inserted()")
+        cursor.execute("""
+                       CREATE FUNCTION ufd_updated() RETURNS trigger AS $$
+                            BEGIN
+                                INSERT INTO feeds_data_dirty
+                                    SELECT feed_id FROM (
+                                        SELECT UNNEST(ARRAY[old_articles.feed_id, new_articles.feed_id]) AS feed_id
+                                        FROM new_articles
+                                        JOIN old_articles ON old_articles.id = new_articles.id
+                                        WHERE (new_articles.feed_id, new_articles.stamp)
+                                            IS DISTINCT FROM (old_articles.feed_id, old_articles.stamp)
+                                    ) AS changed
+                                    WHERE feed_id IS NOT NULL
+                                    GROUP BY feed_id
+                                ON CONFLICT DO NOTHING;
+                                RETURN NULL;
+                            END;
+                            $$ LANGUAGE plpgsql""")
+        cursor.execute("CREATE TRIGGER update_feeds_data_update AFTER UPDATE ON articles REFERENCING OLD TABLE AS old_articles NEW TABLE AS new_articles FOR EACH STATEMENT EXECUTE FUNCTION ufd_updated()")
+        cursor.execute("""
+                       CREATE FUNCTION ufd_deleted() RETURNS trigger AS $$
+                            BEGIN
+                                INSERT INTO feeds_data_dirty
+                                    SELECT DISTINCT feed_id FROM old_articles WHERE feed_id IS NOT NULL
+                                ON CONFLICT DO NOTHING;
+                                RETURN NULL;
+                            END;
+                            $$ LANGUAGE plpgsql""")
+        cursor.execute("CREATE TRIGGER update_feeds_data_delete AFTER DELETE ON articles REFERENCING OLD TABLE AS old_articles FOR EACH STATEMENT EXECUTE FUNCTION ufd_deleted()")
+
+
+def restore_row_triggers(apps, schema_editor):
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP TRIGGER IF EXISTS update_feeds_data_delete ON articles")
+        cursor.execute("DROP TRIGGER IF EXISTS update_feeds_data_update ON articles")
+        cursor.execute("DROP TRIGGER IF EXISTS update_feeds_data_insert ON articles")
+        cursor.execute("DROP FUNCTION IF EXISTS ufd_deleted")
+        cursor.execute("DROP FUNCTION IF EXISTS ufd_updated")
+        cursor.execute("DROP FUNCTION IF EXISTS ufd_inserted")
+        cursor.execute("""
+                       CREATE OR REPLACE FUNCTION ufd() RETURNS trigger AS $$
+                            BEGIN
+                                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                                    INSERT INTO feeds_data_dirty VALUES (OLD.feed_id)
+                                        ON CONFLICT DO NOTHING;
+                                END IF;
+                                IF TG_OP IN ('UPDATE', 'INSERT') THEN
+                                    INSERT INTO feeds_data_dirty VALUES (NEW.feed_id)
+                                        ON CONFLICT DO NOTHING;
+                                END IF;
+                                RETURN NULL;
+                            END;
+                            $$ LANGUAGE plpgsql""")
+        cursor.execute("CREATE TRIGGER update_feeds_data AFTER INSERT OR UPDATE OF feed_id, stamp OR DELETE ON articles FOR EACH ROW EXECUTE FUNCTION ufd()")
+
+        cursor.execute("DROP TRIGGER IF EXISTS update_articles_data_update ON articles")
+        cursor.execute("DROP TRIGGER IF EXISTS update_articles_data_insert ON articles")
+        cursor.execute("DROP FUNCTION IF EXISTS uad_updated")
+        cursor.execute("DROP FUNCTION IF EXISTS uad_inserted")
+        cursor.execute("""
+                       CREATE OR REPLACE FUNCTION uad() RETURNS trigger AS $$
+                            BEGIN
+                                INSERT INTO articles_data (id, length, excerpt)
+                                    VALUES (
+                                        NEW.id,
+                                        COALESCE(LENGTH(NEW.content), LENGTH(NEW.content_original), 0),
+                                        SUBSTRING((CASE WHEN LENGTH(TRIM(NEW.content))>0 THEN NEW.content ELSE NEW.content_original END) FOR 500)
+                                    )
+                                ON CONFLICT (id) DO UPDATE
+                                    SET
+                                        length = EXCLUDED.length,
+                                        excerpt = EXCLUDED.excerpt;
+                                RETURN NEW;
+                            END;
+                            $$ LANGUAGE plpgsql STRICT""")
+        cursor.execute("CREATE TRIGGER update_articles_data AFTER INSERT OR UPDATE OF content, content_original ON articles FOR EACH ROW EXECUTE FUNCTION uad()")
+
+        cursor.execute("DROP TRIGGER IF EXISTS tsvectorupdate ON articles")
+        cursor.execute("CREATE TRIGGER tsvectorupdate BEFORE INSERT OR UPDATE ON articles FOR EACH ROW EXECUTE FUNCTION articles_tsv_trigger()")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0018_feeds_data_dirty'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_statement_triggers, reverse_code=restore_row_triggers),
+    ]
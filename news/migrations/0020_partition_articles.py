@@ -0,0 +1,245 @@
+import datetime
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# the views reading from articles, in dependency order
+VIEWS = [
+    "articlelists_count_view",
+    "articles_data_view",
+    "feeds_data_view",
+    "articles_combined",
+]
+
+# months of articles moved to their own partition, the older ones are archived
+RECENT_MONTHS = 12
+
+
+def save_views(cursor):
+    definitions = {}
+    for view in VIEWS:
+        cursor.execute("SELECT pg_get_viewdef(to_regclass(%s))", [view])
+        definition = cursor.fetchone()[0]
+        if definition is not None:
+            definitions[view] = definition
+    for view in reversed(VIEWS):
+        cursor.execute(f"DROP VIEW IF EXISTS {view}")
+    return definitions
+
+
+def restore_views(cursor, definitions):
+    for view in VIEWS:
+        if view in definitions:
+            # the other columns of articles only depend on its primary key,
+            # which includes stamp once partitioned
+            definition = re.sub(
+                r"GROUP BY articles\.id\b(?!, articles\.stamp)",
+                "GROUP BY articles.id, articles.stamp",
+                definitions[view],
+            )
+            cursor.execute(f"CREATE VIEW {view} AS {definition}")
+    cursor.execute("CREATE TRIGGER articles_combined_update INSTEAD OF UPDATE ON articles_combined FOR EACH ROW EXECUTE FUNCTION acu()")
+
+
+def create_triggers(cursor):
+    cursor.execute("CREATE TRIGGER tsvectorupdate BEFORE INSERT OR UPDATE OF title, title_original, content, content_original ON articles FOR EACH ROW EXECUTE FUNCTION articles_tsv_trigger()")
+    cursor.execute("CREATE TRIGGER update_articles_data_insert AFTER INSERT ON articles REFERENCING NEW TABLE AS new_articles FOR EACH STATEMENT EXECUTE FUNCTION uad_inserted()")
+    cursor.execute("CREATE TRIGGER update_articles_data_update AFTER UPDATE ON articles REFERENCING OLD TABLE AS old_articles NEW TABLE AS new_articles FOR EACH STATEMENT EXECUTE FUNCTION uad_updated()")
+    cursor.execute("CREATE TRIGGER update_feeds_data_insert AFTER INSERT ON articles REFERENCING NEW TABLE AS new_articles FOR EACH STATEMENT EXECUTE FUNCTION ufd_inserted()")
+    cursor.execute("CREATE TRIGGER update_feeds_data_update AFTER UPDATE ON articles REFERENCING OLD TABLE AS old_articles NEW TABLE AS new_articles FOR EACH STATEMENT EXECUTE FUNCTION ufd_updated()")
+    cursor.execute("CREATE TRIGGER update_feeds_data_delete AFTER DELETE ON articles REFERENCING OLD TABLE AS old_articles FOR EACH STATEMENT EXECUTE FUNCTION ufd_deleted()")
+
+
+def grant_no_triggers(cursor):
+    cursor.execute("SELECT 1 FROM pg_roles WHERE rolname = 'no_triggers'")
+    if cursor.fetchone():
+        cursor.execute("GRANT SELECT, UPDATE ON articles TO no_triggers")
+
+
+def partition_articles(apps, schema_editor):
+
+    with schema_editor.connection.cursor() as cursor:
+        definitions = save_views(cursor)
+
+        # the primary key of a partitioned table has to include the partition key
+        cursor.execute("""
+                       CREATE TABLE articles_partitioned (
+                            LIKE articles INCLUDING DEFAULTS,
+                            PRIMARY KEY (id, stamp),
+                            FOREIGN KEY (feed_id) REFERENCES feeds (id)
+                       ) PARTITION BY RANGE (stamp)""")
+        cursor.execute("ALTER TABLE articles RENAME TO articles_unpartitioned")
+        cursor.execute("ALTER TABLE articles_partitioned RENAME TO articles")
+
+        # nor can a unique index on url span the partitions: the URLs are
+        # registered in a table of their own by the triggers on articles
+        cursor.execute("CREATE TABLE articles_urls (url text PRIMARY KEY, id bigint NOT NULL)")
+        cursor.execute("""
+                       CREATE FUNCTION articles_claim_url() RETURNS trigger AS $$
+                            BEGIN
+                                IF TG_OP = 'UPDATE' THEN
+                                    DELETE FROM articles_urls WHERE url = OLD.url AND id = OLD.id;
+                                END IF;
+                                IF NEW.url IS NOT NULL THEN
+                                    INSERT INTO articles_urls (url, id) VALUES (NEW.url, NEW.id)
+                                        ON CONFLICT (url) DO NOTHING;
+                                    -- the article may be moving to another partition
+                                    IF NOT FOUND AND NOT EXISTS (
+                                        SELECT 1 FROM articles_urls WHERE url = NEW.url AND id = NEW.id
+                                    ) THEN
+                                        RAISE unique_violation USING
+                                            MESSAGE = format('duplicate article url: %s', NEW.url),
+                                            CONSTRAINT = 'articles_urls_pkey';
+                                    END IF;
+                                END IF;
+                                RETURN NEW;
+                            END;
+                            $$ LANGUAGE plpgsql""")
+        cursor.execute("""
+                       CREATE FUNCTION articles_release_urls() RETURNS trigger AS $$
+                            BEGIN
+                                DELETE FROM articles_urls
+                                    USING old_articles
+                                    WHERE articles_urls.url = old_articles.url
+                                        AND articles_urls.id = old_articles.id;
+                                RETURN NULL;
+                            END;
+                            $$ LANGUAGE plpgsql""")
+
+        # one partition per month, with its own HNSW index; the articles
+        # stored before the partition of their month exists are moved there
+        # from the default partition
+        cursor.execute("""
+                       CREATE FUNCTION articles_create_partition(month date) RETURNS text AS $$
+                            DECLARE
+                                lower_bound timestamptz := date_trunc('month', month::timestamp) AT TIME ZONE 'UTC';
+                                upper_bound timestamptz := (date_trunc('month', month::timestamp) + interval '1 month') AT TIME ZONE 'UTC';
+                                partition_name text := 'articles_p' || to_char(month, 'YYYY_MM');
+                            BEGIN
+                                IF to_regclass(partition_name) IS NOT NULL THEN
+                                    RETURN partition_name;
+                                END IF;
+                                EXECUTE format('CREATE TABLE %I (LIKE articles INCLUDING DEFAULTS)', partition_name);
+                                EXECUTE format(
+                                    'WITH moved AS (DELETE FROM articles_default WHERE stamp >= %L AND stamp < %L RETURNING *) '
+                                    'INSERT INTO %I SELECT * FROM moved',
+                                    lower_bound, upper_bound, partition_name);
+                                EXECUTE format(
+                                    'ALTER TABLE articles ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                                    partition_name, lower_bound, upper_bound);
+                                EXECUTE format(
+                                    'CREATE INDEX %I ON %I USING hnsw (use_cmlm_multilingual halfvec_cosine_ops) WITH (m = 24, ef_construction = 200)',
+                                    partition_name || '_use_cmlm_multilingual_idx', partition_name);
+                                RETURN partition_name;
+                            END;
+                            $$ LANGUAGE plpgsql""")
+
+        # a detached partition keeps its articles, and their data is moved
+        # next to them, so that it can be archived or attached back
+        cursor.execute("""
+                       CREATE FUNCTION articles_detach_partition(partition_name text) RETURNS void AS $$
+                            BEGIN
+                                EXECUTE format('ALTER TABLE articles DETACH PARTITION %I', partition_name);
+                                EXECUTE format('CREATE TABLE %I (LIKE articles_data INCLUDING ALL)', partition_name || '_data');
+                                EXECUTE format(
+                                    'WITH moved AS (DELETE FROM articles_data WHERE id IN (SELECT id FROM %I) RETURNING *) '
+                                    'INSERT INTO %I SELECT * FROM moved',
+                                    partition_name, partition_name || '_data');
+                                EXECUTE format(
+                                    'INSERT INTO feeds_data_dirty SELECT DISTINCT feed_id FROM %I WHERE feed_id IS NOT NULL '
+                                    'ON CONFLICT DO NOTHING',
+                                    partition_name);
+                            END;
+                            $$ LANGUAGE plpgsql""")
+
+        cursor.execute("SELECT (date_trunc('month', now() AT TIME ZONE 'UTC') - interval '%s months')::date" % RECENT_MONTHS)
+        first_month = cursor.fetchone()[0]
+        cursor.execute(
+            "CREATE TABLE articles_archive PARTITION OF articles FOR VALUES FROM (MINVALUE) TO (%s)",
+            [datetime.datetime.combine(first_month, datetime.time(), tzinfo=datetime.UTC)],
+        )
+        cursor.execute("CREATE TABLE articles_default PARTITION OF articles DEFAULT")
+        # the partitions of the recent months are there before the articles
+        # are copied, so that each article is written once, to its own
+        cursor.execute("""
+                       SELECT articles_create_partition(month::date)
+                       FROM generate_series(
+                            %s::date,
+                            (date_trunc('month', now() AT TIME ZONE 'UTC') + interval '1 month')::date,
+                            interval '1 month'
+                       ) AS month""", [first_month])
+
+        cursor.execute("INSERT INTO articles SELECT * FROM articles_unpartitioned")
+        cursor.execute("INSERT INTO articles_urls SELECT url, id FROM articles_unpartitioned WHERE url IS NOT NULL")
+        # dropping the old table frees the names of its indexes
+        cursor.execute("DROP TABLE articles_unpartitioned")
+        cursor.execute("CREATE INDEX articles_url_idx ON articles (url)")
+        cursor.execute("CREATE INDEX articles_tsv_idx ON articles USING GIN (tsv)")
+        cursor.execute("CREATE SEQUENCE articles_id_seq OWNED BY articles.id")
+        cursor.execute("SELECT setval('articles_id_seq', COALESCE(MAX(id), 0) + 1, false) FROM articles")
+        cursor.execute("ALTER TABLE articles ALTER COLUMN id SET DEFAULT nextval('articles_id_seq')")
+
+        create_triggers(cursor)
+        cursor.execute("CREATE TRIGGER articles_url_insert BEFORE INSERT ON articles FOR EACH ROW EXECUTE FUNCTION articles_claim_url()")
+        cursor.execute("CREATE TRIGGER articles_url_update BEFORE UPDATE OF url ON articles FOR EACH ROW WHEN (OLD.url IS DISTINCT FROM NEW.url) EXECUTE FUNCTION articles_claim_url()")
+        cursor.execute("CREATE TRIGGER articles_url_delete AFTER DELETE ON articles REFERENCING OLD TABLE AS old_articles FOR EACH STATEMENT EXECUTE FUNCTION articles_release_urls()")
+        restore_views(cursor, definitions)
+        grant_no_triggers(cursor)
+
+
+def unpartition_articles(apps, schema_editor):
+
+    with schema_editor.connection.cursor() as cursor:
+        definitions = save_views(cursor)
+
+        cursor.execute("CREATE TABLE articles_unpartitioned (LIKE articles)")
+        cursor.execute("INSERT INTO articles_unpartitioned SELECT * FROM articles")
+        cursor.execute("DROP TABLE articles")
+        cursor.execute("DROP FUNCTION IF EXISTS articles_detach_partition")
+        cursor.execute("DROP FUNCTION IF EXISTS articles_create_partition")
+        cursor.execute("DROP FUNCTION IF EXISTS articles_release_urls")
+        cursor.execute("DROP FUNCTION IF EXISTS articles_claim_url")
+        cursor.execute("DROP TABLE IF EXISTS articles_urls")
+        cursor.execute("ALTER TABLE articles_unpartitioned RENAME TO articles")
+
+        cursor.execute("ALTER TABLE articles ALTER COLUMN stamp SET DEFAULT now()")
+        cursor.execute("ALTER TABLE articles ALTER COLUMN id ADD GENERATED ALWAYS AS IDENTITY")
+        cursor.execute("SELECT setval(pg_get_serial_sequence('articles', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM articles")
+        cursor.execute("ALTER TABLE articles ADD PRIMARY KEY (id)")
+        cursor.execute("ALTER TABLE articles ADD FOREIGN KEY (feed_id) REFERENCES feeds (id)")
+        cursor.execute("CREATE UNIQUE INDEX articles_url_key ON articles (url)")
+        cursor.execute("CREATE INDEX articles_tsv_idx ON articles USING GIN (tsv)")
+        cursor.execute("CREATE INDEX ON articles USING hnsw (use_cmlm_multilingual halfvec_cosine_ops) WITH (m = 24, ef_construction = 200)")
+
+        create_triggers(cursor)
+        restore_views(cursor, definitions)
+        grant_no_triggers(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0019_statement_triggers'),
+    ]
+
+    # foreign keys cannot reference articles(id) once partitioned, the
+    # cascades are left to the ORM
+    operations = [
+        migrations.AlterField(
+            model_name='articlelists',
+            name='article',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='news.articles'),
+        ),
+        migrations.AlterField(
+            model_name='userarticles',
+            name='article',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='news.articles'),
+        ),
+        migrations.AlterField(
+            model_name='guestarticles',
+            name='article',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='news.articles'),
+        ),
+        migrations.RunPython(partition_articles, reverse_code=unpartition_articles),
+    ]
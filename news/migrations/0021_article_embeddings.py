@@ -0,0 +1,222 @@
+import django.db.models.deletion
+import pgvector.django
+from django.db import migrations, models
+
+MODELS = [
+    "use_cmlm_multilingual",
+    "paraphrase_multilingual_mpnet_base_v2",
+]
+
+# the columns of articles, with no embeddings
+ARTICLES_COLUMNS = [
+    "id",
+    "stamp",
+    "author",
+    "title_original",
+    "title",
+    "content_original",
+    "content",
+    "language",
+    "url",
+    "feed_id",
+    "tsv",
+]
+
+
+def create_articles_combined(cursor, columns):
+    cursor.execute("DROP VIEW IF EXISTS articles_combined")
+    cursor.execute(f"""
+                   CREATE VIEW articles_combined AS (
+                        SELECT
+                            {', '.join(f'articles.{column}' for column in columns)},
+                            articles_data.views,
+                            articles_data.rating,
+                            articles_data.to_reads,
+                            articles_data.length,
+                            articles_data.excerpt
+                        FROM
+                            articles
+                            JOIN articles_data ON articles.id = articles_data.id
+                        )""")
+    cursor.execute("CREATE TRIGGER articles_combined_update INSTEAD OF UPDATE ON articles_combined FOR EACH ROW EXECUTE FUNCTION acu()")
+
+
+def create_partition_function(cursor, embeddings):
+    # with embeddings, each monthly partition of articles comes with one of
+    # article_embeddings for the same month, the HNSW index being that of
+    # article_embeddings; without, with an HNSW index of its own
+    if embeddings:
+        steps = """EXECUTE format('CREATE TABLE %I (LIKE article_embeddings INCLUDING DEFAULTS)', partition_name || '_embeddings');
+                            EXECUTE format(
+                                'WITH moved AS (DELETE FROM articles_default_embeddings WHERE stamp >= %L AND stamp < %L RETURNING *) '
+                                'INSERT INTO %I SELECT * FROM moved',
+                                lower_bound, upper_bound, partition_name || '_embeddings');
+                            EXECUTE format(
+                                'ALTER TABLE article_embeddings ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                                partition_name || '_embeddings', lower_bound, upper_bound);"""
+    else:
+        steps = """EXECUTE format(
+                                'CREATE INDEX %I ON %I USING hnsw (use_cmlm_multilingual halfvec_cosine_ops) WITH (m = 24, ef_construction = 200)',
+                                partition_name || '_use_cmlm_multilingual_idx', partition_name);"""
+    cursor.execute(f"""
+                   CREATE OR REPLACE FUNCTION articles_create_partition(month date) RETURNS text AS $$
+                        DECLARE
+                            lower_bound timestamptz := date_trunc('month', month::timestamp) AT TIME ZONE 'UTC';
+                            upper_bound timestamptz := (date_trunc('month', month::timestamp) + interval '1 month') AT TIME ZONE 'UTC';
+                            partition_name text := 'articles_p' || to_char(month, 'YYYY_MM');
+                        BEGIN
+                            IF to_regclass(partition_name) IS NOT NULL THEN
+                                RETURN partition_name;
+                            END IF;
+                            EXECUTE format('CREATE TABLE %I (LIKE articles INCLUDING DEFAULTS)', partition_name);
+                            EXECUTE format(
+                                'WITH moved AS (DELETE FROM articles_default WHERE stamp >= %L AND stamp < %L RETURNING *) '
+                                'INSERT INTO %I SELECT * FROM moved',
+                                lower_bound, upper_bound, partition_name);
+                            EXECUTE format(
+                                'ALTER TABLE articles ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                                partition_name, lower_bound, upper_bound);
+                            {steps}
+                            RETURN partition_name;
+                        END;
+                        $$ LANGUAGE plpgsql""")
+
+
+def create_detach_function(cursor, embeddings):
+    # with embeddings, those of the articles of a detached partition leave
+    # article_embeddings, and its HNSW index, with them
+    steps = ""
+    if embeddings:
+        steps = """IF to_regclass(partition_name || '_embeddings') IS NULL THEN
+                                EXECUTE format('CREATE TABLE %I (LIKE article_embeddings)', partition_name || '_embeddings');
+                            ELSE
+                                EXECUTE format('ALTER TABLE article_embeddings DETACH PARTITION %I', partition_name || '_embeddings');
+                                -- left out of the sequence, which goes with article_embeddings
+                                EXECUTE format('ALTER TABLE %I ALTER COLUMN id DROP DEFAULT', partition_name || '_embeddings');
+                            END IF;
+                            -- the embeddings whose stamp is not that of their article any more
+                            EXECUTE format(
+                                'WITH moved AS (DELETE FROM article_embeddings WHERE article_id IN (SELECT id FROM %I) RETURNING *) '
+                                'INSERT INTO %I SELECT * FROM moved',
+                                partition_name, partition_name || '_embeddings');"""
+    cursor.execute(f"""
+                   CREATE OR REPLACE FUNCTION articles_detach_partition(partition_name text) RETURNS void AS $$
+                        BEGIN
+                            EXECUTE format('ALTER TABLE articles DETACH PARTITION %I', partition_name);
+                            EXECUTE format('CREATE TABLE %I (LIKE articles_data INCLUDING ALL)', partition_name || '_data');
+                            EXECUTE format(
+                                'WITH moved AS (DELETE FROM articles_data WHERE id IN (SELECT id FROM %I) RETURNING *) '
+                                'INSERT INTO %I SELECT * FROM moved',
+                                partition_name, partition_name || '_data');
+                            {steps}
+                            EXECUTE format(
+                                'INSERT INTO feeds_data_dirty SELECT DISTINCT feed_id FROM %I WHERE feed_id IS NOT NULL '
+                                'ON CONFLICT DO NOTHING',
+                                partition_name);
+                        END;
+                        $$ LANGUAGE plpgsql""")
+
+
+def move_embeddings(apps, schema_editor):
+
+    with schema_editor.connection.cursor() as cursor:
+        # partitioned like articles, by the stamp of the article, so that
+        # the HNSW index of each month is built once, and leaves with the
+        # articles of the month when their partition is detached
+        cursor.execute("CREATE SEQUENCE article_embeddings_id_seq")
+        cursor.execute("""
+                       CREATE TABLE article_embeddings (
+                            id bigint NOT NULL DEFAULT nextval('article_embeddings_id_seq'),
+                            article_id bigint NOT NULL,
+                            stamp timestamptz NOT NULL,
+                            model text NOT NULL,
+                            embedding halfvec(768) NOT NULL,
+                            PRIMARY KEY (id, stamp),
+                            UNIQUE (article_id, model, stamp)
+                       ) PARTITION BY RANGE (stamp)""")
+        cursor.execute("ALTER SEQUENCE article_embeddings_id_seq OWNED BY article_embeddings.id")
+        cursor.execute("""
+                       SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+                       FROM pg_inherits
+                       JOIN pg_class AS parent ON parent.oid = pg_inherits.inhparent
+                       JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+                       WHERE parent.relname = 'articles'""")
+        for partition, bound in cursor.fetchall():
+            cursor.execute(f"CREATE TABLE {partition}_embeddings PARTITION OF article_embeddings {bound}")
+
+        cursor.execute("SET LOCAL maintenance_work_mem = '1GB'")
+        for model in MODELS:
+            cursor.execute(f"""
+                           INSERT INTO article_embeddings (article_id, stamp, model, embedding)
+                                SELECT id, stamp, '{model}', {model}
+                                FROM articles
+                                WHERE {model} IS NOT NULL""")
+        # one HNSW index per model, the only one used so far being
+        # use_cmlm_multilingual: built on each partition once filled, and
+        # on each partition attached later
+        cursor.execute("""
+                       CREATE INDEX article_embeddings_use_cmlm_multilingual_idx
+                            ON article_embeddings
+                            USING hnsw (embedding halfvec_cosine_ops)
+                            WITH (m = 24, ef_construction = 200)
+                            WHERE model = 'use_cmlm_multilingual'""")
+
+        create_articles_combined(cursor, ARTICLES_COLUMNS)
+        create_partition_function(cursor, embeddings=True)
+        create_detach_function(cursor, embeddings=True)
+        for model in MODELS:
+            cursor.execute(f"ALTER TABLE articles DROP COLUMN {model}")
+
+
+def restore_embeddings(apps, schema_editor):
+
+    with schema_editor.connection.cursor() as cursor:
+        for model in MODELS:
+            cursor.execute(f"ALTER TABLE articles ADD COLUMN {model} halfvec(768)")
+            cursor.execute(f"""
+                           UPDATE articles
+                                SET {model} = article_embeddings.embedding
+                                FROM article_embeddings
+                                WHERE article_embeddings.article_id = articles.id
+                                    AND article_embeddings.model = '{model}'""")
+
+        create_partition_function(cursor, embeddings=False)
+        create_detach_function(cursor, embeddings=False)
+        cursor.execute("""
+                       SELECT child.relname
+                       FROM pg_inherits
+                       JOIN pg_class AS parent ON parent.oid = pg_inherits.inhparent
+                       JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+                       WHERE parent.relname = 'articles'
+                            AND child.relname ~ '^articles_p[0-9]{4}_[0-9]{2}$'""")
+        for (partition,) in cursor.fetchall():
+            cursor.execute(f"CREATE INDEX {partition}_use_cmlm_multilingual_idx ON {partition} USING hnsw (use_cmlm_multilingual halfvec_cosine_ops) WITH (m = 24, ef_construction = 200)")
+        create_articles_combined(cursor, ARTICLES_COLUMNS + MODELS[::-1])
+        # the embeddings of the detached partitions are left in their tables
+        cursor.execute("DROP TABLE article_embeddings")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0020_partition_articles'),
+    ]
+
+    operations = [
+        # partitioned by stamp, created by move_embeddings
+        migrations.CreateModel(
+            name='ArticleEmbeddings',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('stamp', models.DateTimeField()),
+                ('model', models.TextField()),
+                ('embedding', pgvector.django.HalfVectorField(dimensions=768)),
+                ('article', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='news.articles')),
+            ],
+            options={
+                'db_table': 'article_embeddings',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(move_embeddings, reverse_code=restore_embeddings),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+def create_embedding_claims(apps, schema_editor):
+
+    with schema_editor.connection.cursor() as cursor:
+        # the articles being embedded by a worker, until the claim expires;
+        # losing them in a crash only makes them claimable again
+        cursor.execute("""
+                       CREATE UNLOGGED TABLE embedding_claims (
+                            article_id bigint NOT NULL,
+                            model text NOT NULL,
+                            worker text NOT NULL,
+                            expires_at timestamptz NOT NULL,
+                            PRIMARY KEY (article_id, model)
+                       )""")
+        cursor.execute("CREATE INDEX embedding_claims_expires_at_idx ON embedding_claims (expires_at)")
+
+
+def drop_embedding_claims(apps, schema_editor):
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS embedding_claims")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0021_article_embeddings'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_embedding_claims, reverse_code=drop_embedding_claims),
+    ]
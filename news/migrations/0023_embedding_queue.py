@@ -0,0 +1,47 @@
+from django.db import migrations
+
+
+def create_embedding_queue(apps, schema_editor):
+
+    with schema_editor.connection.cursor() as cursor:
+        # the articles waiting to be embedded as soon as they are stored;
+        # losing them in a crash only leaves them to the hourly backfill
+        cursor.execute("""
+                       CREATE UNLOGGED TABLE embedding_queue (
+                            article_id bigint PRIMARY KEY,
+                            queued_at timestamptz NOT NULL DEFAULT now()
+                       )""")
+        # queue the articles inserted by the statement, in one go, and wake
+        # up the workers listening
+        cursor.execute("""
+                       CREATE FUNCTION articles_queue_embeddings() RETURNS trigger AS $$
+                            BEGIN
+                                INSERT INTO embedding_queue (article_id)
+                                    SELECT id FROM new_articles
+                                ON CONFLICT DO NOTHING;
+                                IF FOUND THEN
+                                    PERFORM pg_notify('embedding_queue', '');
+                                END IF;
+                                RETURN NULL;
+                            END;
+                            $$ LANGUAGE plpgsql""")
+        cursor.execute("CREATE TRIGGER articles_queue_embeddings AFTER INSERT ON articles REFERENCING NEW TABLE AS new_articles FOR EACH STATEMENT EXECUTE FUNCTION articles_queue_embeddings()")
+
+
+def drop_embedding_queue(apps, schema_editor):
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP TRIGGER IF EXISTS articles_queue_embeddings ON articles")
+        cursor.execute("DROP FUNCTION IF EXISTS articles_queue_embeddings")
+        cursor.execute("DROP TABLE IF EXISTS embedding_queue")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0022_embedding_claims'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_embedding_queue, reverse_code=drop_embedding_queue),
+    ]
@@ -1,10 +1,15 @@
+import contextlib
 import datetime
 import uuid
 
 from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
 from django.contrib.postgres.search import SearchVectorField
+from django.db import DEFAULT_DB_ALIAS
+from django.db import connections
 from django.db import models
+from django.db import transaction
+from pgvector.django import CosineDistance
 from pgvector.django import HalfVectorField
 
 
@@ -12,15 +17,7 @@ class ArticleManager(models.Manager):
     use_for_related_fields = True
 
     def get_queryset(self, *args, **kwargs):
-        return (
-            super()
-            .get_queryset(*args, **kwargs)
-            .defer(
-                "paraphrase_multilingual_mpnet_base_v2",
-                "use_cmlm_multilingual",
-                "tsv",
-            )
-        )
+        return super().get_queryset(*args, **kwargs).defer("tsv")
 
 
 class Articles(models.Model):
@@ -33,13 +30,12 @@ class Articles(models.Model):
     language = models.TextField(blank=True, null=True)  # noqa: DJ001
     url = models.TextField(unique=True, blank=True, null=True)
     feed = models.ForeignKey("Feeds", models.DO_NOTHING)
-    paraphrase_multilingual_mpnet_base_v2 = HalfVectorField(dimensions=768)
-    use_cmlm_multilingual = HalfVectorField(dimensions=768)
     tsv = SearchVectorField(null=True)
 
     objects = ArticleManager()
 
     class Meta:
+        # partitioned by stamp, see migration 0020_partition_articles
         managed = False
         db_table = "articles"
 
@@ -47,9 +43,72 @@ class Articles(models.Model):
         return f"{self.id}"
 
 
+# highest hnsw.ef_search pgvector accepts
+HNSW_MAX_EF_SEARCH = 1000
+
+
+@contextlib.contextmanager
+def hnsw_candidates(limit, using=DEFAULT_DB_ALIAS):
+    """
+    Let the scans of the HNSW indexes in the block return up to limit rows.
+
+    The size of the candidate list of a scan, hnsw.ef_search, is 40 by
+    default: whatever its LIMIT, a query through the index returns at most
+    about 40 rows, fewer still if some are filtered out afterwards.
+    """
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                "SELECT set_config('hnsw.ef_search', %s, true)",
+                [str(min(limit, HNSW_MAX_EF_SEARCH))],
+            )
+        yield
+
+
+class ArticleEmbeddingsQuerySet(models.QuerySet):
+    def nearest(self, embedding, model):
+        """Embeddings of the given model, nearest first to the given one."""
+        return (
+            self.filter(model=model)
+            .annotate(distance=CosineDistance("embedding", embedding))
+            .order_by("distance")
+        )
+
+
+class ArticleEmbeddings(models.Model):
+    """Embedding of an article computed with a sentence transformers model."""
+
+    USE_CMLM_MULTILINGUAL = "use_cmlm_multilingual"
+    PARAPHRASE_MULTILINGUAL_MPNET_BASE_V2 = "paraphrase_multilingual_mpnet_base_v2"
+
+    id = models.BigAutoField(primary_key=True)
+    # articles is partitioned, foreign keys to it cannot be enforced by the DB
+    article = models.ForeignKey(
+        Articles,
+        models.CASCADE,
+        db_constraint=False,
+        related_name="embeddings",
+    )
+    # that of the article, by which the embeddings are partitioned like it
+    stamp = models.DateTimeField()
+    model = models.TextField()
+    embedding = HalfVectorField(dimensions=768)
+
+    objects = ArticleEmbeddingsQuerySet.as_manager()
+
+    class Meta:
+        db_table = "article_embeddings"
+        # partitioned by stamp, see migration 0021_article_embeddings
+        managed = False
+
+    def __str__(self):
+        return f"{self.id}"
+
+
 class GuestArticles(models.Model):
     id = models.AutoField(primary_key=True)
-    article = models.OneToOneField(Articles, models.CASCADE)
+    # articles is partitioned, foreign keys to it cannot be enforced by the DB
+    article = models.OneToOneField(Articles, models.CASCADE, db_constraint=False)
     views = models.BigIntegerField()
 
     def __str__(self):
@@ -68,6 +127,9 @@ class ArticlesData(models.Model):
     to_reads = models.FloatField()
     length = models.IntegerField()
     excerpt = models.TextField(null=True)  # noqa: DJ001
+    # running sum and count of the ratings, the average of which is rating
+    rating_sum = models.BigIntegerField(default=0)
+    rating_count = models.BigIntegerField(default=0)
 
     class Meta:
         managed = False
@@ -93,8 +155,6 @@ class ArticlesCombined(models.Model):
     to_reads = models.FloatField()
     length = models.IntegerField()
     excerpt = models.TextField(null=True)  # noqa: DJ001
-    paraphrase_multilingual_mpnet_base_v2 = HalfVectorField(dimensions=768)
-    use_cmlm_multilingual = HalfVectorField(dimensions=768)
     tsv = SearchVectorField(null=True)
 
     objects = ArticleManager()
@@ -170,6 +230,58 @@ class FeedIcons(models.Model):
         return f"{self.id}"
 
 
+class FeedCache(models.Model):
+    """HTTP validators and body hash of the last successfully processed poll."""
+
+    id = models.AutoField(primary_key=True)
+    feed = models.OneToOneField(Feeds, models.CASCADE)
+    etag = models.TextField(blank=True)
+    last_modified = models.TextField(blank=True)
+    content_hash = models.TextField(blank=True)
+    stamp = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.id}"
+
+
+class FeedBreaker(models.Model):
+    """Circuit breaker parking a feed that keeps failing to be polled."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+    STATES = [
+        (CLOSED, "Closed"),
+        (OPEN, "Open"),
+        (HALF_OPEN, "Half-open"),
+    ]
+
+    id = models.AutoField(primary_key=True)
+    feed = models.OneToOneField(Feeds, models.CASCADE)
+    state = models.TextField(choices=STATES, default=CLOSED)
+    failures = models.IntegerField(default=0)
+    last_status = models.IntegerField(default=0)
+    reason = models.TextField(blank=True)
+    opened_until = models.DateTimeField(blank=True, null=True)
+    stamp = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.id}"
+
+
+class FeedSchedule(models.Model):
+    """When a feed is next polled, and the interval it was computed with."""
+
+    id = models.AutoField(primary_key=True)
+    feed = models.OneToOneField(Feeds, models.CASCADE)
+    next_poll = models.DateTimeField(db_index=True)
+    interval = models.IntegerField()
+    stamp = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.id}"
+
+
 class FeedsCombined(models.Model):
     id = models.IntegerField(primary_key=True)
     homepage = models.TextField()
@@ -277,7 +389,7 @@ class UserArticleLists(models.Model):
 
 class ArticleLists(models.Model):
     id = models.AutoField(primary_key=True)
-    article = models.ForeignKey(Articles, models.CASCADE)
+    article = models.ForeignKey(Articles, models.CASCADE, db_constraint=False)
     list = models.ForeignKey(UserArticleLists, models.CASCADE)
 
     def __str__(self):
@@ -290,7 +402,7 @@ class UserArticles(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
-    article = models.ForeignKey(Articles, models.CASCADE)
+    article = models.ForeignKey(Articles, models.CASCADE, db_constraint=False)
     read = models.BooleanField(default=False)
     rating = models.IntegerField(default=0)
     dismissed = models.BooleanField(default=False)
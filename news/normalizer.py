@@ -0,0 +1,568 @@
+import functools
+import html
+import re
+import urllib.parse
+from collections.abc import Iterator
+
+import lxml.html
+from bs4.dammit import EntitySubstitution
+from cssselect import HTMLTranslator
+from lxml import etree
+from lxml.cssselect import CSSSelector
+
+# tags removed together with their content
+BLACKLISTED_TAGS = (
+    "img",
+    "figcaption",
+    "figure",
+    "hr",
+    "source",
+    "object",
+    "video",
+    "iframe",
+    "audio",
+    "track",
+    "embed",
+    "param",
+    "map",
+    "area",
+    "form",
+    "input",
+    "button",
+    "canvas",
+    "style",
+    "script",
+    "svg",
+    "picture",
+)
+
+# tags removed by sanitize_html before calling the readability service
+SANITIZED_TAGS = ("style", "script", "svg", "picture")
+
+# tags kept, all the others are replaced by their content
+ALLOWED_TAGS = frozenset(
+    [
+        "a",
+        "p",
+        "i",
+        "strong",
+        "b",
+        "br",
+        "table",
+        "tr",
+        "th",
+        "td",
+        "h1",
+        "h2",
+        "h3",
+        "h4",
+        "h5",
+        "h6",
+        "pre",
+        "hr",
+        "blockquote",
+        "ul",
+        "ol",
+        "li",
+        "dl",
+        "dt",
+        "dd",
+        "em",
+        "small",
+        "s",
+        "cite",
+        "code",
+        "sub",
+        "sup",
+        "span",
+        "tbody",
+        "thead",
+        "tfoot",
+    ],
+)
+
+# tags grouped in the same paragraph with the surrounding text
+INLINE_TAGS = frozenset(
+    [
+        "a",
+        "b",
+        "cite",
+        "code",
+        "em",
+        "i",
+        "s",
+        "small",
+        "span",
+        "strong",
+        "sub",
+        "sup",
+    ],
+)
+
+# The paragraphs are split at line breaks the way libxml2 recovers from the
+# "</p><p>" markup the former normalizer substituted for each <br/> before
+# parsing the result again: opening the key tag closes the current element
+# as long as it is one of the values ...
+AUTO_CLOSE = {
+    "p": frozenset(["p", "i", "b", "h1", "h2", "h3", "h4", "h5", "h6", "small", "s"]),
+    "a": frozenset(["a"]),
+    "table": frozenset(["p", "a", "h1", "h2", "h3", "h4", "h5", "h6", "pre"]),
+    "tr": frozenset(["p", "tr", "th", "td"]),
+    "th": frozenset(["p", "a", "i", "b", "th", "td", "span"]),
+    "td": frozenset(["p", "a", "i", "b", "th", "td", "span"]),
+    "h1": frozenset(["p"]),
+    "h2": frozenset(["p"]),
+    "h3": frozenset(["p"]),
+    "h4": frozenset(["p"]),
+    "h5": frozenset(["p"]),
+    "h6": frozenset(["p"]),
+    "pre": frozenset(["p", "ul"]),
+    "blockquote": frozenset(["p"]),
+    "ul": frozenset(["p", "pre"]),
+    "ol": frozenset(["p"]),
+    "li": frozenset(["p", "h1", "h2", "h3", "h4", "h5", "h6", "pre", "li", "dl"]),
+    "dl": frozenset(["p", "pre", "dt"]),
+    "dt": frozenset(["p", "pre", "dd"]),
+    "dd": frozenset(["p", "pre", "dt"]),
+    "tbody": frozenset(["p", "tr", "th", "td", "tbody", "thead", "tfoot"]),
+    "tfoot": frozenset(["p", "tr", "th", "td", "tbody", "thead"]),
+}
+# ... and a closing tag is ignored if it would also close an element with a
+# higher priority (100 by default)
+END_PRIORITY = {
+    "td": 160,
+    "th": 160,
+    "tr": 170,
+    "thead": 180,
+    "tbody": 180,
+    "tfoot": 180,
+    "table": 190,
+}
+
+# attributes holding whitespace-separated lists of values
+LIST_ATTRIBUTES = {
+    "*": frozenset(["class", "accesskey", "dropzone"]),
+    "a": frozenset(["rel", "rev"]),
+    "td": frozenset(["headers"]),
+    "th": frozenset(["headers"]),
+}
+
+# tags whose content is output verbatim
+PRESERVE_WHITESPACE_TAGS = frozenset(["pre"])
+# tags whose whitespace-only strings are kept as they are while parsing
+PRESERVE_WHITESPACE_PARSING = frozenset(["pre", "textarea"])
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+
+INDENT = " "
+
+DOCTYPE = re.compile(r"\s*<!doctype", re.IGNORECASE)
+# stray "<" characters at the beginning of the document, which libxml2 does
+# not keep in the tree as there is no element yet to add them to
+STRAY_PREFIX = re.compile(r"[ \t\n\r\f]*((?:<(?![A-Za-z!/?]|\Z)[ \t\n\r\f]*)+)")
+
+
+class _Markup(str):
+    """Processing instruction or document type declaration, output as is."""
+
+    __slots__ = ()
+
+
+class _Comment:
+    pass
+
+
+# placeholder for the comments, which are dropped but still keep two
+# adjacent line breaks apart
+_COMMENT = _Comment()
+
+
+class _Element:
+    __slots__ = ("attrs", "children", "name")
+
+    def __init__(self, name: str, attrs: dict[str, str]):
+        self.name = name
+        self.attrs = attrs
+        self.children: list = []
+
+
+class _TreeBuilder:
+    """
+    Build the normalized tree from a stream of tags and text, closing the
+    misnested elements the way libxml2 does.
+    """
+
+    def __init__(self):
+        self.body = _Element("body", {})
+        self.stack = [self.body]
+
+    def start(self, name: str, attrs: dict[str, str]) -> None:
+        closes = AUTO_CLOSE.get(name)
+        if closes:
+            while len(self.stack) > 1 and self.stack[-1].name in closes:
+                self.stack.pop()
+        element = _Element(name, attrs)
+        self.stack[-1].children.append(element)
+        if name != "br":
+            self.stack.append(element)
+
+    def end(self, name: str) -> None:
+        priority = END_PRIORITY.get(name, 100)
+        for i in range(len(self.stack) - 1, 0, -1):
+            current = self.stack[i].name
+            if current == name:
+                del self.stack[i:]
+                return
+            if END_PRIORITY.get(current, 100) > priority:
+                return
+
+    def data(self, text: str) -> None:
+        children = self.stack[-1].children
+        if children and type(children[-1]) is str:
+            children[-1] += text
+        else:
+            children.append(text)
+
+    def markup(self, markup: str) -> None:
+        self.stack[-1].children.append(_Markup(markup))
+
+
+class _Translator(HTMLTranslator):
+    def xpath_empty_pseudo(self, xpath):
+        # whitespace does not count as content, as with BeautifulSoup
+        return xpath.add_condition("not(*) and not(normalize-space())")
+
+
+_translator = _Translator()
+
+
+@functools.lru_cache(maxsize=256)
+def compile_exclude(exclude: str | None) -> CSSSelector | None:
+    """Compile the CSS selector of the elements excluded from a feed."""
+    if not exclude:
+        return None
+    return CSSSelector(exclude, translator=_translator)
+
+
+def parse_html(content: str):
+    """Parse an HTML document or fragment, return None if it is empty."""
+    parser = etree.HTMLParser()
+    parser.feed(content)
+    try:
+        return parser.close()
+    except etree.XMLSyntaxError:
+        return None
+
+
+def sanitize_html(html_content: str, exclude: str | None = None) -> str:
+    root = parse_html(html_content)
+    if root is None:
+        return ""
+    etree.strip_elements(root, *SANITIZED_TAGS, with_tail=False)
+    selector = compile_exclude(exclude)
+    if selector is not None:
+        for element in selector(root):
+            parent = element.getparent()
+            if parent is None:
+                return ""
+            # keep the text following the element
+            if element.tail:
+                previous = element.getprevious()
+                if previous is not None:
+                    previous.tail = (previous.tail or "") + element.tail
+                else:
+                    parent.text = (parent.text or "") + element.tail
+            parent.remove(element)
+    return etree.tostring(root, method="html", encoding="unicode")
+
+
+def _collapse(text: str) -> str:
+    # strings made only of ASCII whitespace are reduced to one character
+    if text.strip(ASCII_SPACES):
+        return text
+    return "\n" if "\n" in text else " "
+
+
+def _is_break(node) -> bool:
+    return getattr(node, "tag", None) == "br"
+
+
+def _without_duplicate_breaks(nodes: list) -> list:
+    # a line break immediately followed by another one is dropped
+    return [
+        node
+        for i, node in enumerate(nodes)
+        if not (_is_break(node) and i + 1 < len(nodes) and _is_break(nodes[i + 1]))
+    ]
+
+
+class _Walker:
+    """
+    Walk the parsed document once, feeding the normalized markup to a
+    builder.
+    """
+
+    def __init__(self, builder: _TreeBuilder, base_url: str | None):
+        self.builder = builder
+        self.base_url = base_url
+        self.gaps: set = set()
+
+    def remove(self, element) -> None:
+        # Replace the element with an empty comment, which is invisible to
+        # the CSS selectors and keeps apart the strings around the element
+        parent = element.getparent()
+        if parent is None:
+            element.clear()
+            return
+        gap = etree.Comment()
+        gap.tail = element.tail
+        parent.replace(element, gap)
+        self.gaps.add(gap)
+
+    def prune(self, roots: list, exclude: str | None) -> None:
+        for root in roots:
+            for element in list(root.iter(*BLACKLISTED_TAGS)):
+                self.remove(element)
+        selector = compile_exclude(exclude)
+        if selector is not None:
+            for root in roots:
+                for element in selector(root):
+                    self.remove(element)
+
+    def children(self, element, *, preserve: bool) -> Iterator:
+        """
+        Yield the text and the allowed child elements of element, replacing
+        the other elements with their content.
+        """
+        if element.text:
+            yield element.text if preserve else _collapse(element.text)
+        for child in element:
+            tag = child.tag
+            if isinstance(tag, str):
+                if tag == "div" or tag in ALLOWED_TAGS:
+                    yield child
+                else:
+                    yield from self.children(
+                        child,
+                        preserve=preserve or tag in PRESERVE_WHITESPACE_PARSING,
+                    )
+            elif tag is etree.Comment:
+                if child not in self.gaps:
+                    yield _COMMENT
+            elif tag is etree.PI:
+                yield _Markup(f"<?{child.target} {child.text or ''}>")
+            if child.tail:
+                yield child.tail if preserve else _collapse(child.tail)
+
+    def attributes(self, element) -> dict[str, str]:
+        attrs = dict(element.attrib)
+        attrs.pop("style", None)
+        if self.base_url and element.tag == "a" and "href" in attrs:
+            attrs["target"] = "_blank"
+            href = attrs["href"]
+            if urllib.parse.urlparse(href).scheme == "":
+                attrs["href"] = urllib.parse.urljoin(self.base_url, href)
+        return attrs
+
+    def content(self, element) -> None:
+        preserve = (
+            element.tag in PRESERVE_WHITESPACE_PARSING
+            or next(element.iterancestors(*PRESERVE_WHITESPACE_PARSING), None)
+            is not None
+        )
+        nodes = list(self.children(element, preserve=preserve))
+        for node in _without_duplicate_breaks(nodes):
+            self.node(node)
+
+    def node(self, node) -> None:
+        if isinstance(node, _Markup):
+            self.builder.markup(node)
+        elif isinstance(node, str):
+            self.builder.data(node)
+        elif node is not _COMMENT:
+            self.element(node)
+
+    def element(self, element) -> None:
+        name = "p" if element.tag == "div" else element.tag
+        attrs = self.attributes(element)
+        if name == "br":
+            if attrs:
+                self.builder.start(name, attrs)
+            else:
+                # split the paragraph
+                self.builder.end("p")
+                self.builder.start("p", {})
+            return
+        self.builder.start(name, attrs)
+        self.content(element)
+        self.builder.end(name)
+
+    def document(self, roots: list, prefix: list) -> None:
+        # html, head and body are replaced by their content as well
+        nodes = prefix
+        for root in roots:
+            if root.tag is etree.PI:
+                nodes.append(_Markup(f"<?{root.target} {root.text or ''}>"))
+            elif root.tag is etree.Comment:
+                nodes.append(_COMMENT)
+            else:
+                nodes.extend(self.children(root, preserve=False))
+
+        # group the top-level text and inline elements into paragraphs
+        self.builder.start("p", {})
+        for node in _without_duplicate_breaks(nodes):
+            tag = getattr(node, "tag", None)
+            if not isinstance(tag, str) or tag in INLINE_TAGS:
+                self.node(node)
+            elif tag in ("p", "div"):
+                # the following inline content joins this paragraph
+                self.builder.end("p")
+                self.builder.start("p", self.attributes(node))
+                self.content(node)
+            else:
+                self.builder.end("p")
+                self.builder.start("p", {})
+                self.element(node)
+        self.builder.end("p")
+
+
+def _is_empty(element: _Element) -> bool:
+    for child in element.children:
+        if isinstance(child, _Element):
+            if not _is_empty(child):
+                return False
+        elif not isinstance(child, _Markup) and child.strip():
+            return False
+    return True
+
+
+def _remove_empty_paragraphs(element: _Element) -> None:
+    children = []
+    for child in element.children:
+        if isinstance(child, _Element):
+            if child.name == "p" and _is_empty(child):
+                continue
+            _remove_empty_paragraphs(child)
+        children.append(child)
+    element.children = children
+
+
+def _start_tag(element: _Element) -> str:
+    list_attributes = LIST_ATTRIBUTES.get(element.name, frozenset())
+    attrs = []
+    for key, value in sorted(element.attrs.items()):
+        if key in LIST_ATTRIBUTES["*"] or key in list_attributes:
+            value = " ".join(value.split())  # noqa: PLW2901
+        elif value == "":
+            attrs.append(key)
+            continue
+        value = EntitySubstitution.substitute_html5(value)  # noqa: PLW2901
+        attrs.append(f"{key}={EntitySubstitution.quoted_attribute_value(value)}")
+    if attrs:
+        return f"<{element.name} {' '.join(attrs)}>"
+    return f"<{element.name}>"
+
+
+def _verbatim(element: _Element, pieces: list[str]) -> None:
+    for child in element.children:
+        if isinstance(child, _Element):
+            pieces.append(_start_tag(child))
+            if child.name != "br":
+                _verbatim(child, pieces)
+                pieces.append(f"</{child.name}>")
+        elif isinstance(child, _Markup):
+            pieces.append(child)
+        else:
+            pieces.append(EntitySubstitution.substitute_html5(child))
+
+
+def _prettify(element: _Element, level: int, pieces: list[str]) -> None:
+    indent = INDENT * level
+    for child in element.children:
+        if isinstance(child, _Element):
+            if child.name == "br":
+                pieces.append(f"{indent}{_start_tag(child)}\n")
+            elif child.name in PRESERVE_WHITESPACE_TAGS:
+                pieces.append(f"{indent}{_start_tag(child)}")
+                _verbatim(child, pieces)
+                pieces.append(f"</{child.name}>\n")
+            else:
+                pieces.append(f"{indent}{_start_tag(child)}\n")
+                _prettify(child, level + 1, pieces)
+                pieces.append(f"{indent}</{child.name}>\n")
+        else:
+            if isinstance(child, _Markup):
+                text = child.strip()
+            else:
+                text = EntitySubstitution.substitute_html5(child).strip()
+            if text:
+                pieces.append(f"{indent}{text}\n")
+
+
+def normalize_content(
+    content: str,
+    base_url: str | None = None,
+    exclude: str | None = None,
+) -> str:
+    """
+    Reduce the HTML of an article to a flat sequence of paragraphs, headings,
+    lists, tables and the like, with absolute links and no media, scripts,
+    styles or comments.
+
+    The document is parsed once and walked once; the elements matching the
+    per-feed exclude selector are removed beforehand.
+    """
+    html = " ".join(line.strip() for line in content.split("\n"))
+    stray = STRAY_PREFIX.match(html)
+    root = parse_html(html)
+    if root is None and stray is None:
+        return ""
+    # the content following </html> ends up in sibling elements
+    roots = (
+        [
+            *reversed(list(root.itersiblings(preceding=True))),
+            root,
+            *root.itersiblings(),
+        ]
+        if root is not None
+        else []
+    )
+
+    prefix: list = []
+    if stray:
+        prefix.append(stray.group(1))
+    elif root is not None and DOCTYPE.match(html):
+        prefix.append(_Markup(root.getroottree().docinfo.doctype))
+
+    builder = _TreeBuilder()
+    walker = _Walker(builder, base_url)
+    walker.prune([r for r in roots if isinstance(r.tag, str)], exclude)
+    walker.document(roots, prefix)
+    _remove_empty_paragraphs(builder.body)
+
+    pieces: list[str] = []
+    _prettify(builder.body, 0, pieces)
+    # get rid of nbsp
+    return "".join(pieces).replace("&nbsp;", " ")
+
+
+def clean(s: str) -> str:
+    """Reduce an HTML snippet such as the title of an entry to plain text."""
+    if s:
+        t = html.unescape(s)
+        u = lxml.html.fromstring(t)
+        return u.text_content()
+    return s
+
+
+def normalize_article(
+    content: str,
+    base_url: str,
+    exclude: str | None,
+    author: str,
+    title: str,
+) -> tuple[str, str, str]:
+    """
+    Return the cleaned author and title and the normalized content of an
+    article; this is the entry point of the normalization worker processes.
+    """
+    return (clean(author), clean(title), normalize_content(content, base_url, exclude))
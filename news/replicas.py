@@ -0,0 +1,141 @@
+import contextvars
+import random
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from rest_framework.authentication import get_authorization_header
+from rest_framework.authtoken.models import Token
+
+# the replica the current request reads from, None for the primary
+read_replica: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "read_replica",
+    default=None,
+)
+
+# cookie pinning the reads of a client to the primary after its own writes
+PIN_COOKIE = "db_pin"
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# the statements that change the data on the primary
+WRITES = ("INSERT", "UPDATE", "DELETE")
+
+
+def replicas() -> list[str]:
+    return [alias for alias in settings.DATABASES if alias.startswith("replica")]
+
+
+def pin_key(user_id) -> str:
+    return f"db_pin:{user_id}"
+
+
+def request_user_id(request):
+    """
+    The id of the user making the request, None if anonymous; the clients
+    authenticating with a token are only known to DRF once in the view, so
+    before it their token is looked up here.
+    """
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return user.pk
+    auth = get_authorization_header(request).split()
+    if len(auth) != 2 or auth[0].lower() != b"token":  # noqa: PLR2004
+        return None
+    return (
+        Token.objects.filter(key=auth[1].decode(errors="replace"))
+        .values_list("user_id", flat=True)
+        .first()
+    )
+
+
+class ReplicaRouter:
+    """
+    Send the reads of the news models to the replica the middleware chose
+    for the request, if any; everything else goes to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = read_replica.get()
+        if model._meta.app_label != "news" or alias is None:  # noqa: SLF001
+            return "default"
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
+
+
+class ReplicaMiddleware:
+    """
+    Let the views with replica_reads = True read from a random replica on
+    safe requests, unless the client wrote something in the last
+    DATABASE_REPLICA_PIN_SECONDS, so that it reads its own writes. The
+    replica is chosen once per request, whose queries would otherwise see
+    replicas lagging behind by different amounts.
+
+    A request wrote if it ran an INSERT, UPDATE or DELETE on the primary,
+    whatever its method; the client is then pinned to the primary both
+    with a cookie and, if authenticated, with an entry in the replica_pins
+    cache, for the API clients which do not keep cookies.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        wrote = False
+
+        def detect_writes(execute, sql, params, many, context):
+            nonlocal wrote
+            wrote = wrote or sql.lstrip().split(None, 1)[0].upper() in WRITES
+            return execute(sql, params, many, context)
+
+        token = read_replica.set(None)
+        try:
+            with connections["default"].execute_wrapper(detect_writes):
+                response = self.get_response(request)
+        finally:
+            read_replica.reset(token)
+        if wrote and response.status_code < 400:  # noqa: PLR2004
+            response.set_cookie(
+                PIN_COOKIE,
+                "1",
+                max_age=settings.DATABASE_REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+            # DRF has set the user of token clients on the request by now
+            user = getattr(request, "user", None)
+            if user is not None and user.is_authenticated:
+                caches["replica_pins"].set(
+                    pin_key(user.pk),
+                    1,
+                    settings.DATABASE_REPLICA_PIN_SECONDS,
+                )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "cls", None) or getattr(
+            view_func,
+            "view_class",
+            None,
+        )
+        if (
+            getattr(view_class, "replica_reads", False)
+            and request.method in SAFE_METHODS
+            and PIN_COOKIE not in request.COOKIES
+            and (aliases := replicas())
+            and not self.pinned(request)
+        ):
+            read_replica.set(random.choice(aliases))  # noqa: S311
+
+    def pinned(self, request):
+        user_id = request_user_id(request)
+        return user_id is not None and caches["replica_pins"].get(pin_key(user_id))
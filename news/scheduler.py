@@ -0,0 +1,192 @@
+import datetime
+import heapq
+import json
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from news.models import FeedPolling
+from news.models import Feeds
+from news.models import FeedSchedule
+from news.models import FeedsData
+
+logger = logging.getLogger(__name__)
+
+# number of recent polls whose yield adjusts the interval
+YIELD_WINDOW = 5
+# growth of the interval for each consecutive poll that stored nothing
+BACKOFF_FACTOR = 1.5
+# the frequency constraints are checked hour by hour, for up to a year ahead
+MAX_FREQUENCY_STEPS = 366 * 24
+
+
+def frequency_allows(frequency: dict, when: datetime.datetime) -> bool:
+    """
+    Check whether a feed may be polled at the given UTC time according to
+    the operator's frequency constraints (see poller.frequency_skip).
+    """
+    if "hour" in frequency and when.hour not in frequency["hour"]:
+        return False
+    if "weekday" in frequency and when.weekday() + 1 not in frequency["weekday"]:
+        return False
+    if "day" in frequency:
+        next_month = when.replace(day=28) + datetime.timedelta(days=4)
+        last_day = (next_month - datetime.timedelta(days=next_month.day)).day
+        days = [d + last_day + 1 if d < 0 else d for d in frequency["day"]]
+        if when.day not in days:
+            return False
+    return True
+
+
+def next_allowed(
+    frequency_string: str | None,
+    when: datetime.datetime,
+) -> datetime.datetime:
+    """Return the first time not earlier than when satisfying the constraints."""
+    if not frequency_string:
+        return when
+    frequency = json.loads(frequency_string)
+    when = when.astimezone(datetime.UTC)
+    candidate = when
+    for _ in range(MAX_FREQUENCY_STEPS):
+        if frequency_allows(frequency, candidate):
+            return candidate
+        # try from the beginning of the following hour
+        candidate = candidate.replace(minute=0, second=0, microsecond=0)
+        candidate += datetime.timedelta(hours=1)
+    logger.warning(f"== frequency {frequency_string} is never satisfied")
+    return when
+
+
+def next_interval(
+    average_time_from_last_post: int | None,
+    recent_stored: list[int],
+) -> int:
+    """
+    Compute the polling interval in seconds of a feed.
+
+    The feed is polled about twice per average time between its posts; the
+    interval grows with each consecutive poll that stored no article and
+    shrinks when the last poll found several new ones. recent_stored holds
+    the articles_stored of the recent polls, newest first.
+    """
+    if average_time_from_last_post:
+        interval = average_time_from_last_post / 2
+    else:
+        interval = settings.POLLER_DEFAULT_INTERVAL
+    empty_polls = 0
+    for stored in recent_stored:
+        if stored:
+            break
+        empty_polls += 1
+    interval *= BACKOFF_FACTOR**empty_polls
+    if recent_stored and recent_stored[0] > 1:
+        interval /= recent_stored[0]
+    return int(
+        min(
+            max(interval, settings.POLLER_MIN_INTERVAL),
+            settings.POLLER_MAX_INTERVAL,
+        ),
+    )
+
+
+def reschedule(
+    feed: Feeds,
+    not_before: datetime.datetime | None = None,
+) -> FeedSchedule:
+    """
+    Schedule the next poll of a feed, after the one just recorded, no earlier
+    than not_before if given.
+    """
+    average = (
+        FeedsData.objects.filter(id=feed.id)
+        .values_list("average_time_from_last_post", flat=True)
+        .first()
+    )
+    recent_stored = list(
+        FeedPolling.objects.filter(feed=feed)
+        .order_by("-poll_start_time")
+        .values_list("articles_stored", flat=True)[:YIELD_WINDOW],
+    )
+    interval = next_interval(average, recent_stored)
+    next_poll = timezone.now() + datetime.timedelta(seconds=interval)
+    if not_before is not None:
+        next_poll = max(next_poll, not_before)
+    next_poll = next_allowed(feed.frequency, next_poll)
+    schedule, _ = FeedSchedule.objects.update_or_create(
+        feed=feed,
+        defaults={"interval": interval, "next_poll": next_poll},
+    )
+    logger.info(f"== feed {feed.id} next polled at {next_poll:%Y-%m-%d %H:%M}")
+    return schedule
+
+
+class Scheduler:
+    """
+    Priority queue of the active feeds, ordered by the time they are due.
+
+    The queue is loaded from feed_schedule, where the feeds never polled are
+    due at once. The feeds taken from it are claimed in the table, so that an
+    overlapping run does not poll them as well until they are rescheduled.
+    """
+
+    def __init__(self):
+        self.queue: list[tuple[datetime.datetime, int]] = []
+
+    def load(self) -> None:
+        now = timezone.now()
+        FeedSchedule.objects.bulk_create(
+            [
+                FeedSchedule(
+                    feed_id=feed_id,
+                    next_poll=now,
+                    interval=settings.POLLER_DEFAULT_INTERVAL,
+                )
+                for feed_id in Feeds.objects.filter(
+                    active=True,
+                    feedschedule__isnull=True,
+                ).values_list("id", flat=True)
+            ],
+            ignore_conflicts=True,
+        )
+        self.queue = [
+            (next_poll, feed_id)
+            for feed_id, next_poll in FeedSchedule.objects.filter(
+                feed__active=True,
+            ).values_list("feed_id", "next_poll")
+        ]
+        heapq.heapify(self.queue)
+
+    def pop_due(
+        self,
+        now: datetime.datetime,
+        limit: int | None = None,
+    ) -> list[int]:
+        """Remove and return the ids of the feeds due at now, most overdue first."""
+        feed_ids = []
+        while self.queue and self.queue[0][0] <= now:
+            if limit is not None and len(feed_ids) >= limit:
+                break
+            feed_ids.append(heapq.heappop(self.queue)[1])
+        return feed_ids
+
+    def claim_due(self, limit: int | None = None) -> list[Feeds]:
+        """Load the queue, then claim and return the feeds due now."""
+        self.load()
+        now = timezone.now()
+        feed_ids = self.pop_due(now, limit)
+        # hold them until they are polled and rescheduled, or until the lease
+        # expires if the worker polling them dies first
+        claimed_until = now + datetime.timedelta(seconds=settings.POLLER_CLAIM_LEASE)
+        with transaction.atomic():
+            claimed = list(
+                FeedSchedule.objects.select_for_update(skip_locked=True)
+                .filter(feed_id__in=feed_ids, next_poll__lte=now)
+                .values_list("feed_id", flat=True),
+            )
+            FeedSchedule.objects.filter(feed_id__in=claimed).update(
+                next_poll=claimed_until,
+            )
+        return list(Feeds.objects.filter(id__in=claimed).order_by("id"))
@@ -0,0 +1,27 @@
+"""
+In-process scrapers for the feeds with a script.
+
+Each module registers its scrapers under the name of the script they
+replace, so that a feed whose script is /srv/calo.news/py/poll_94.py is
+polled by the scraper registered as "poll_94".
+"""
+
+from news.scrapers import goodmorningitalia
+from news.scrapers import lindice
+from news.scrapers import pagellapolitica
+from news.scrapers import repubblica
+from news.scrapers.base import SCRAPERS
+from news.scrapers.base import Scraper
+from news.scrapers.base import get_scraper
+from news.scrapers.base import register
+
+__all__ = [
+    "SCRAPERS",
+    "Scraper",
+    "get_scraper",
+    "goodmorningitalia",
+    "lindice",
+    "pagellapolitica",
+    "register",
+    "repubblica",
+]
@@ -0,0 +1,159 @@
+import asyncio
+import contextlib
+import datetime
+import http.cookiejar
+import json
+import logging
+import random
+from abc import ABC
+from abc import abstractmethod
+from pathlib import Path
+from typing import Any
+
+import aiohttp
+from asgiref.sync import sync_to_async
+
+from news.seen_urls import seen_urls
+
+logger = logging.getLogger(__name__)
+
+# scrapers by name, which is the stem of the script of the feeds they serve
+SCRAPERS: dict[str, type["Scraper"]] = {}
+
+ITALIAN_MONTHS = [
+    "gennaio",
+    "febbraio",
+    "marzo",
+    "aprile",
+    "maggio",
+    "giugno",
+    "luglio",
+    "agosto",
+    "settembre",
+    "ottobre",
+    "novembre",
+    "dicembre",
+]
+
+
+def register(name: str):
+    """Class decorator registering a scraper under name."""
+
+    def decorator(cls: type["Scraper"]) -> type["Scraper"]:
+        SCRAPERS[name] = cls
+        return cls
+
+    return decorator
+
+
+def get_scraper(script: str | None) -> type["Scraper"] | None:
+    """Return the scraper registered for the script of a feed, if any."""
+    if not script:
+        return None
+    return SCRAPERS.get(Path(script).stem)
+
+
+def parse_italian_date(text: str) -> datetime.datetime | None:
+    """Parse a date such as "12 marzo 2025", return None if it is not one."""
+    words = text.lower().split()
+    for i in range(len(words) - 2):
+        day, month, year = words[i : i + 3]
+        if day.isdigit() and month in ITALIAN_MONTHS and year.isdigit():
+            return datetime.datetime(
+                int(year),
+                ITALIAN_MONTHS.index(month) + 1,
+                int(day),
+                tzinfo=datetime.UTC,
+            )
+    return None
+
+
+class Scraper(ABC):
+    """
+    Site-specific fetcher for a feed with no usable RSS.
+
+    Scrapers run in-process on the polling engine and share its HTTP client
+    and per-host limits. Subclasses implement scrape(), returning the
+    articles found with their raw HTML content, and count the pages they
+    retrieved or failed to retrieve; the poller then normalizes and stores
+    the articles like those of any other feed, and passes the outcome to
+    stored().
+    """
+
+    headers: dict[str, str] = {}
+    # file with the cookies to send, in Mozilla format
+    cookies_file: str | None = None
+    # range in seconds of the random pause between two article downloads
+    pause_range: tuple[int, int] = (0, 0)
+
+    def __init__(
+        self,
+        feed: Any,
+        client: aiohttp.ClientSession,
+        host_limiter: Any = None,
+        *,
+        verbose: bool = True,
+    ):
+        self.feed = feed
+        self.client = client
+        self.host_limiter = host_limiter
+        self.verbose = verbose
+        self.retrieved = 0
+        self.failed = 0
+        self._cookies: dict[str, str] | None = None
+
+    def cookies(self) -> dict[str, str]:
+        if self._cookies is None:
+            self._cookies = {}
+            if self.cookies_file:
+                cj = http.cookiejar.MozillaCookieJar(self.cookies_file)
+                try:
+                    cj.load()
+                except OSError:
+                    logger.exception(f"=== could not load {self.cookies_file}")
+                self._cookies = {c.name: c.value for c in cj if c.value}
+        return self._cookies
+
+    async def get(self, url: str, **kwargs) -> bytes:
+        """Download url, raising aiohttp.ClientResponseError on HTTP errors."""
+        slot = self.host_limiter(url) if self.host_limiter else contextlib.nullcontext()
+        async with (
+            slot,
+            self.client.get(
+                url,
+                headers=self.headers,
+                cookies=self.cookies(),
+                raise_for_status=True,
+                **kwargs,
+            ) as response,
+        ):
+            return await response.read()
+
+    async def get_text(self, url: str, **kwargs) -> str:
+        return (await self.get(url, **kwargs)).decode("utf-8", "ignore")
+
+    async def get_json(self, url: str, **kwargs) -> Any:
+        return json.loads(await self.get(url, **kwargs))
+
+    async def new_urls(self, urls: list[str]) -> list[str]:
+        """Return the urls not stored yet, without duplicates and in order."""
+        urls = list(dict.fromkeys(urls))
+        stored = await sync_to_async(seen_urls.stored)(urls)
+        return [url for url in urls if url not in stored]
+
+    async def pause(self) -> None:
+        """Wait a little before the next download, so as not to hammer the site."""
+        low, high = self.pause_range
+        if high > 0:
+            await asyncio.sleep(random.uniform(low, high))  # noqa: S311
+
+    @abstractmethod
+    async def scrape(self) -> list[dict[str, Any]]:
+        """Return the new articles of the feed, with their raw HTML content."""
+
+    # an optional hook, unlike scrape()
+    async def stored(self, article_ids: list[int]) -> None:  # noqa: B027
+        """
+        Act on the ids store_articles() returned for the articles of scrape(),
+        in the same order; does nothing unless overridden.
+        """
@@ -0,0 +1,55 @@
+import logging
+import time
+from pathlib import Path
+
+from news.scrapers.base import Scraper
+from news.scrapers.base import register
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64; rv:52.0) Gecko/20100101 Firefox/52.0"
+# minimum acceptable length for an article
+LENGTH_THRESHOLD = 2000
+
+
+def secret() -> str:
+    try:
+        return Path("secrets/94.jwt").read_text().strip("\n")
+    except OSError:
+        return ""
+
+
+@register("poll_94")
+class GoodMorningItalia(Scraper):
+    """Daily briefing of Good Morning Italia, one article a day."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.headers = {
+            "User-Agent": USER_AGENT,
+            "Accept": "application/json, text/plain, */*",
+            "Accept-Language": "en-US,en;q=0.5",
+            "Referer": "https://app.goodmorningitalia.it/briefing/",
+            "Authorization": f"Bearer {secret()}",
+            "Origin": "https://app.goodmorningitalia.it",
+        }
+
+    async def scrape(self):
+        date = time.strftime("%Y-%m-%d", time.gmtime())
+        url = f"https://api.goodmorningitalia.it/sync-news/?date_published[$gt]={date}00:00:00%20&date_published[$lt]={date}%2023:59:59"
+        data = (await self.get_json(url))["data"]
+        if len(data["content_html"]) <= LENGTH_THRESHOLD:
+            logger.error(
+                f"=== skipping because length = {len(data['content_html'])}",
+            )
+            self.failed += 1
+            return []
+        self.retrieved += 1
+        return [
+            {
+                "author": "redazione",
+                "content": data["content_html"],
+                "title": data["title"],
+                "url": data["url"],
+            },
+        ]
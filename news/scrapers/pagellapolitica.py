@@ -0,0 +1,55 @@
+import logging
+
+from bs4 import BeautifulSoup
+
+from news.scrapers.base import Scraper
+from news.scrapers.base import parse_italian_date
+from news.scrapers.base import register
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64; rv:52.0) Gecko/20100101 Firefox/52.0"
+BASE_URL = "https://pagellapolitica.it"
+
+
+@register("poll_189")
+class PagellaPolitica(Scraper):
+    """Fact-checking articles linked from the home page of Pagella Politica."""
+
+    headers = {"User-Agent": USER_AGENT}
+    pause_range = (5, 20)
+
+    def article(self, url, page):
+        soup = BeautifulSoup(page, "lxml")
+        stamps = soup.select("div.post-date > span")
+        if len(stamps) != 1:
+            return None
+        stamp = parse_italian_date(stamps[0].get_text())
+        return {
+            "author": soup.select("div.post-author")[0].get_text(),
+            "content": soup.select(".editor")[0].prettify(),
+            "stamp": stamp.isoformat() if stamp else None,
+            "title": soup.select(".post-title")[0].get_text(),
+            "url": url,
+        }
+
+    async def scrape(self):
+        soup = BeautifulSoup(await self.get_text(BASE_URL), "lxml")
+        urls = []
+        for a in soup.select("article a"):
+            url = a.get("href", "")
+            if url.startswith("/"):
+                url = BASE_URL + url
+            if url:
+                urls.append(url)
+
+        articles = []
+        for url in await self.new_urls(sorted(urls)):
+            if self.verbose:
+                logger.info(f"== to retrieve: {url}")
+            article = self.article(url, await self.get_text(url))
+            if article is not None:
+                articles.append(article)
+                self.retrieved += 1
+            await self.pause()
+        return articles
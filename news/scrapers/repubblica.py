@@ -0,0 +1,89 @@
+import datetime
+import html
+import logging
+
+from bs4 import BeautifulSoup
+
+from news.scrapers.base import Scraper
+from news.scrapers.base import register
+
+logger = logging.getLogger(__name__)
+
+time_format = "%Y-%m-%dT%H:%M:%SZ"
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64; rv:52.0) Gecko/20100101 Firefox/52.0"
+COVER_URL = "https://rep.repubblica.it/ws/cover.json"
+# minimum acceptable length for an article
+LENGTH_THRESHOLD = 500
+# unwanted elements of the AMP pages
+EXCLUDE = [
+    "amp-analytics",
+    ".detail-tag_container",
+    "#detail-values_big",
+    ".detail-comment_big",
+    ".detail-problem",
+]
+
+
+@register("poll_96")
+class Repubblica(Scraper):
+    """Articles on the cover of Rep:, read from their AMP version."""
+
+    headers = {"User-Agent": USER_AGENT}
+    cookies_file = "cookies_96.txt"
+    pause_range = (5, 20)
+
+    def entries(self, cover):
+        entries = []
+        for z in cover["feed"]["zones"]:
+            for b in z["blocks"]:
+                for e in b["entries"]:
+                    url = None
+                    for li in e.get("links", []):
+                        if li["rel"] == "target-alternate-amp":
+                            url = li["href"]
+                    if url is None:
+                        continue
+                    author = e.get("author", "anonimo")
+                    author = author.removeprefix("di ")
+                    entries.append(
+                        {
+                            "author": author,
+                            "title": html.unescape(e["title"]),
+                            "url": url,
+                        },
+                    )
+        return entries
+
+    async def scrape(self):
+        cover = await self.get_json(COVER_URL)
+        # 2019-05-12T21:56:20Z
+        stamp = datetime.datetime.strptime(
+            cover["feed"]["updated"],
+            time_format,
+        ).replace(tzinfo=datetime.UTC)
+        entries = self.entries(cover)
+        logger.info(f"== {len(entries)} candidates")
+        new_urls = set(await self.new_urls([e["url"] for e in entries]))
+
+        articles = []
+        for e in entries:
+            if e["url"] not in new_urls:
+                continue
+            new_urls.discard(e["url"])
+            if self.verbose:
+                logger.info(f"=== retrieving: {e['url']}")
+            soup = BeautifulSoup(await self.get_text(e["url"]), "lxml")
+            for el in soup.select(", ".join(EXCLUDE)):
+                el.extract()
+            content = "".join(b.prettify() for b in soup.select(".paywall"))
+            if len(content) > LENGTH_THRESHOLD:
+                stamp += datetime.timedelta(seconds=1)
+                articles.append(
+                    {**e, "content": content, "stamp": stamp.strftime(time_format)},
+                )
+                self.retrieved += 1
+            else:
+                logger.error(f"=== skipping because length = {len(content)}")
+                self.failed += 1
+            await self.pause()
+        return articles
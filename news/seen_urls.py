@@ -0,0 +1,146 @@
+import hashlib
+import logging
+import math
+import time
+
+from django.db.models import Max
+from django.db.models import Q
+
+from news.models import Articles
+
+logger = logging.getLogger(__name__)
+
+# maximum number of URLs looked up in the DB with a single query
+LOOKUP_BATCH_SIZE = 1000
+# the ids missing below the highest one seen may belong to transactions not
+# committed yet: they are looked up again at each refresh for this many
+# seconds, then taken as rolled back or deleted
+GAP_TIMEOUT = 600
+# only the missing ids this close to the highest one seen are looked up again
+GAP_WINDOW = 100000
+
+
+class BloomFilter:
+    """
+    Compact probabilistic set of strings.
+
+    Membership tests may return false positives (with probability close to
+    error_rate as long as no more than capacity items are added) but never
+    false negatives.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = capacity
+        self.size = max(
+            8,
+            math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2),
+        )
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # double hashing: derive all the positions from a single digest
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+class SeenUrls:
+    """
+    In-memory filter of the URLs of the articles stored in the DB.
+
+    The Bloom filter is built from articles.url at the first refresh, which
+    only the polling engine does, then kept up to date with the articles
+    stored by this process and, incrementally, with those stored by other
+    processes. Only the URLs the filter may have seen are looked up in the
+    DB; until it is built, all of them are.
+    """
+
+    def __init__(self, error_rate: float = 0.01):
+        self.error_rate = error_rate
+        self.bloom: BloomFilter | None = None
+        self.max_id = 0
+        # missing ids below max_id, with the time they were first missed
+        self.gaps: dict[int, float] = {}
+
+    def build(self) -> None:
+        count = Articles.objects.count()
+        # leave room for the articles stored during the life of the worker
+        self.bloom = BloomFilter(max(2 * count, 100000), self.error_rate)
+        self.max_id = 0
+        self.gaps = {}
+        self.refresh()
+        logger.info(f"== seen URLs filter built with {self.bloom.count} URLs")
+
+    def refresh(self) -> None:
+        """Add the URLs of the articles stored since the last refresh."""
+        if self.bloom is None:
+            self.build()
+            return
+        now = time.monotonic()
+        # the ids are assigned on insert but become visible on commit, not
+        # necessarily in order: scan up to the highest id now, and again the
+        # ids that were missing below it at the previous refreshes
+        top = Articles.objects.aggregate(top=Max("id"))["top"] or self.max_id
+        window_start = max(self.max_id, top - GAP_WINDOW)
+        rows = (
+            Articles.objects.filter(
+                Q(id__gt=self.max_id, id__lte=top) | Q(id__in=list(self.gaps)),
+            )
+            .order_by()
+            .values_list("id", "url")
+            .iterator(chunk_size=10000)
+        )
+        found = set()
+        for article_id, url in rows:
+            if url:
+                self.bloom.add(url)
+            if article_id > window_start or article_id in self.gaps:
+                found.add(article_id)
+        for article_id in range(window_start + 1, top + 1):
+            if article_id not in found:
+                self.gaps[article_id] = now
+        self.gaps = {
+            article_id: missed
+            for article_id, missed in self.gaps.items()
+            if article_id not in found and now - missed < GAP_TIMEOUT
+        }
+        self.max_id = max(self.max_id, top)
+        if self.bloom.count > self.bloom.capacity:
+            # too full to be selective any more
+            self.build()
+
+    def add(self, url: str) -> None:
+        if self.bloom is not None and url:
+            self.bloom.add(url)
+
+    def stored(self, urls: list[str]) -> set[str]:
+        """Return the subset of urls already stored in the DB."""
+        if self.bloom is None:
+            candidates = sorted(set(urls))
+        else:
+            candidates = sorted({url for url in urls if url in self.bloom})
+        found: set[str] = set()
+        for i in range(0, len(candidates), LOOKUP_BATCH_SIZE):
+            found.update(
+                Articles.objects.filter(
+                    url__in=candidates[i : i + LOOKUP_BATCH_SIZE],
+                ).values_list("url", flat=True),
+            )
+        return found
+
+
+seen_urls = SeenUrls()
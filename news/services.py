@@ -1,16 +1,432 @@
+import hashlib
+import http.client
+import json
+import logging
+import resource
+import socket
+import threading
+import time
+import unicodedata
+from collections import Counter
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import torch
+from django.conf import settings
+from django.core.cache import caches
 from sentence_transformers import SentenceTransformer
+from sentence_transformers import export_dynamic_quantized_onnx_model
+
+from news.embedding_text import CHARS_PER_TOKEN
+from news.embedding_text import prepare_text
+from news.embedding_text import strip_markup
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "sentence-transformers/use-cmlm-multilingual"
+
+# seconds the embedding server, or the shared cache of the embeddings, is left
+# alone after failing: the texts are then encoded in process
+SERVER_RETRY_SECONDS = 30
+
+# the inference backends of the model: PyTorch in fp32, ONNX Runtime in fp32
+# and ONNX Runtime with the weights quantized to int8 when the model is loaded
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def quantized_model(model_dir: Path, quantization: str, threads: int):
+    """
+    Return the model with its weights dynamically quantized to int8 for the
+    instruction set quantization (arm64, avx2, avx512 or avx512_vnni),
+    exporting it to model_dir the first time.
+    """
+    file_name = f"onnx/model_qint8_{quantization}.onnx"
+    if not (model_dir / file_name).exists():
+        model = SentenceTransformer(MODEL_NAME, backend="onnx")
+        model.save(str(model_dir))
+        export_dynamic_quantized_onnx_model(model, quantization, str(model_dir))
+    return SentenceTransformer(
+        str(model_dir),
+        backend="onnx",
+        model_kwargs={
+            "file_name": file_name,
+            **onnx_session_kwargs(threads),
+        },
+    )
+
+
+def onnx_session_kwargs(threads: int) -> dict:
+    if threads <= 0:
+        return {}
+    # imported by the ONNX backends only, sparing its memory to the others
+    import onnxruntime  # noqa: PLC0415
+
+    session_options = onnxruntime.SessionOptions()
+    session_options.intra_op_num_threads = threads
+    return {"session_options": session_options}
+
+
+def load_model(
+    backend: str,
+    threads: int = 0,
+    model_dir: Path | None = None,
+    quantization: str = "avx2",
+) -> SentenceTransformer:
+    """
+    Load the embedding model with the given backend, running its operators
+    on threads threads (0: the default of the backend).
+    """
+    if backend == "torch":
+        if threads > 0:
+            torch.set_num_threads(threads)
+        return SentenceTransformer(MODEL_NAME)
+    if backend == "onnx":
+        return SentenceTransformer(
+            MODEL_NAME,
+            backend="onnx",
+            model_kwargs=onnx_session_kwargs(threads),
+        )
+    if backend == "onnx-int8":
+        return quantized_model(
+            model_dir or Path(settings.EMBEDDINGS_MODEL_DIR),
+            quantization,
+            threads,
+        )
+    msg = f"Unknown embedding backend {backend}, expected one of {BACKENDS}"
+    raise ValueError(msg)
+
+
+@dataclass(frozen=True)
+class BackendOptions:
+    """How measure_backend loads the model and encodes the sentences."""
+
+    threads: int
+    batch_size: int
+    model_dir: Path
+    quantization: str
+
+
+def measure_backend(backend: str, sentences: list[str], options: BackendOptions):
+    """
+    Encode sentences with backend, returning the seconds taken, the peak
+    resident memory of the process in kB and the embeddings; meant to run
+    in a process of its own, for the peak memory to be that of backend.
+    """
+    model = load_model(
+        backend,
+        options.threads,
+        options.model_dir,
+        options.quantization,
+    )
+    batch_size = options.batch_size
+    # the first batch warms up the backend
+    model.encode(sentences[:batch_size], batch_size=batch_size)
+    start = time.perf_counter()
+    embeddings = model.encode(sentences, batch_size=batch_size)
+    seconds = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return seconds, peak_rss, embeddings
+
+
+def cosine_similarities(embeddings, reference):
+    """Return the cosine similarity of each embedding to its reference."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    reference = np.asarray(reference, dtype=np.float32)
+    return np.sum(embeddings * reference, axis=1) / (
+        np.linalg.norm(embeddings, axis=1) * np.linalg.norm(reference, axis=1)
+    )
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of the embeddings of short texts, such as search queries
+    and whitelists: an in-process LRU of EMBEDDINGS_CACHE_SIZE entries in
+    front of the shared "embeddings" cache, where they expire after
+    EMBEDDINGS_CACHE_TIMEOUT seconds. The keys hash the name of the model
+    with the text, normalized to NFC with its whitespace collapsed. While
+    the shared tier fails, the texts missing from the process are computed.
+    """
+
+    def __init__(self, model_name, size=None, timeout=None, shared=None):
+        self.model_name = model_name
+        self.size = settings.EMBEDDINGS_CACHE_SIZE if size is None else size
+        self.timeout = settings.EMBEDDINGS_CACHE_TIMEOUT if timeout is None else timeout
+        self.shared = caches["embeddings"] if shared is None else shared
+        self.shared_retry_at = 0.0
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = Counter()
+
+    def key(self, text, model_name=None):
+        normalized = " ".join(unicodedata.normalize("NFC", text).split())
+        model_name = self.model_name if model_name is None else model_name
+        digest = hashlib.sha256(f"{model_name}\n{normalized}".encode())
+        return f"embedding:{digest.hexdigest()}"
+
+    def get(self, text, compute, model_name=None):
+        """
+        Return the embedding of text, calling compute(text) on a miss; the
+        model_name given overrides the one of the cache.
+        """
+        key = self.key(text, model_name)
+        with self.lock:
+            embedding = self.local.get(key)
+            if embedding is not None:
+                self.local.move_to_end(key)
+                self.counters["local hits"] += 1
+                return embedding
+        data = self.shared_call(self.shared.get, key)
+        if data is not None:
+            embedding = np.frombuffer(data, dtype=np.float32)
+            counter = "shared hits"
+        else:
+            embedding = np.asarray(compute(text), dtype=np.float32)
+            self.shared_call(self.shared.set, key, embedding.tobytes(), self.timeout)
+            counter = "misses"
+        with self.lock:
+            self.counters[counter] += 1
+            self.local[key] = embedding
+            if len(self.local) > self.size:
+                self.local.popitem(last=False)
+        return embedding
+
+    def shared_call(self, method, *args):
+        """
+        Return method(*args), or None if the shared cache fails, in which
+        case it is left alone for SERVER_RETRY_SECONDS.
+        """
+        if time.monotonic() < self.shared_retry_at:
+            return None
+        try:
+            return method(*args)
+        # whatever the backend of the shared cache raises
+        except Exception:  # noqa: BLE001
+            logger.warning("Shared embeddings cache unavailable", exc_info=True)
+            self.shared_retry_at = time.monotonic() + SERVER_RETRY_SECONDS
+            return None
+
+    def report(self):
+        lookups = self.counters.total()
+        hits = lookups - self.counters["misses"]
+        ratio = 100 * hits / lookups if lookups else 0.0
+        return (
+            f"{self.counters['local hits']} local hits, "
+            f"{self.counters['shared hits']} shared hits, "
+            f"{self.counters['misses']} misses ({ratio:.0f}% hit ratio)"
+        )
+
+
+class EmbeddingServerError(Exception):
+    pass
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class EmbeddingServerClient:
+    """Client of news.embedding_server at url: http://host:port or unix:/path."""
+
+    def __init__(self, url, timeout=None):
+        self.url = url
+        self.timeout = settings.EMBEDDING_SERVER_TIMEOUT if timeout is None else timeout
+
+    def connection(self, timeout):
+        if self.url.startswith("unix:"):
+            return UnixHTTPConnection(self.url.removeprefix("unix:"), timeout)
+        host = self.url.removeprefix("http://").rstrip("/")
+        return http.client.HTTPConnection(host, timeout=timeout)
+
+    def request(self, method, path, body=None, timeout=None):
+        connection = self.connection(self.timeout if timeout is None else timeout)
+        try:
+            connection.request(
+                method,
+                path,
+                body=body,
+                headers={"Content-Type": "application/json"},
+            )
+            response = connection.getresponse()
+            data = response.read()
+            if response.status != http.client.OK:
+                msg = f"Embedding server answered {response.status}: {data[:200]!r}"
+                raise EmbeddingServerError(msg)
+            return response, data
+        finally:
+            connection.close()
+
+    def embed(self, inputs, timeout=None):
+        response, data = self.request(
+            "POST",
+            "/embed",
+            json.dumps({"inputs": inputs}).encode(),
+            timeout,
+        )
+        shape = tuple(
+            int(size) for size in response.getheader("X-Embedding-Shape").split(",")
+        )
+        return np.frombuffer(data, dtype=np.float32).reshape(shape)
+
+    def info(self):
+        # answered at once, even while the server is encoding
+        return json.loads(
+            self.request(
+                "GET",
+                "/info",
+                timeout=settings.EMBEDDING_SERVER_QUERY_TIMEOUT,
+            )[1],
+        )
 
 
 class TextEmbeddingService:
     _instance = None
+    _lock = threading.Lock()
+    _model = None
+    _max_seq_length = None
+    _server_info = None
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
-            cls._instance.model = SentenceTransformer(
-                "sentence-transformers/use-cmlm-multilingual",
+            # keyed by the backend that encoded each query, see embed_query
+            cls._instance.query_cache = EmbeddingCache(MODEL_NAME)
+            # with a server, the model is only loaded here if it fails
+            cls._instance.server = (
+                EmbeddingServerClient(settings.EMBEDDING_SERVER_URL)
+                if settings.EMBEDDING_SERVER_URL
+                else None
             )
+            cls._instance.server_retry_at = 0.0
         return cls._instance
 
-    def get_embedding(self, text):
-        return self.model.encode(text)
+    def from_server(self, call):
+        """
+        Return call(self.server), or None if there is no server or it fails,
+        in which case it is left alone for SERVER_RETRY_SECONDS.
+        """
+        if self.server is None or time.monotonic() < self.server_retry_at:
+            return None
+        try:
+            return call(self.server)
+        except (OSError, http.client.HTTPException, EmbeddingServerError):
+            logger.warning(
+                "Embedding server unavailable, encoding in process",
+                exc_info=True,
+            )
+            self.server_retry_at = time.monotonic() + SERVER_RETRY_SECONDS
+            # it may come back with another backend
+            self._server_info = None
+            return None
+
+    def server_info(self):
+        """The GET /info of the server, None if there is no server or it fails."""
+        if self._server_info is None:
+            self._server_info = self.from_server(lambda server: server.info())
+        return self._server_info
+
+    @property
+    def model(self):
+        # loaded on first use, so that the cached queries need no model at all
+        with self._lock:
+            if self._model is None:
+                self._model = load_model(
+                    settings.EMBEDDINGS_BACKEND,
+                    threads=settings.EMBEDDINGS_THREADS,
+                    quantization=settings.EMBEDDINGS_QUANTIZATION,
+                )
+        return self._model
+
+    @property
+    def max_chars(self):
+        # the window of the model, in characters
+        if self._max_seq_length is None:
+            info = self.server_info()
+            self._max_seq_length = (
+                info["max_seq_length"] if info else self.model.max_seq_length
+            )
+        return self._max_seq_length * CHARS_PER_TOKEN
+
+    def get_embedding(self, text, timeout=None):
+        """
+        Embed a text or a list of texts, on the server if there is one, which
+        is waited for timeout seconds (default: EMBEDDING_SERVER_TIMEOUT).
+        """
+        single = isinstance(text, str)
+        embeddings = self.from_server(
+            lambda server: server.embed([text] if single else list(text), timeout),
+        )
+        if embeddings is not None:
+            return embeddings[0] if single else embeddings
+        return self.model.encode(
+            text,
+            batch_size=settings.EMBEDDINGS_ENCODE_BATCH_SIZE,
+        )
+
+    def prepare(self, title, content):
+        """Return the inputs of the model for an article (see prepare_text)."""
+        return prepare_text(
+            title,
+            content,
+            settings.EMBEDDINGS_TEXT_STRATEGY,
+            self.max_chars,
+            settings.EMBEDDINGS_MAX_CHUNKS,
+        )
+
+    def prepare_query(self, query):
+        return strip_markup(query, self.max_chars)
+
+    def embed_query(self, query):
+        """
+        Embed a short text, such as a search query, through the cache, where
+        it is keyed by the backend that encoded it: the server may not run
+        the backend of this process.
+        """
+        info = self.server_info()
+        if info is not None:
+            # a search is waiting for it: do not wait for the server as long
+            # as the batches of the backfill may take
+            embedding = self.from_server(
+                lambda server: self.query_cache.get(
+                    query,
+                    lambda text: server.embed(
+                        [self.prepare_query(text)],
+                        settings.EMBEDDING_SERVER_QUERY_TIMEOUT,
+                    )[0],
+                    f"{MODEL_NAME}:{info['backend']}",
+                ),
+            )
+            if embedding is not None:
+                return embedding
+        return self.query_cache.get(
+            query,
+            lambda text: self.model.encode(
+                self.prepare_query(text),
+                batch_size=settings.EMBEDDINGS_ENCODE_BATCH_SIZE,
+            ),
+            f"{MODEL_NAME}:{settings.EMBEDDINGS_BACKEND}",
+        )
+
+    def embed_texts(self, texts):
+        """
+        Embed each list of inputs returned by prepare, as the mean of the
+        embeddings of its chunks.
+        """
+        inputs = [chunk for chunks in texts for chunk in chunks]
+        embeddings = self.get_embedding(inputs)
+        if len(inputs) == len(texts):
+            return embeddings
+        means = []
+        start = 0
+        for chunks in texts:
+            means.append(np.mean(embeddings[start : start + len(chunks)], axis=0))
+            start += len(chunks)
+        return np.stack(means)
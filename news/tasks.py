@@ -1,25 +1,25 @@
 import datetime
-import html
 import logging
-import os
-import time
 
-import psycopg
 import torch
-from bs4 import BeautifulSoup
 from celery import shared_task
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.postgres.search import SearchQuery
 from django.core.cache import cache
-from pgvector.django import CosineDistance
-from pgvector.psycopg import register_vector
-from psycopg.rows import dict_row
+from django.db import connection
+from django.db import transaction
 
 import poller
+from news.embedder import EmbeddingPipeline
+from news.models import HNSW_MAX_EF_SEARCH
+from news.models import ArticleEmbeddings
 from news.models import Articles
 from news.models import Feeds
 from news.models import UserArticleLists
 from news.models import UserFeeds
+from news.models import hnsw_candidates
+from news.scheduler import Scheduler
 from news.services import TextEmbeddingService
 
 logger = logging.getLogger(__name__)
@@ -30,14 +30,34 @@ time_format = "%Y-%m-%dT%H:%M:%SZ"
 def poll():
     logger.info("Polling started")
     feeds = Feeds.objects.order_by("id").all()
-    for feed in feeds:
-        logger.info(f"= Polling feed: {feed.id}")
-        p = poller.Poller(feed)
-        p.poll()
-    logger.info("Polling finished")
+    pollers = [poller.Poller(feed) for feed in feeds]
+    engine = poller.PollingEngine()
+    engine.run(pollers)
+    logger.info(
+        f"Polling finished: {sum(p.retrieved for p in pollers)} retrieved, "
+        f"{sum(p.failed for p in pollers)} failed, "
+        f"{sum(p.stored for p in pollers)} stored",
+    )
     cache.clear()
 
 
+@shared_task(time_limit=3550, soft_time_limit=3500)
+def poll_due():
+    feeds = Scheduler().claim_due()
+    if not feeds:
+        return
+    logger.info(f"Polling {len(feeds)} due feeds")
+    pollers = [poller.Poller(feed) for feed in feeds]
+    poller.PollingEngine().run(pollers)
+    stored = sum(p.stored for p in pollers)
+    logger.info(
+        f"Polling due feeds finished: {sum(p.retrieved for p in pollers)} "
+        f"retrieved, {sum(p.failed for p in pollers)} failed, {stored} stored",
+    )
+    if stored:
+        cache.clear()
+
+
 def precompute_user(user, start_timestamp, embedding_service):
     logger.info(f"= Precomputing user: {user.id}")
     newsfeed_list = UserArticleLists.objects.filter(
@@ -79,21 +99,18 @@ def precompute_user(user, start_timestamp, embedding_service):
         gravity = user.profile.gravity
         terms = " ".join(user.profile.whitelist)
         logger.info(f"== filtering and sorting by whitelist: {terms}")
-        embedding = embedding_service.get_embedding(terms)
-        qs = (
-            qs.alias(
-                distance=CosineDistance(
-                    "use_cmlm_multilingual",
-                    embedding,
-                ),
-            )
-            .filter(distance__lt=gravity)
-            .order_by("distance")[:10000]
-        )
+        embedding = embedding_service.embed_query(terms)
+        # through the HNSW index, which returns HNSW_MAX_EF_SEARCH rows at most
+        nearest = ArticleEmbeddings.objects.nearest(
+            embedding,
+            ArticleEmbeddings.USE_CMLM_MULTILINGUAL,
+        ).filter(article__in=qs, distance__lt=gravity)[:HNSW_MAX_EF_SEARCH]
+        qs = qs.filter(id__in=nearest.values("article_id"))
         filtered = True
 
     if filtered:
-        sorted_articles = sorted(qs, key=lambda a: a.id, reverse=True)
+        with hnsw_candidates(HNSW_MAX_EF_SEARCH, qs.db):
+            sorted_articles = sorted(qs, key=lambda a: a.id, reverse=True)
         for article in list(sorted_articles)[:200]:
             newsfeed_list.articles.add(article.id)
 
@@ -111,169 +128,169 @@ def precompute():
     for user in users:
         precompute_user(user, two_months_ago, embedding_service)
 
+    logger.info(f"Whitelist embeddings: {embedding_service.query_cache.report()}")
     logger.info("Precomputing finished")
     cache.clear()
 
 
-def clean_html(raw_html):
-    # Remove HTML tags
-    soup = BeautifulSoup(raw_html, "html.parser")
-    text = soup.get_text()
-    # Convert HTML entities to characters
-    return html.unescape(text)
-
-
-def embed(n):
-    postgres_host = os.environ["POSTGRES_HOST"]
-    postgres_port = os.environ["POSTGRES_PORT"]
-    postgres_db = os.environ["POSTGRES_DB"]
-    postgres_user = os.environ["POSTGRES_USER"]
-    postgres_password = os.environ["POSTGRES_PASSWORD"]
-
-    with psycopg.connect(
-        conninfo=f"postgresql://{postgres_user}:{postgres_password}@{postgres_host}:{postgres_port}/{postgres_db}",
-        row_factory=dict_row,
-    ) as conn:
-        register_vector(conn)
-        with conn.cursor() as cur:
-            logger.info(f"  ========== embedding {n} records")
-            cur.execute(
-                """
-                SELECT COUNT(*)
-                FROM articles
-                WHERE use_cmlm_multilingual IS NOT NULL
-                """,
-            )
-            before = cur.fetchone()
-            logger.info(f"  processed articles before: {before['count']}")
+@shared_task(time_limit=1750, soft_time_limit=1600)
+def embeddings():
+    logger.info(f"Embedding started at: {datetime.datetime.now(tz=datetime.UTC)}")
+    logger.info(f"= PyTorch Version: {torch.__version__}")
+    logger.info(f"= CPU Available: {torch.cpu.is_available()}")
+    logger.info(f"= GPU Available: {torch.cuda.is_available()}")
+    logger.info(
+        f"= Apple M1 MPS available: {torch.backends.mps.is_available()}",
+    )
 
-            start_time = time.perf_counter()
-            cur.execute(
-                """
-                SELECT
-                    id,
-                    (CASE
-                        WHEN language = 'it' THEN title
-                        ELSE title_original END
-                    ) as title,
-                    (CASE
-                        WHEN language = 'it' THEN content
-                        ELSE content_original END
-                    ) AS content
-                FROM articles
-                WHERE use_cmlm_multilingual IS NULL
-                ORDER BY id DESC
-                LIMIT %(n)s
-                """,
-                {"n": n},
-            )
-            articles = cur.fetchall()
+    # what is committed before a failure is kept, the next run resumes from there
+    embedded = 0
+    try:
+        embedded = EmbeddingPipeline().run()
+    except ConnectionError:
+        logging.exception("Database connection error")
+    except Exception:
+        logging.exception("Generic exception")
 
-            sentences = [
-                article["title"] + " - " + clean_html(article["content"])
-                for article in articles
-            ]
-            end_time = time.perf_counter()
-            execution_time = end_time - start_time
-            logger.info(f"  DB reading took: {execution_time:.4f} seconds")
+    logger.info(
+        f"Embedding completed at: {datetime.datetime.now(tz=datetime.UTC)}, "
+        f"{embedded} articles embedded",
+    )
 
-            start_time = time.perf_counter()
 
-            embedding_service = TextEmbeddingService()
-            embeddings_use_cmlm_multilingual = embedding_service.get_embedding(
-                sentences,
+@shared_task(time_limit=1750, soft_time_limit=1600)
+def reconcile_articles_data():
+    """
+    Repair any drift of the counters in articles_data, kept up to date by
+    the triggers with delta arithmetic, recomputing them from scratch.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        # articles whose data is missing altogether
+        cursor.execute(
+            """
+            INSERT INTO articles_data (id, length, excerpt)
+            SELECT
+                articles.id,
+                COALESCE(LENGTH(articles.content), LENGTH(articles.content_original)),
+                SUBSTRING((CASE WHEN LENGTH(TRIM(articles.content)) > 0
+                    THEN articles.content
+                    ELSE articles.content_original END) FOR 500)
+            FROM articles
+            WHERE NOT EXISTS (
+                SELECT 1 FROM articles_data WHERE articles_data.id = articles.id
             )
-
-            end_time = time.perf_counter()
-            execution_time = end_time - start_time
-            logger.info(f"  model encode: {execution_time:.4f} seconds")
-
-    start_time = time.perf_counter()
-
-    with psycopg.connect(
-        conninfo=f"postgresql://no_triggers:no_triggers@{postgres_host}:{postgres_port}/{postgres_db}",
-    ) as conn:
-        register_vector(conn)
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                CREATE TEMPORARY TABLE articles_temp (
-                    id INTEGER,
-                    use_cmlm_multilingual halfvec
-                ) ON COMMIT DROP
+            ON CONFLICT (id) DO NOTHING
             """,
+        )
+        inserted = cursor.rowcount
+        cursor.execute(
+            """
+            WITH user_stats AS (
+                SELECT
+                    article_id,
+                    COUNT(*) FILTER (WHERE read) AS reads,
+                    SUM(rating) AS rating_sum,
+                    COUNT(*) AS rating_count
+                FROM news_userarticles
+                GROUP BY article_id
+            ), list_stats AS (
+                SELECT news_articlelists.article_id, COUNT(*) AS to_reads
+                FROM news_articlelists
+                JOIN news_userarticlelists
+                    ON news_articlelists.list_id = news_userarticlelists.id
+                WHERE NOT news_userarticlelists.automatic
+                GROUP BY news_articlelists.article_id
+            ), expected AS (
+                SELECT
+                    articles_data.id,
+                    COALESCE(user_stats.reads, 0)
+                        + COALESCE(news_guestarticles.views, 0) AS views,
+                    COALESCE(user_stats.rating_sum, 0) AS rating_sum,
+                    COALESCE(user_stats.rating_count, 0) AS rating_count,
+                    COALESCE(list_stats.to_reads, 0) AS to_reads
+                FROM articles_data
+                LEFT JOIN user_stats
+                    ON user_stats.article_id = articles_data.id
+                LEFT JOIN news_guestarticles
+                    ON news_guestarticles.article_id = articles_data.id
+                LEFT JOIN list_stats
+                    ON list_stats.article_id = articles_data.id
             )
+            UPDATE articles_data
+            SET
+                views = expected.views,
+                rating = CASE
+                    WHEN expected.rating_count > 0
+                    THEN expected.rating_sum::numeric / expected.rating_count
+                    ELSE 0
+                END,
+                to_reads = expected.to_reads,
+                rating_sum = expected.rating_sum,
+                rating_count = expected.rating_count
+            FROM expected
+            WHERE articles_data.id = expected.id
+                AND (
+                    articles_data.views,
+                    articles_data.rating_sum,
+                    articles_data.rating_count,
+                    articles_data.to_reads
+                ) IS DISTINCT FROM (
+                    expected.views,
+                    expected.rating_sum,
+                    expected.rating_count,
+                    expected.to_reads
+                )
+            """,
+        )
+        repaired = cursor.rowcount
+    logger.info(
+        f"Articles data reconciled: {inserted} missing and {repaired} drifted rows",
+    )
 
-            with cur.copy(
-                """
-                COPY articles_temp (
-                        id,
-                        use_cmlm_multilingual
-                    )
-                FROM STDIN WITH (FORMAT BINARY)""",
-            ) as copy:
-                # use set_types for binary copy
-                # https://www.psycopg.org/psycopg3/docs/basic/copy.html#binary-copy
-                copy.set_types(["integer", "halfvec", "halfvec"])
-
-                for index, article in enumerate(articles):
-                    copy.write_row(
-                        [
-                            article["id"],
-                            embeddings_use_cmlm_multilingual[index],
-                        ],
-                    )
-
-            cur.execute(
-                """
-                UPDATE articles a
-                SET use_cmlm_multilingual = t.use_cmlm_multilingual
-                FROM articles_temp t
-                WHERE a.id = t.id
-                """,
-            )
-
-            end_time = time.perf_counter()
-            execution_time = end_time - start_time
-            logger.info(f"  DB writing: {execution_time:.4f} seconds")
 
-            cur.execute(
+@shared_task(time_limit=1750, soft_time_limit=1600)
+def maintain_article_partitions():
+    """
+    Create the partitions of articles for this month and the next one, and
+    detach the monthly partitions older than ARTICLES_RETENTION_MONTHS.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT articles_create_partition(month::date)
+            FROM generate_series(
+                date_trunc('month', now() AT TIME ZONE 'UTC'),
+                date_trunc('month', now() AT TIME ZONE 'UTC') + interval '1 month',
+                interval '1 month'
+            ) AS month
+            """,
+        )
+        created = [row[0] for row in cursor.fetchall()]
+        detached = []
+        if settings.ARTICLES_RETENTION_MONTHS > 0:
+            cursor.execute(
                 """
-                SELECT COUNT(*)
-                FROM articles
-                WHERE use_cmlm_multilingual IS NOT NULL
+                SELECT child.relname
+                FROM pg_inherits
+                JOIN pg_class AS parent ON parent.oid = pg_inherits.inhparent
+                JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+                WHERE parent.relname = 'articles'
+                    AND child.relname ~ '^articles_p[0-9]{4}_[0-9]{2}$'
+                    AND to_date(substr(child.relname, 11), 'YYYY_MM')
+                        < date_trunc('month', now() AT TIME ZONE 'UTC')
+                            - make_interval(months => %s)
+                ORDER BY child.relname
                 """,
+                [settings.ARTICLES_RETENTION_MONTHS],
             )
-            after = cur.fetchone()
-            logger.info(f"  processed articles after: {after[0]}")
-            return len(articles)
-
-
-@shared_task(time_limit=1750, soft_time_limit=1600)
-def embeddings():
-    logger.info(f"Embedding started at: {datetime.datetime.now(tz=datetime.UTC)}")
-    logger.info(f"= PyTorch Version: {torch.__version__}")
-    logger.info(f"= CPU Available: {torch.cpu.is_available()}")
-    logger.info(f"= GPU Available: {torch.cuda.is_available()}")
+            detached = [row[0] for row in cursor.fetchall()]
+            for partition in detached:
+                cursor.execute("SELECT articles_detach_partition(%s)", [partition])
     logger.info(
-        f"= Apple M1 MPS available: {torch.backends.mps.is_available()}",
+        f"Article partitions maintained: {', '.join(created)} present, "
+        f"{len(detached)} detached",
     )
 
-    iterations = 1000
-    articles_per_iterations = 1000
-    for i in range(iterations):
-        logger.info(f"= Loop {i}")
-        try:
-            updated = embed(articles_per_iterations)
-            if updated < articles_per_iterations:
-                break
-        except ConnectionError:
-            logging.exception("Database connection error")
-        except Exception:
-            logging.exception("Generic exception")
-
-    logger.info(f"Embedding completed at: {datetime.datetime.now(tz=datetime.UTC)}")
-
 
 @shared_task(time_limit=3550, soft_time_limit=3500)
 def run_mastodon_bots():
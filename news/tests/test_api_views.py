@@ -1,14 +1,18 @@
 # ruff: noqa: PLR2004, S106, S311
+import datetime
 import random
 import string
 from unittest import mock
 
 from django.core.cache import cache
+from django.db import connection
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework.test import APITestCase
 
 from flash.users.models import User
+from news.api.views import KeysetPagination
+from news.models import ArticleEmbeddings
 from news.models import Articles
 from news.models import ArticlesData
 from news.models import Feeds
@@ -22,7 +26,7 @@ def create_articles(feed, n):
             feed=feed,
             title=f"Article F1 {i+1}",
             content_original=f"Content F1 {i+1}",
-            url=f"http://example.com/article_f1_{i+1}",
+            url=f"http://example.com/article_f{feed.id}_{i+1}",
             stamp=timezone.now() - timezone.timedelta(hours=410 - i),
         )
         article_data = ArticlesData.objects.get(id=article)
@@ -83,19 +87,19 @@ class ArticleAPITests(APITestCase):
         ), "Initial number of articles should be 200."
 
     @mock.patch(
-        "news.tasks.poller.Poller",
-    )  # Mock the Poller class used within the poll_task
-    def test_articles_list_cache_invalidation_after_polling(self, mock_poller_class):
+        "news.tasks.poller.PollingEngine",
+    )  # Mock the PollingEngine class used within the poll_task
+    def test_articles_list_cache_invalidation_after_polling(self, mock_engine_class):
         """
         Test cache invalidation: new articles appear in the list after polling.
         Assumes poll_task clears the cache and new data is available.
         """
         url = reverse("api:articles-list")
 
-        # Mock the poller's behavior.
-        mock_poller_instance = mock_poller_class.return_value
-        mock_poller_instance.poll.return_value = (
-            None  # Simulate poll() completing its run.
+        # Mock the polling engine's behavior.
+        mock_engine_instance = mock_engine_class.return_value
+        mock_engine_instance.run.return_value = (
+            None  # Simulate run() completing its run.
         )
 
         # 1. Initial request, populates cache.
@@ -182,6 +186,146 @@ class ArticleAPITests(APITestCase):
         # Page 1 fetched twice (after cache clear) should have the SAME order
         assert page1_ids == page1_again_ids
 
+    @mock.patch.object(KeysetPagination, "page_size", 50)
+    def test_articles_list_keyset_pagination(self):
+        """
+        Test cursor pagination follows -id and only estimates the total on request.
+        """
+        url = reverse("api:articles-list")
+
+        response_page1 = self.client.get(url, {"pagination": "cursor"})
+        assert response_page1.status_code == 200
+        assert "count" not in response_page1.data
+        page1_ids = [article["id"] for article in response_page1.data["results"]]
+        assert len(page1_ids) == 50
+        assert page1_ids == sorted(page1_ids, reverse=True)
+
+        response_page2 = self.client.get(response_page1.data["next"])
+        assert response_page2.status_code == 200
+        page2_ids = [article["id"] for article in response_page2.data["results"]]
+        assert len(page2_ids) == 50
+        assert max(page2_ids) < min(page1_ids)
+
+        response_count = self.client.get(url, {"pagination": "cursor", "count": "true"})
+        assert isinstance(response_count.data["count"], int)
+
+    def test_favorites_without_favorites_keep_the_pagination_shape(self):
+        """
+        Test an empty favorites list is paginated like a full one, in either mode.
+        """
+        url = reverse("api:articles-favorites")
+
+        response = self.client.get(url)
+        assert response.status_code == 200
+        assert response.data == {
+            "count": 0,
+            "next": None,
+            "previous": None,
+            "results": [],
+        }
+
+        response = self.client.get(url, {"pagination": "cursor"})
+        assert response.status_code == 200
+        assert response.data == {"next": None, "previous": None, "results": []}
+
+        response = self.client.get(url, {"pagination": "cursor", "count": "true"})
+        assert response.data["count"] == 0
+
+    def test_articles_related_through_embeddings(self):
+        """
+        Test related articles are looked up in the embeddings table.
+        """
+        source, near, far = self.articles_feed1[:3]
+        for article, vector in (
+            (source, [1.0, 0.0]),
+            (near, [1.0, 0.1]),
+            (far, [0.0, 1.0]),
+        ):
+            ArticleEmbeddings.objects.create(
+                article=article,
+                stamp=article.stamp,
+                model=ArticleEmbeddings.USE_CMLM_MULTILINGUAL,
+                embedding=vector + [0.0] * 766,
+            )
+
+        response = self.client.get(
+            reverse("api:articles-related", kwargs={"pk": source.id}),
+        )
+        assert response.status_code == 200
+        assert [article["id"] for article in response.data] == [far.id, near.id]
+
+        response = self.client.get(
+            reverse("api:articles-related", kwargs={"pk": far.id + 1}),
+        )
+        assert response.status_code == 200
+        assert response.data == []
+
+    @mock.patch("news.api.views.SEARCH_CANDIDATES", 50)
+    @mock.patch("news.api.views.TextEmbeddingService")
+    def test_detached_articles_leave_the_nearest_embeddings(self, service):
+        """
+        Test the embeddings of a detached partition leave with its articles,
+        rather than taking the nearest places from the recent articles.
+        """
+        service.return_value.embed_query.return_value = [1.0, 0.0] + [0.0] * 766
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT child.relname
+                FROM pg_inherits
+                JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+                WHERE pg_inherits.inhparent = 'articles'::regclass
+                    AND child.relname ~ '^articles_p[0-9]{4}_[0-9]{2}$'
+                ORDER BY child.relname
+                LIMIT 1
+                """,
+            )
+            partition = cursor.fetchone()[0]
+        month = datetime.datetime.strptime(partition, "articles_p%Y_%m").replace(
+            day=2,
+            tzinfo=datetime.UTC,
+        )
+        old = [
+            Articles.objects.create(
+                feed=self.feed1,
+                title=f"Old {i}",
+                url=f"http://example.com/old_{i}",
+                stamp=month,
+            )
+            for i in range(100)
+        ]
+        source, near, nearer = self.articles_feed1[-3:]
+        for article, vector in (
+            *((article, [1.0, 0.001]) for article in old),
+            (source, [1.0, 0.0]),
+            (near, [1.0, 0.3]),
+            (nearer, [1.0, 0.2]),
+        ):
+            ArticleEmbeddings.objects.create(
+                article=article,
+                stamp=article.stamp,
+                model=ArticleEmbeddings.USE_CMLM_MULTILINGUAL,
+                embedding=vector + [0.0] * 766,
+            )
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT articles_detach_partition(%s)", [partition])
+
+        response = self.client.get(
+            reverse("api:articles-related", kwargs={"pk": source.id}),
+        )
+        assert response.status_code == 200
+        assert [article["id"] for article in response.data] == [nearer.id, near.id]
+
+        response = self.client.get(
+            reverse("api:articles-search", kwargs={"pk": "query"}),
+        )
+        assert response.status_code == 200
+        assert [article["id"] for article in response.data["results"]] == [
+            source.id,
+            nearer.id,
+            near.id,
+        ]
+
     def test_articles_list_filtering(self):
         """
         Test filtering works correctly.
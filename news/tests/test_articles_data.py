@@ -0,0 +1,126 @@
+import datetime
+
+import pytest
+from django.db import IntegrityError
+from django.db import connection
+from django.db import transaction
+from django.utils import timezone
+
+from flash.users.models import User
+from news.models import ArticleLists
+from news.models import Articles
+from news.models import ArticlesData
+from news.models import GuestArticles
+from news.models import UserArticleLists
+from news.models import UserArticles
+from news.tasks import reconcile_articles_data
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(username="reader", password="password")  # noqa: S106
+
+
+@pytest.mark.django_db
+def test_triggers_keep_articles_data_up_to_date(user):
+    article = Articles.objects.create(
+        feed_id=1,
+        url="http://example.com/counted",
+        content_original="<p>text</p>",
+    )
+    data = ArticlesData.objects.get(id=article)
+    assert (data.views, data.rating, data.to_reads) == (0, 0, 0)
+    assert data.length == len("<p>text</p>")
+
+    user_article = UserArticles.objects.create(user=user, article=article, read=True)
+    user_article.rating = 4
+    user_article.save()
+    GuestArticles.objects.create(article=article, views=2)
+    to_read = UserArticleLists.objects.create(user=user, name="to-read")
+    ArticleLists.objects.create(article=article, list=to_read)
+    automatic = UserArticleLists.objects.create(
+        user=user,
+        name="newsfeed",
+        automatic=True,
+    )
+    ArticleLists.objects.create(article=article, list=automatic)
+
+    data.refresh_from_db()
+    assert (data.views, data.rating, data.to_reads) == (3, 4, 1)
+    assert (data.rating_sum, data.rating_count) == (4, 1)
+
+    user_article.delete()
+    to_read.automatic = True
+    to_read.save()
+    data.refresh_from_db()
+    assert (data.views, data.rating, data.to_reads) == (2, 0, 0)
+
+
+@pytest.mark.django_db
+def test_user_articles_written_through_the_orm(user):
+    # the article_id of the rows is a bigint, like the id of the articles
+    article = Articles.objects.create(feed_id=1, url="http://example.com/rated")
+    UserArticles.objects.create(user=user, article=article, read=True, rating=3)
+    UserArticles.objects.filter(article=article).update(rating=5)
+    data = ArticlesData.objects.get(id=article)
+    assert (data.views, data.rating, data.rating_count) == (1, 5, 1)
+
+
+@pytest.mark.django_db
+def test_reconcile_articles_data_repairs_drift(user):
+    article = Articles.objects.create(feed_id=1, url="http://example.com/drift")
+    UserArticles.objects.create(user=user, article=article, read=True, rating=2)
+    ArticlesData.objects.filter(id=article).update(views=100, rating=5, rating_count=7)
+
+    reconcile_articles_data()
+
+    data = ArticlesData.objects.get(id=article)
+    assert (data.views, data.rating, data.rating_sum, data.rating_count) == (
+        1,
+        2,
+        2,
+        1,
+    )
+
+
+@pytest.mark.django_db
+def test_statement_triggers_follow_bulk_writes():
+    Articles.objects.bulk_create(
+        [
+            Articles(feed_id=1, url=f"http://example.com/bulk/{i}", content="<p>a</p>")
+            for i in range(3)
+        ],
+    )
+    articles = Articles.objects.filter(url__startswith="http://example.com/bulk/")
+    data = ArticlesData.objects.filter(id__in=articles)
+    assert sorted(data.values_list("length", flat=True)) == [8, 8, 8]
+
+    articles.update(content="<p>longer</p>")
+    assert sorted(data.values_list("length", flat=True)) == [13, 13, 13]
+
+
+@pytest.mark.django_db
+def test_articles_move_to_the_partition_of_their_month():
+    stamp = timezone.now() + datetime.timedelta(days=400)
+    article = Articles.objects.create(
+        feed_id=1,
+        url="http://example.com/future",
+        stamp=stamp,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT articles_create_partition(%s)", [stamp.date()])
+        partition = cursor.fetchone()[0]
+        cursor.execute(f"SELECT id FROM {partition}")  # noqa: S608
+        assert cursor.fetchall() == [(article.id,)]
+    assert ArticlesData.objects.filter(id=article).exists()
+
+
+@pytest.mark.django_db
+def test_article_urls_are_unique_across_partitions():
+    Articles.objects.create(feed_id=1, url="http://example.com/once")
+    with pytest.raises(IntegrityError), transaction.atomic():
+        Articles.objects.create(
+            feed_id=1,
+            url="http://example.com/once",
+            stamp=timezone.now() - datetime.timedelta(days=3650),
+        )
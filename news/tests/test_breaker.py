@@ -0,0 +1,87 @@
+import datetime
+
+import pytest
+from django.utils import timezone
+
+from news import breaker
+from news.models import FeedBreaker
+from news.models import FeedPolling
+from news.models import Feeds
+
+
+def test_parse_retry_after():
+    now = timezone.now()
+    assert breaker.parse_retry_after(None) is None
+    assert breaker.parse_retry_after("soon") is None
+    in_two_minutes = breaker.parse_retry_after("120")
+    assert in_two_minutes - now >= datetime.timedelta(seconds=120)
+    assert breaker.parse_retry_after(
+        "Wed, 21 Oct 2015 07:28:00 GMT",
+    ) == datetime.datetime(2015, 10, 21, 7, 28, tzinfo=datetime.UTC)
+
+
+def _poll(feed, http_status_code, retry_after=None):
+    now = timezone.now()
+    FeedPolling.objects.create(
+        feed=feed,
+        poll_start_time=now,
+        poll_end_time=now,
+        http_status_code=http_status_code,
+        articles_retrieved=0,
+        articles_failed=0,
+        articles_stored=0,
+    )
+    return breaker.record(feed, http_status_code, retry_after)
+
+
+@pytest.mark.django_db
+def test_breaker_opens_probes_and_closes(settings):
+    settings.POLLER_BREAKER_THRESHOLD = 3
+    feed = Feeds.objects.create(url="https://example.com/feed", active=True)
+
+    assert _poll(feed, -20).state == FeedBreaker.CLOSED
+    assert _poll(feed, 503).state == FeedBreaker.CLOSED
+    state = _poll(feed, -10)
+    assert state.state == FeedBreaker.OPEN
+    assert state.failures == 3  # noqa: PLR2004
+    assert state.reason == "timeout"
+    assert breaker.allow(feed) is not None
+
+    # once the backoff has elapsed a single probe is let through
+    state.opened_until = timezone.now()
+    state.save()
+    assert breaker.allow(feed) is None
+    assert FeedBreaker.objects.get(feed=feed).state == FeedBreaker.HALF_OPEN
+    probing = breaker.allow(feed)
+    assert probing.state == FeedBreaker.HALF_OPEN
+    assert probing.opened_until - timezone.now() > datetime.timedelta(
+        seconds=settings.POLLER_CLAIM_LEASE - 60,
+    )
+    assert _poll(feed, 200).state == FeedBreaker.CLOSED
+    assert breaker.allow(feed) is None
+
+
+@pytest.mark.django_db
+def test_breaker_honours_retry_after():
+    feed = Feeds.objects.create(url="https://example.com/feed", active=True)
+    state = _poll(feed, 429, "7200")
+    assert state.state == FeedBreaker.OPEN
+    assert state.opened_until - timezone.now() > datetime.timedelta(hours=1)
+
+
+@pytest.mark.django_db
+def test_breaker_probes_again_if_the_probe_is_lost(settings):
+    settings.POLLER_BREAKER_THRESHOLD = 1
+    feed = Feeds.objects.create(url="https://example.com/feed", active=True)
+    _poll(feed, -20)
+    FeedBreaker.objects.filter(feed=feed).update(opened_until=timezone.now())
+    assert breaker.allow(feed) is None
+    assert breaker.allow(feed) is not None
+
+    # the poller probing the feed died before recording the outcome
+    FeedBreaker.objects.filter(feed=feed).update(opened_until=timezone.now())
+    assert breaker.allow(feed) is None
+    assert breaker.allow(feed) is not None
+
+    state = _poll(feed, -20)
+    assert state.state == FeedBreaker.OPEN
@@ -0,0 +1,257 @@
+import contextlib
+import threading
+import time
+
+import pytest
+from django.db import connection
+
+from news import embedder
+from news.embedder import EmbeddingPipeline
+from news.embedder import IngestEmbedder
+from news.embedder import close_embedding_pool
+from news.models import ArticleEmbeddings
+from news.models import Articles
+from news.models import Feeds
+from news.models import hnsw_candidates
+from news.services import TextEmbeddingService
+
+
+class FakeEmbeddingService(TextEmbeddingService):
+    max_chars = 1000
+
+    def __new__(cls):
+        return object.__new__(cls)
+
+    def get_embedding(self, sentences):
+        return [[float(len(sentence))] for sentence in sentences]
+
+
+class FakeVectorService(FakeEmbeddingService):
+    def get_embedding(self, sentences):
+        return [[0.5] * 768 for _ in sentences]
+
+
+class FakePipeline(EmbeddingPipeline):
+    """Pipeline over a list of articles, writing the embeddings to a dict."""
+
+    def __init__(self, articles, **kwargs):
+        super().__init__(**kwargs)
+        self.articles = articles
+        self.written = {}
+
+    def connection(self):
+        return contextlib.nullcontext()
+
+    def fetch(self):
+        for i in range(0, len(self.articles), self.batch_size):
+            yield self.articles[i : i + self.batch_size]
+
+    def write(self, conn, batch):
+        ids, vectors = batch
+        self.written.update(zip(ids, vectors, strict=True))
+
+
+@pytest.fixture
+def fake_service(monkeypatch):
+    monkeypatch.setattr("news.embedder.TextEmbeddingService", FakeEmbeddingService)
+
+
+def test_pipeline_embeds_all_articles(fake_service):
+    articles = [
+        {"id": i, "title": f"title {i}", "content": f"<p>content &amp; {i}</p>"}
+        for i in range(100, 0, -1)
+    ]
+    pipeline = FakePipeline(articles, batch_size=7, queue_size=1)
+    assert pipeline.run() == 100  # noqa: PLR2004
+    assert pipeline.written[100] == [float(len("title 100 - content & 100"))]
+    assert set(pipeline.written) == set(range(1, 101))
+    assert pipeline.stats["encode"].batches == 15  # noqa: PLR2004
+
+
+def test_pipeline_stops_when_a_stage_fails(fake_service):
+    articles = [{"id": i, "title": "title", "content": "content"} for i in range(50)]
+
+    class FailingPipeline(FakePipeline):
+        def encode(self, batch):
+            if self.stats["encode"].batches == 2:  # noqa: PLR2004
+                msg = "encoding failed"
+                raise RuntimeError(msg)
+            return super().encode(batch)
+
+    pipeline = FailingPipeline(articles, batch_size=5, queue_size=1)
+    with pytest.raises(RuntimeError, match="encoding failed"):
+        pipeline.run()
+    # at most the batches encoded before the failure were written
+    assert len(pipeline.written) <= 10  # noqa: PLR2004
+
+
+@pytest.fixture
+def embedding_pool():
+    yield
+    # the test database cannot be dropped while the pool is connected to it
+    close_embedding_pool()
+
+
+def test_embedding_pool_is_opened_once(monkeypatch, embedding_pool):
+    opened = []
+
+    class SlowPool:
+        def __init__(self, **kwargs):
+            time.sleep(0.05)
+            opened.append(self)
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(embedder, "ConnectionPool", SlowPool)
+    monkeypatch.setattr(embedder, "embedding_conninfo", lambda: "")
+    pools = []
+    threads = [
+        threading.Thread(target=lambda: pools.append(embedder.embedding_pool()))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(opened) == 1
+    assert pools == opened * 4
+
+
+@pytest.fixture
+def unmanaged_cleanup():
+    """
+    Delete the feeds and articles a transactional test stores, with the rows
+    derived from them in the other tables Django does not manage, which the
+    flush after the test leaves alone.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT coalesce(max(id), 0) FROM feeds")
+        last_feed = cursor.fetchone()[0]
+    yield
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM articles WHERE feed_id > %s RETURNING id",
+            [last_feed],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("DELETE FROM articles_data WHERE id = ANY(%s)", [ids])
+        cursor.execute(
+            "DELETE FROM article_embeddings WHERE article_id = ANY(%s)",
+            [ids],
+        )
+        cursor.execute(
+            "DELETE FROM embedding_queue WHERE article_id = ANY(%s)",
+            [ids],
+        )
+        cursor.execute(
+            "DELETE FROM embedding_claims WHERE article_id = ANY(%s)",
+            [ids],
+        )
+        cursor.execute("DELETE FROM feeds WHERE id > %s", [last_feed])
+        cursor.execute("DELETE FROM feeds_data WHERE id > %s", [last_feed])
+        cursor.execute(
+            "DELETE FROM feeds_data_dirty WHERE feed_id > %s",
+            [last_feed],
+        )
+
+
+@pytest.mark.django_db(transaction=True)
+def test_workers_claim_distinct_articles(
+    fake_service,
+    embedding_pool,
+    unmanaged_cleanup,
+):
+    feed = Feeds.objects.create(
+        title="Claimed",
+        url="http://example.com/claimed",
+        homepage="http://example.com",
+        language="en",
+    )
+    ids = [
+        Articles.objects.create(
+            feed=feed,
+            url=f"http://example.com/claimed/{i}",
+            title_original=f"title {i}",
+            content_original="content",
+        ).id
+        for i in range(6)
+    ]
+    first = EmbeddingPipeline(batch_size=2, worker="first")
+    second = EmbeddingPipeline(batch_size=2, worker="second")
+    first_batches = first.fetch()
+    second_batches = second.fetch()
+    assert [a["id"] for a in next(first_batches)] == ids[:-3:-1]
+    assert [a["id"] for a in next(second_batches)] == ids[-3:-5:-1]
+    first_batches.close()
+
+    # the claims of a worker that died expire, and go to the next one
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE embedding_claims SET expires_at = now() WHERE worker = 'first'",
+        )
+    third = EmbeddingPipeline(batch_size=2, worker="third")
+    third_batches = third.fetch()
+    assert [a["id"] for a in next(third_batches)] == ids[:-3:-1]
+    assert [a["id"] for a in next(third_batches)] == ids[1::-1]
+    second_batches.close()
+    third_batches.close()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_new_articles_are_embedded_from_the_queue(
+    monkeypatch,
+    embedding_pool,
+    unmanaged_cleanup,
+):
+    monkeypatch.setattr("news.embedder.TextEmbeddingService", FakeVectorService)
+    feed = Feeds.objects.create(
+        title="Queued",
+        url="http://example.com/queued",
+        homepage="http://example.com",
+        language="en",
+    )
+    ids = {
+        Articles.objects.create(
+            feed=feed,
+            url=f"http://example.com/queued/{i}",
+            title_original=f"title {i}",
+            content_original="content",
+        ).id
+        for i in range(3)
+    }
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT article_id FROM embedding_queue")
+        assert {row[0] for row in cursor.fetchall()} == ids
+
+    embedder = IngestEmbedder(batch_size=2, max_wait=60)
+    # two articles fill a batch, the third waits for more or for max_wait
+    assert embedder.flush_due() is None
+    assert embedder.embedded == 2  # noqa: PLR2004
+    assert 0 < embedder.flush_due() <= 60  # noqa: PLR2004
+    embedder.max_wait = 0
+    assert embedder.flush_due() is None
+    assert (
+        set(
+            ArticleEmbeddings.objects.filter(
+                model=ArticleEmbeddings.USE_CMLM_MULTILINGUAL,
+            ).values_list("article_id", flat=True),
+        )
+        == ids
+    )
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM embedding_queue")
+        assert cursor.fetchone()[0] == 0
+
+
+@pytest.mark.django_db
+def test_hnsw_candidates_widens_the_index_scans():
+    def ef_search():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT current_setting('hnsw.ef_search')")
+            return int(cursor.fetchone()[0])
+
+    with hnsw_candidates(500):
+        assert ef_search() == 500  # noqa: PLR2004
+    with hnsw_candidates(5000):
+        assert ef_search() == 1000  # noqa: PLR2004
@@ -0,0 +1,140 @@
+import asyncio
+
+import numpy as np
+from aiohttp.test_utils import TestClient
+from aiohttp.test_utils import TestServer
+from django.core.cache.backends.locmem import LocMemCache
+
+from news import embedding_server
+from news.embedding_server import EmbeddingServer
+from news.services import EmbeddingCache
+from news.services import EmbeddingServerClient
+from news.services import TextEmbeddingService
+
+
+class UnreachableServer:
+    def embed(self, inputs):
+        raise AssertionError
+
+
+class RecordingServer:
+    def __init__(self):
+        self.timeouts = []
+
+    def info(self):
+        return {"backend": "onnx-int8", "max_seq_length": 256}
+
+    def embed(self, inputs, timeout=None):
+        self.timeouts.append(timeout)
+        return np.array([[float(len(text)), 1.0] for text in inputs])
+
+
+class FailingServer(RecordingServer):
+    def embed(self, inputs, timeout=None):
+        raise ConnectionRefusedError
+
+
+class FakeModel:
+    max_seq_length = 256
+
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, **kwargs):
+        if isinstance(texts, str):
+            return self.encode([texts])[0]
+        self.batches.append(list(texts))
+        return np.array([[float(len(text)), 1.0] for text in texts])
+
+
+def test_smaller_requests_go_first():
+    async def batches():
+        server = EmbeddingServer(max_batch=2, max_delay=0.01)
+        server.queue = asyncio.PriorityQueue()
+        loop = asyncio.get_running_loop()
+        for size, texts in ((3, ["a", "b", "c"]), (1, ["query"])):
+            for text in texts:
+                server.queue.put_nowait(
+                    (size, next(server.sequence), text, loop.create_future()),
+                )
+        first = await server.take_batch()
+        second = await server.take_batch()
+        return [[text for _, _, text, _ in batch] for batch in (first, second)]
+
+    assert asyncio.run(batches()) == [["query", "a"], ["b", "c"]]
+
+
+def test_concurrent_requests_are_batched(monkeypatch):
+    model = FakeModel()
+    monkeypatch.setattr(embedding_server, "load_model", lambda *args, **kwargs: model)
+
+    async def requests():
+        server = EmbeddingServer(max_batch=64, max_delay=0.2)
+        async with TestClient(TestServer(server.application())) as client:
+            responses = await asyncio.gather(
+                client.post("/embed", json={"inputs": ["uno", "dieci"]}),
+                client.post("/embed", json={"inputs": ["cento"]}),
+            )
+            shapes = [response.headers["X-Embedding-Shape"] for response in responses]
+            bodies = [await response.read() for response in responses]
+            info = await (await client.get("/info")).json()
+            bad = await client.post("/embed", json={"inputs": [1]})
+            return shapes, bodies, info, bad.status
+
+    shapes, bodies, info, bad_status = asyncio.run(requests())
+    assert shapes == ["2,2", "1,2"]
+    assert np.frombuffer(bodies[0], dtype=np.float32).tolist() == [3, 1, 5, 1]
+    assert np.frombuffer(bodies[1], dtype=np.float32).tolist() == [5, 1]
+    # both requests in a single batch
+    assert len(model.batches) == 1
+    assert sorted(model.batches[0]) == ["cento", "dieci", "uno"]
+    assert info["max_seq_length"] == 256  # noqa: PLR2004
+    assert info["inputs"] == 3  # noqa: PLR2004
+    assert bad_status == 400  # noqa: PLR2004
+
+
+def test_service_encodes_in_process_without_server():
+    service = object.__new__(TextEmbeddingService)
+    service._model = FakeModel()  # noqa: SLF001
+    service.server = EmbeddingServerClient("unix:/nonexistent", timeout=1)
+    service.server_retry_at = 0.0
+
+    assert service.get_embedding("dieci").tolist() == [5.0, 1.0]
+    assert service.server_retry_at > 0
+    # left alone until the retry
+    service.server = UnreachableServer()
+    assert service.get_embedding(["uno"]).tolist() == [[3.0, 1.0]]
+
+
+def test_queries_wait_for_the_server_briefly(settings):
+    settings.EMBEDDING_SERVER_QUERY_TIMEOUT = 2.0
+    service = object.__new__(TextEmbeddingService)
+    service.server = RecordingServer()
+    service.server_retry_at = 0.0
+    service.query_cache = EmbeddingCache("model", 1, 60, LocMemCache("q", {}))
+
+    assert service.embed_query("dieci").tolist() == [5.0, 1.0]
+    service.get_embedding(["uno", "due"])
+    assert service.server.timeouts == [2.0, None]
+
+
+def test_queries_are_cached_by_the_backend_that_encoded_them(settings):
+    settings.EMBEDDINGS_BACKEND = "torch"
+    service = object.__new__(TextEmbeddingService)
+    service._model = FakeModel()  # noqa: SLF001
+    service.server = RecordingServer()
+    service.server_retry_at = 0.0
+    service.query_cache = EmbeddingCache("model", 10, 60, LocMemCache("b", {}))
+
+    service.embed_query("dieci")
+    assert service.server.timeouts == [settings.EMBEDDING_SERVER_QUERY_TIMEOUT]
+    service.embed_query("dieci")
+    assert service._model.batches == []  # noqa: SLF001
+
+    # the embedding of the server does not stand for the one of this process
+    service.server = FailingServer()
+    service._server_info = None  # noqa: SLF001
+    service.embed_query("cento")
+    assert service._model.batches == [["cento"]]  # noqa: SLF001
+    service.embed_query("dieci")
+    assert service._model.batches == [["cento"], ["dieci"]]  # noqa: SLF001
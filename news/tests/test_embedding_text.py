@@ -0,0 +1,43 @@
+import pytest
+
+from news.embedding_text import prepare_text
+from news.embedding_text import strip_markup
+from news.embedding_text import strip_markup_tail
+
+LONG_ARTICLE = (
+    "<p>Il <b>primo</b> paragrafo &amp; l'inizio.</p>"
+    "<script>var ignored = '<p>';</script>"
+    + "<p>parola</p>" * 5000
+    + "<p>Ultima riga.</p>"
+)
+
+
+def test_strip_markup():
+    assert (
+        strip_markup("<p>Hel<b>lo</b> &amp; wor<i>ld</i></p><p>a<br>b</p>a < b")
+        == "Hello & world a b a < b"
+    )
+    assert strip_markup("<style>p {}</style><!-- comment -->text") == "text"
+    assert strip_markup(None) == ""
+
+
+def test_strip_markup_stops_at_max_chars():
+    assert strip_markup(LONG_ARTICLE, 30) == "Il primo paragrafo & l'inizio."
+    assert strip_markup_tail(LONG_ARTICLE, 19) == "parola Ultima riga."
+
+
+def test_prepare_text_strategies():
+    assert prepare_text("Titolo", LONG_ARTICLE, "head", 30) == [
+        "Titolo - Il primo paragrafo & l'inizio.",
+    ]
+    assert prepare_text("Titolo", LONG_ARTICLE, "head_tail", 42) == [
+        "Titolo - Il primo paragrafo & … a parola Ultima riga.",
+    ]
+    chunks = prepare_text("Titolo", LONG_ARTICLE, "chunks", 30, max_chunks=3)
+    assert len(chunks) == 3  # noqa: PLR2004
+    assert chunks[1] == "Titolo - parola parola parola parola p"
+    assert prepare_text("Titolo", "<p>breve</p>", "head_tail", 42) == [
+        "Titolo - breve",
+    ]
+    with pytest.raises(ValueError, match="Unknown text strategy"):
+        prepare_text("Titolo", "", "tail")
@@ -0,0 +1,31 @@
+from pathlib import Path
+
+import pytest
+
+from news.normalizer import normalize_content
+from news.normalizer import sanitize_html
+
+CORPUS = Path(__file__).parent / "normalizer_corpus"
+BASE_URL = "https://www.example.com/notizie/2025/articolo.html"
+EXCLUDE = ".share, #comments, .related"
+
+
+@pytest.mark.parametrize(
+    "path",
+    sorted(CORPUS.glob("*.in.html")),
+    ids=lambda path: path.name.removesuffix(".in.html"),
+)
+def test_normalize_content_matches_golden_corpus(path):
+    # the expected output was produced by the former BeautifulSoup normalizer
+    expected = path.with_name(path.name.replace(".in.", ".out.")).read_text()
+    assert normalize_content(path.read_text(), BASE_URL, EXCLUDE) == expected
+
+
+def test_sanitize_html_drops_scripts_and_excluded_elements():
+    html = sanitize_html(
+        '<div><script>x()</script><p class="share">share</p>text</div>',
+        ".share",
+    )
+    assert "script" not in html
+    assert "share" not in html
+    assert "text" in html
@@ -0,0 +1,419 @@
+import asyncio
+import datetime
+import multiprocessing
+from types import SimpleNamespace
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from asgiref.sync import async_to_sync
+from django.utils import timezone
+
+import poller
+from news.models import Articles
+from news.models import FeedCache
+from news.models import FeedPolling
+from news.models import Feeds
+from news.models import FeedSchedule
+from news.models import FeedsData
+from news.seen_urls import SeenUrls
+
+
+class FakePoller:
+    def __init__(self, feed_id, tracker):
+        self.feed = type("Feed", (), {"id": feed_id})()
+        self.tracker = tracker
+
+    async def apoll(self, engine):
+        self.tracker["running"] += 1
+        self.tracker["peak"] = max(self.tracker["peak"], self.tracker["running"])
+        await asyncio.sleep(0.01)
+        self.tracker["running"] -= 1
+        self.tracker["done"] += 1
+
+
+def test_host_limiter_shares_semaphore_per_host():
+    async def check():
+        limiter = poller.HostLimiter(2)
+        a = limiter("https://example.com/feed.xml")
+        b = limiter("https://EXAMPLE.com/article/1")
+        c = limiter("https://example.org/feed.xml")
+        assert a is b
+        assert a is not c
+
+    asyncio.run(check())
+
+
+@pytest.mark.parametrize("workers", [0, 1])
+def test_retrieve_normalizes_in_worker_processes(workers):
+    feed = SimpleNamespace(
+        id=1,
+        incomplete=False,
+        salt_url=False,
+        exclude=None,
+        language="it",
+    )
+    entry = {
+        "link": "https://example.com/article",
+        "title": "<b>Title</b> &amp; more",
+        "summary": "<div>first<br/>second</div>",
+    }
+
+    async def check():
+        pool = poller.normalizer_pool(workers)
+        try:
+            return await poller.retrieve(
+                None,
+                entry,
+                feed,
+                verbose=False,
+                normalizer=pool,
+            )
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    _, failed, article = asyncio.run(check())
+    assert failed == 0
+    assert article["title"] == "Title & more"
+    assert article["content"] == "<p>\n first\n</p>\n<p>\n second\n</p>\n"
+
+
+class ReadabilityServer:
+    """Serve an article and extract it, timing out once for the "slow" one."""
+
+    def __init__(self, status=200):
+        self.status = status
+        self.slow = True
+        self.extracted = []
+
+    async def article(self, request):
+        return web.Response(text="<p>article</p>", content_type="text/html")
+
+    async def extract(self, request):
+        href = request.query["href"]
+        if href == "slow" and self.slow:
+            self.slow = False
+            await asyncio.sleep(1)
+        self.extracted.append(href)
+        return web.Response(status=self.status, body=b"<p>extracted</p>")
+
+    def application(self):
+        app = web.Application()
+        app.router.add_get("/article", self.article)
+        app.router.add_post("/extract", self.extract)
+        return app
+
+
+@pytest.mark.parametrize(
+    ("status", "expected"),
+    [(200, (b"<p>extracted</p>", 1, 0)), (500, ("", 0, 1))],
+)
+def test_readability_errors_count_as_failed(status, expected):
+    feed = SimpleNamespace(id=1, exclude=None)
+
+    async def download():
+        async with (
+            TestServer(ReadabilityServer(status).application()) as server,
+            poller.client_session() as client,
+            poller.ReadabilityClient(
+                url=str(server.make_url("/extract")),
+                retries=0,
+            ) as readability,
+        ):
+            entry = {"link": str(server.make_url("/article"))}
+            return await poller.download_content(
+                client,
+                entry,
+                feed,
+                verbose=False,
+                readability=readability,
+            )
+
+    assert asyncio.run(download()) == expected
+
+
+def test_readability_backs_off_without_holding_a_slot():
+    readability_server = ReadabilityServer()
+
+    async def extract():
+        async with (
+            TestServer(readability_server.application()) as server,
+            poller.ReadabilityClient(
+                url=str(server.make_url("/extract")),
+                concurrency=1,
+                timeout=0.2,
+                retries=1,
+            ) as readability,
+        ):
+            return await asyncio.gather(
+                readability.extract("slow", "<p>slow</p>"),
+                readability.extract("fast", "<p>fast</p>"),
+            )
+
+    assert asyncio.run(extract()) == [b"<p>extracted</p>"] * 2
+    # the fast one went through while the slow one was waiting to retry
+    assert readability_server.extracted == ["fast", "slow"]
+
+
+class NormalizingPoller:
+    feed = SimpleNamespace(
+        id=1,
+        incomplete=False,
+        salt_url=False,
+        exclude=None,
+        language="it",
+    )
+
+    def __init__(self, results):
+        self.results = results
+
+    async def apoll(self, engine):
+        entry = {
+            "link": "https://example.com/article",
+            "title": "<b>Title</b>",
+            "summary": "<div>summary</div>",
+        }
+        _, _, article = await poller.retrieve(
+            None,
+            entry,
+            self.feed,
+            verbose=False,
+            normalizer=engine.normalizer,
+        )
+        self.results.put(article["title"])
+
+
+def poll_normalizing(results):
+    engine = poller.PollingEngine(normalize_workers=1, verbose=False)
+    asyncio.run(engine.poll([NormalizingPoller(results)]))
+
+
+def test_polling_engine_runs_in_daemonic_processes():
+    # like the children of the prefork pool of the Celery workers
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    process = context.Process(target=poll_normalizing, args=(results,), daemon=True)
+    process.start()
+    process.join(timeout=30)
+    assert process.exitcode == 0
+    assert results.get(timeout=1) == "Title"
+
+
+@pytest.mark.django_db
+def test_polling_engine_caps_concurrency():
+    tracker = {"running": 0, "peak": 0, "done": 0}
+    pollers = [FakePoller(i, tracker) for i in range(10)]
+    engine = poller.PollingEngine(concurrency=3, per_host_concurrency=1)
+    engine.run(pollers)
+    assert tracker["done"] == len(pollers)
+    assert tracker["peak"] == engine.concurrency
+
+
+@pytest.mark.django_db
+def test_polling_engine_isolates_failing_feeds():
+    class FailingPoller(FakePoller):
+        async def apoll(self, engine):
+            msg = "boom"
+            raise RuntimeError(msg)
+
+    tracker = {"running": 0, "peak": 0, "done": 0}
+    pollers = [FailingPoller(0, tracker), FakePoller(1, tracker)]
+    poller.PollingEngine(concurrency=2, per_host_concurrency=1).run(pollers)
+    assert tracker["done"] == 1
+
+
+def test_single_feed_engine_is_lightweight(monkeypatch):
+    # not marked django_db: the engine itself must not touch the DB
+    monkeypatch.setattr(poller, "seen_urls", SeenUrls())
+    normalizers = []
+
+    class RecordingPoller(FakePoller):
+        async def apoll(self, engine):
+            normalizers.append(engine.normalizer)
+
+    poller.SingleFeedEngine(verbose=False).run([RecordingPoller(1, {})])
+    assert normalizers == [None]
+    assert poller.seen_urls.bloom is None
+
+
+@pytest.mark.django_db
+def test_store_articles_reports_per_article_outcome():
+    Articles.objects.create(feed_id=1, url="http://example.com/duplicate")
+    articles = [
+        {
+            "author": "a",
+            "content": "<p>new</p>",
+            "feed_id": 1,
+            "language": "it",
+            "stamp": "2025-01-01T00:00:00Z",
+            "title": "new",
+            "url": "http://example.com/new",
+        },
+        {
+            "author": "b",
+            "content": "<p>duplicate</p>",
+            "feed_id": 1,
+            "language": "en",
+            "stamp": None,
+            "title": "duplicate",
+            "url": "http://example.com/duplicate",
+        },
+    ]
+    new_id, duplicate_id = poller.store_articles(articles)
+    assert new_id > 0
+    assert duplicate_id == 0
+    article = Articles.objects.get(id=new_id)
+    assert article.title == "new"
+    assert article.title_original is None
+
+
+@pytest.mark.django_db
+def test_store_articles_reports_urls_claimed_concurrently(monkeypatch):
+    Articles.objects.create(feed_id=1, url="http://example.com/claimed")
+    # as if another poller stored the URL after the check of the statement
+    check = poller.INSERT_ARTICLES_SQL.index("WHERE NOT EXISTS")
+    monkeypatch.setattr(
+        poller,
+        "INSERT_ARTICLES_SQL",
+        poller.INSERT_ARTICLES_SQL[:check] + "RETURNING id, url",
+    )
+    articles = [
+        {
+            "author": "a",
+            "content": f"<p>{url}</p>",
+            "feed_id": 1,
+            "language": "it",
+            "stamp": None,
+            "title": url,
+            "url": f"http://example.com/{url}",
+        }
+        for url in ("unclaimed", "claimed")
+    ]
+    new_id, claimed_id = poller.store_articles(articles)
+    assert new_id > 0
+    assert claimed_id == 0
+
+
+@pytest.mark.django_db
+def test_feeds_data_refreshed_once_per_batch():
+    before = FeedsData.objects.get(id=1).article_count
+    Articles.objects.create(feed_id=1, url="http://example.com/queued")
+    # the triggers only queue the feed, its statistics are refreshed in batch
+    assert FeedsData.objects.get(id=1).article_count == before
+    assert poller.refresh_feeds_data() == 1
+    assert FeedsData.objects.get(id=1).article_count == before + 1
+    assert poller.refresh_feeds_data() == 0
+
+
+@pytest.mark.django_db
+def test_failed_poll_hands_the_feed_back_to_the_scheduler(monkeypatch):
+    feed = Feeds.objects.create(url="https://example.com/feed.xml", active=True)
+    # claimed by the scheduler
+    FeedSchedule.objects.create(
+        feed=feed,
+        next_poll=timezone.now() + datetime.timedelta(days=1),
+        interval=3600,
+    )
+    failing = poller.Poller(feed)
+
+    async def fail(engine):
+        msg = "boom"
+        raise RuntimeError(msg)
+
+    monkeypatch.setattr(failing, "_poll_feed", fail)
+    with pytest.raises(RuntimeError):
+        async_to_sync(failing.apoll)(None)
+    next_poll = FeedSchedule.objects.get(feed=feed).next_poll
+    assert next_poll < timezone.now() + datetime.timedelta(hours=2)
+
+
+FEED_BODY = b"""<?xml version="1.0"?>
+<rss version="2.0"><channel><title>Conditional</title>
+<item>
+<title>Uno</title>
+<link>http://example.com/conditional/1</link>
+<description>&lt;p&gt;uno&lt;/p&gt;</description>
+</item>
+</channel></rss>"""
+
+
+class FeedServer:
+    """Serve FEED_BODY, answering 304 to its ETag if validators are honoured."""
+
+    etag = '"v1"'
+
+    def __init__(self, *, honour_validators):
+        self.honour_validators = honour_validators
+        self.requests = []
+
+    async def handle(self, request):
+        self.requests.append(request.headers.get("If-None-Match"))
+        if self.honour_validators and request.headers.get("If-None-Match") == (
+            self.etag
+        ):
+            return web.Response(status=304)
+        return web.Response(body=FEED_BODY, headers={"ETag": self.etag})
+
+
+def poll_feed(feed, feed_server):
+    """Poll feed as served by feed_server, return the record of the poll."""
+
+    async def poll():
+        app = web.Application()
+        app.router.add_get("/feed.xml", feed_server.handle)
+        async with TestServer(app) as server, poller.client_session() as client:
+            feed.url = str(server.make_url("/feed.xml"))
+            engine = SimpleNamespace(
+                client=client,
+                host_limiter=poller.HostLimiter(1),
+                verbose=False,
+                readability=None,
+                normalizer=None,
+            )
+            await poller.Poller(feed).apoll(engine)
+
+    async_to_sync(poll)()
+    return FeedPolling.objects.filter(feed=feed).latest("poll_start_time")
+
+
+@pytest.fixture
+def conditional_feed():
+    return Feeds.objects.create(
+        url="http://example.com/conditional.xml",
+        language="it",
+        active=True,
+    )
+
+
+@pytest.mark.django_db
+def test_unmodified_feed_answers_not_modified(conditional_feed):
+    feed_server = FeedServer(honour_validators=True)
+    first = poll_feed(conditional_feed, feed_server)
+    assert (first.http_status_code, first.articles_stored) == (200, 1)
+    assert FeedCache.objects.get(feed=conditional_feed).etag == FeedServer.etag
+
+    second = poll_feed(conditional_feed, feed_server)
+    assert second.http_status_code == poller.HTTP_NOT_MODIFIED_CODE
+    assert second.articles_retrieved == 0
+    assert feed_server.requests == [None, FeedServer.etag]
+
+
+@pytest.mark.django_db
+def test_unchanged_feed_is_not_parsed_again(conditional_feed):
+    feed_server = FeedServer(honour_validators=False)
+    poll_feed(conditional_feed, feed_server)
+
+    second = poll_feed(conditional_feed, feed_server)
+    assert second.http_status_code == poller.UNCHANGED_CONTENT_CODE
+    assert second.articles_retrieved == 0
+
+
+@pytest.mark.django_db
+def test_validators_are_saved_even_if_entries_fail(conditional_feed, monkeypatch):
+    monkeypatch.setattr(poller, "store_articles", lambda articles: [-1])
+    polling = poll_feed(conditional_feed, FeedServer(honour_validators=True))
+    assert polling.articles_failed == 1
+    feed_cache = FeedCache.objects.get(feed=conditional_feed)
+    assert feed_cache.etag == FeedServer.etag
+    assert feed_cache.content_hash
@@ -0,0 +1,162 @@
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.views import View
+from rest_framework.authtoken.models import Token
+
+from flash.users.models import User
+from news.models import Articles
+from news.replicas import PIN_COOKIE
+from news.replicas import ReplicaMiddleware
+from news.replicas import ReplicaRouter
+from news.replicas import read_replica
+
+
+class ReplicaView(View):
+    replica_reads = True
+
+
+def route(  # noqa: PLR0913
+    request,
+    monkeypatch,
+    *,
+    view=ReplicaView,
+    aliases=("replica0",),
+    write=False,
+    user=None,
+):
+    monkeypatch.setattr("news.replicas.replicas", lambda: list(aliases))
+    router = ReplicaRouter()
+    databases = {}
+
+    def get_response(request):
+        middleware.process_view(request, view.as_view(), (), {})
+        databases["articles"] = router.db_for_read(Articles)
+        databases["users"] = router.db_for_read(User)
+        databases["reads"] = {router.db_for_read(Articles) for _ in range(20)}
+        if write:
+            User.objects.filter(pk=0).update(name="")
+        if user is not None:
+            # as DRF does once it has authenticated a token
+            request.user = user
+        return HttpResponse()
+
+    middleware = ReplicaMiddleware(get_response)
+    response = middleware(request)
+    return databases, response
+
+
+def test_safe_requests_read_news_from_a_replica(monkeypatch):
+    databases, response = route(RequestFactory().get("/api/articles/"), monkeypatch)
+    assert databases == {
+        "articles": "replica0",
+        "users": "default",
+        "reads": {"replica0"},
+    }
+    assert PIN_COOKIE not in response.cookies
+    assert read_replica.get() is None
+
+
+def test_requests_read_from_a_single_replica(monkeypatch):
+    aliases = ("replica0", "replica1", "replica2")
+    chosen = set()
+    for _ in range(20):
+        databases, _ = route(
+            RequestFactory().get("/api/articles/"),
+            monkeypatch,
+            aliases=aliases,
+        )
+        assert databases["reads"] == {databases["articles"]}
+        chosen.add(databases["articles"])
+    # different requests spread over the replicas
+    assert len(chosen) > 1
+
+
+def test_without_replicas_reads_go_to_the_primary(monkeypatch):
+    databases, _ = route(
+        RequestFactory().get("/api/articles/"),
+        monkeypatch,
+        aliases=(),
+    )
+    assert databases["articles"] == "default"
+
+
+def test_writes_pin_the_client_to_the_primary(monkeypatch, settings, db):
+    databases, response = route(
+        RequestFactory().post("/api/articles/"),
+        monkeypatch,
+        write=True,
+    )
+    assert databases["articles"] == "default"
+    assert response.cookies[PIN_COOKIE]["max-age"] == (
+        settings.DATABASE_REPLICA_PIN_SECONDS
+    )
+
+    request = RequestFactory().get("/api/articles/")
+    request.COOKIES[PIN_COOKIE] = "1"
+    databases, _ = route(request, monkeypatch)
+    assert databases["articles"] == "default"
+
+
+def test_safe_requests_that_write_pin_the_client(monkeypatch, db):
+    _, response = route(
+        RequestFactory().get("/api/articles/1/"),
+        monkeypatch,
+        write=True,
+    )
+    assert PIN_COOKIE in response.cookies
+
+
+def test_unsafe_requests_that_do_not_write_do_not_pin(monkeypatch, db):
+    _, response = route(RequestFactory().post("/api/articles/"), monkeypatch)
+    assert PIN_COOKIE not in response.cookies
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(username="writer", password="password")  # noqa: S106
+
+
+@pytest.fixture
+def replica_pins():
+    caches["replica_pins"].clear()
+    yield caches["replica_pins"]
+    caches["replica_pins"].clear()
+
+
+def test_writes_pin_the_user_without_cookies(monkeypatch, user, replica_pins):
+    request = RequestFactory().post("/api/articles/")
+    request.user = user
+    route(request, monkeypatch, write=True)
+
+    request = RequestFactory().get("/api/articles/")
+    request.user = user
+    databases, _ = route(request, monkeypatch)
+    assert databases["articles"] == "default"
+
+    request = RequestFactory().get("/api/articles/")
+    request.user = AnonymousUser()
+    databases, _ = route(request, monkeypatch)
+    assert databases["articles"] == "replica0"
+
+
+def test_writes_pin_the_token_clients(monkeypatch, user, replica_pins):
+    token = Token.objects.create(user=user)
+    headers = {"HTTP_AUTHORIZATION": f"Token {token.key}"}
+    request = RequestFactory().get("/api/articles/", **headers)
+    databases, _ = route(request, monkeypatch)
+    assert databases["articles"] == "replica0"
+
+    request = RequestFactory().post("/api/articles/", **headers)
+    route(request, monkeypatch, write=True, user=user)
+
+    request = RequestFactory().get("/api/articles/", **headers)
+    databases, _ = route(request, monkeypatch)
+    assert databases["articles"] == "default"
+
+
+def test_views_not_opted_in_read_from_the_primary(monkeypatch):
+    databases, _ = route(RequestFactory().get("/"), monkeypatch, view=View)
+    assert databases["articles"] == "default"
@@ -0,0 +1,75 @@
+import datetime
+
+import pytest
+from django.utils import timezone
+
+from news.models import Feeds
+from news.models import FeedSchedule
+from news.scheduler import Scheduler
+from news.scheduler import next_allowed
+from news.scheduler import next_interval
+
+
+def test_next_interval_follows_publishing_rate(settings):
+    settings.POLLER_MIN_INTERVAL = 300
+    settings.POLLER_MAX_INTERVAL = 86400
+    assert next_interval(3600, [1]) == 1800  # noqa: PLR2004
+    # several new articles at the last poll: come back sooner
+    assert next_interval(3600, [3, 1]) == 600  # noqa: PLR2004
+    # dormant feed: back off, up to the maximum
+    assert next_interval(3600, [0, 0, 1]) == 4050  # noqa: PLR2004
+    assert next_interval(86400 * 30, [0, 0]) == settings.POLLER_MAX_INTERVAL
+    assert next_interval(60, [5]) == settings.POLLER_MIN_INTERVAL
+
+
+def test_next_allowed_honours_frequency():
+    when = datetime.datetime(2025, 3, 3, 14, 20, tzinfo=datetime.UTC)  # a Monday
+    assert next_allowed(None, when) == when
+    assert next_allowed('{"hour": [14]}', when) == when
+    assert next_allowed('{"hour": [6]}', when) == datetime.datetime(
+        2025,
+        3,
+        4,
+        6,
+        tzinfo=datetime.UTC,
+    )
+    assert next_allowed('{"weekday": [7], "hour": [0]}', when) == datetime.datetime(
+        2025,
+        3,
+        9,
+        tzinfo=datetime.UTC,
+    )
+    assert next_allowed('{"day": [-1]}', when) == datetime.datetime(
+        2025,
+        3,
+        31,
+        tzinfo=datetime.UTC,
+    )
+
+
+@pytest.mark.django_db
+def test_scheduler_claims_due_feeds_once(settings):
+    # leave out the feeds loaded from sql/
+    Feeds.objects.update(active=False)
+    due = Feeds.objects.create(url="https://example.com/due", active=True)
+    later = Feeds.objects.create(url="https://example.com/later", active=True)
+    new = Feeds.objects.create(url="https://example.com/new", active=True)
+    Feeds.objects.create(url="https://example.com/inactive", active=False)
+    now = timezone.now()
+    FeedSchedule.objects.create(
+        feed=due,
+        next_poll=now - datetime.timedelta(minutes=1),
+        interval=3600,
+    )
+    FeedSchedule.objects.create(
+        feed=later,
+        next_poll=now + datetime.timedelta(hours=1),
+        interval=3600,
+    )
+
+    claimed = Scheduler().claim_due()
+    assert [feed.id for feed in claimed] == sorted([due.id, new.id])
+    assert Scheduler().claim_due() == []
+    # held for the lease only, in case the run dies before rescheduling them
+    lease = now + datetime.timedelta(seconds=settings.POLLER_CLAIM_LEASE + 60)
+    assert FeedSchedule.objects.get(feed=due).next_poll < lease
@@ -0,0 +1,81 @@
+import asyncio
+import datetime
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from news.scrapers import Scraper
+from news.scrapers import get_scraper
+from news.scrapers.base import parse_italian_date
+from news.scrapers.goodmorningitalia import GoodMorningItalia
+from news.scrapers.lindice import LIndice
+from news.scrapers.repubblica import Repubblica
+
+
+def test_get_scraper_by_script_name():
+    assert get_scraper("/srv/calo.news/py/poll_94.py") is GoodMorningItalia
+    assert get_scraper("poll_96") is Repubblica
+    assert get_scraper("/srv/calo.news/py/poll_1.py") is None
+    assert get_scraper(None) is None
+
+
+def test_parse_italian_date():
+    assert parse_italian_date("Pubblicato il 12 Marzo 2025") == datetime.datetime(
+        2025,
+        3,
+        12,
+        tzinfo=datetime.UTC,
+    )
+    assert parse_italian_date("ieri") is None
+
+
+def test_repubblica_entries():
+    cover = {
+        "feed": {
+            "zones": [
+                {
+                    "blocks": [
+                        {
+                            "entries": [
+                                {
+                                    "author": "di Mario Rossi",
+                                    "title": "L&#39;articolo",
+                                    "links": [
+                                        {"rel": "alternate", "href": "https://x/a"},
+                                        {
+                                            "rel": "target-alternate-amp",
+                                            "href": "https://x/a/amp",
+                                        },
+                                    ],
+                                },
+                                {"title": "no links"},
+                            ],
+                        },
+                    ],
+                },
+            ],
+        },
+    }
+    scraper = Repubblica(None, None)
+    assert scraper.entries(cover) == [
+        {"author": "Mario Rossi", "title": "L'articolo", "url": "https://x/a/amp"},
+    ]
+
+
+def test_scrapers_implement_scrape():
+    with pytest.raises(TypeError, match="scrape"):
+        Scraper(None, None)
+
+
+def test_lindice_rewires_the_summary(monkeypatch):
+    rewired = []
+    rewire = SimpleNamespace(
+        lookup=lambda url: {"https://x/sommario/": 7}[url],
+        rewire_article=rewired.append,
+    )
+    monkeypatch.setitem(sys.modules, "rewire", rewire)
+    scraper = LIndice(None, None)
+    scraper.summary_url = "https://x/sommario/"
+    asyncio.run(scraper.stored([7, 8]))
+    assert rewired == [7]
@@ -0,0 +1,66 @@
+import pytest
+from django.db import connection
+
+import poller
+from news.models import Articles
+from news.seen_urls import BloomFilter
+from news.seen_urls import SeenUrls
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000)
+    urls = [f"https://example.com/article/{i}" for i in range(1000)]
+    for url in urls:
+        bloom.add(url)
+    assert all(url in bloom for url in urls)
+
+
+def test_bloom_filter_false_positive_rate():
+    bloom = BloomFilter(1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f"https://example.com/article/{i}")
+    false_positives = sum(
+        f"https://example.org/other/{i}" in bloom for i in range(10000)
+    )
+    assert false_positives < 300  # noqa: PLR2004
+
+
+@pytest.mark.django_db
+def test_prune_already_retrieved(monkeypatch):
+    seen_urls = SeenUrls()
+    monkeypatch.setattr(poller, "seen_urls", seen_urls)
+    Articles.objects.create(feed_id=1, url="http://example.com/stored")
+    seen_urls.refresh()
+    entries = [
+        {"link": "http://example.com/new"},
+        {"link": "http://example.com/stored"},
+    ]
+    assert poller.prune_already_retrieved(entries) == 1
+    assert entries == [{"link": "http://example.com/new"}]
+
+    urls = ["http://example.com/stored", "http://example.com/other"]
+    assert poller.prune_already_retrieved(urls) == 1
+    assert urls == ["http://example.com/other"]
+
+
+@pytest.mark.django_db
+def test_refresh_catches_up_with_late_commits():
+    urls = SeenUrls()
+    urls.refresh()
+    # an article whose transaction is still in progress at the next refresh,
+    # while another one with a higher id is already committed
+    late = Articles.objects.create(feed_id=1, url="http://example.com/late")
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM articles WHERE id = %s", [late.id])
+    Articles.objects.create(feed_id=1, url="http://example.com/early")
+    urls.refresh()
+    assert "http://example.com/early" in urls.bloom
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO articles (id, feed_id, url) OVERRIDING SYSTEM VALUE "
+            "VALUES (%s, 1, %s)",
+            [late.id, late.url],
+        )
+    urls.refresh()
+    assert "http://example.com/late" in urls.bloom
+    assert late.id not in urls.gaps
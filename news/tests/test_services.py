@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pytest
+from django.core.cache.backends.locmem import LocMemCache
+
+from news.services import EmbeddingCache
+from news.services import cosine_similarities
+from news.services import load_model
+
+# the int8 embeddings may drift this far from the fp32 ones at most
+QUANTIZED_TOLERANCE = 0.98
+
+SENTENCES = [
+    "Il governo approva la legge di bilancio - Il testo passa ora al Senato.",
+    "Heavy rain floods the city centre - Schools stay closed on Monday.",
+    "La selección gana la final - Miles de aficionados celebran en la plaza.",
+]
+
+
+def test_cosine_similarities():
+    reference = np.array([[1.0, 0.0], [0.0, 2.0]])
+    embeddings = np.array([[2.0, 0.0], [1.0, 1.0]])
+    assert cosine_similarities(embeddings, reference) == pytest.approx(
+        [1.0, 2**-0.5],
+    )
+
+
+def test_embedding_cache_skips_inference_for_repeated_texts():
+    shared = LocMemCache("embeddings", {})
+    computed = []
+
+    def compute(text):
+        computed.append(text)
+        return [float(len(text)), 1.0]
+
+    cache = EmbeddingCache("model", size=1, timeout=60, shared=shared)
+    assert list(cache.get("guerra in europa", compute)) == [16.0, 1.0]
+    # the same text, up to whitespace: from the process
+    assert list(cache.get(" guerra  in europa ", compute)) == [16.0, 1.0]
+    cache.get("elezioni", compute)
+    # evicted from the process by the LRU, still in the shared tier
+    assert list(cache.get("guerra in europa", compute)) == [16.0, 1.0]
+    assert computed == ["guerra in europa", "elezioni"]
+    assert cache.counters == {"local hits": 1, "shared hits": 1, "misses": 2}
+
+    # another process, or another model
+    other_process = EmbeddingCache("model", 1, 60, shared)
+    assert list(other_process.get("elezioni", compute)) == [8.0, 1.0]
+    EmbeddingCache("other model", 1, 60, shared).get("elezioni", compute)
+    assert computed == ["guerra in europa", "elezioni", "elezioni"]
+
+
+class FailingCache:
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, key):
+        self.calls += 1
+        raise ConnectionError
+
+    def set(self, key, value, timeout):
+        self.calls += 1
+        raise ConnectionError
+
+
+def test_embedding_cache_computes_while_the_shared_tier_fails():
+    shared = FailingCache()
+    cache = EmbeddingCache("model", size=1, timeout=60, shared=shared)
+    assert list(cache.get("elezioni", lambda text: [1.0, 0.0])) == [1.0, 0.0]
+    # left alone after failing
+    assert list(cache.get("guerra", lambda text: [0.0, 1.0])) == [0.0, 1.0]
+    assert shared.calls == 1
+    assert cache.counters == {"misses": 2}
+
+
+@pytest.mark.skipif(
+    not os.environ.get("EMBEDDINGS_REGRESSION"),
+    reason="downloads and quantizes the model, set EMBEDDINGS_REGRESSION to run",
+)
+def test_quantized_embeddings_match_reference(tmp_path):
+    reference = load_model("torch").encode(SENTENCES)
+    quantized = load_model("onnx-int8", model_dir=tmp_path).encode(SENTENCES)
+    assert cosine_similarities(quantized, reference).min() >= QUANTIZED_TOLERANCE
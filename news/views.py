@@ -20,6 +20,7 @@ class ArticleListView(ListView):
     model = Articles
     queryset = Articles.objects.filter(articlesdata__views__gt="0")
     ordering = "-id"
+    replica_reads = True
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
@@ -35,6 +36,7 @@ class ArticleListView(ListView):
 class ArticleDetailView(DetailView):
     model = Articles
     pk_url_kwarg = "id"
+    replica_reads = True
 
     def get(self, request, *args, **kwargs):
         self.object = self.get_object()
@@ -45,11 +47,10 @@ class ArticleDetailView(DetailView):
             return redirect(url)
         if request.GET.get("redirect"):
             article = context["object"]
-            if GuestArticles.objects.filter(article_id=article.id).exists():
-                GuestArticles.objects.filter(article_id=article.id).update(
-                    views=F("views") + 1,
-                )
-            else:
+            # the update goes to the primary, whereas the reads may not
+            if not GuestArticles.objects.filter(article_id=article.id).update(
+                views=F("views") + 1,
+            ):
                 GuestArticles.objects.create(article_id=article.id, views=1)
             url = article.url
             return redirect(url)
@@ -1,36 +1,47 @@
-# ruff: noqa: S603, C901, ASYNC210, PLR0912, FBT003
+# ruff: noqa: S603, PLR0913
 
 import asyncio
-import copy
+import contextlib
 import datetime
-import html
+import hashlib
 import http.cookiejar
 import json
 import logging
+import multiprocessing
 import subprocess
 import time
 import urllib
+from concurrent.futures import Executor
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 from typing import TypedDict
 
 import aiohttp
 import feedparser
-import lxml.html
 import pytz
-import requests
 from asgiref.sync import sync_to_async
-from bs4 import BeautifulSoup
-from bs4 import Comment
-from bs4 import NavigableString
-from bs4 import Tag
+from django.conf import settings
+from django.db import DatabaseError
+from django.db import connection
+from django.db import transaction
 
-from news.models import Articles
+from news import breaker
+from news.models import FeedCache
 from news.models import FeedPolling
+from news.normalizer import normalize_article
+from news.normalizer import sanitize_html
+from news.scheduler import reschedule
+from news.scrapers import get_scraper
+from news.seen_urls import seen_urls
 
 logger = logging.getLogger(__name__)
 time_format = "%Y-%m-%dT%H:%M:%SZ"
 HTTP_SUCCESS_CODE = 200
+HTTP_NOT_MODIFIED_CODE = 304
+UNCHANGED_CONTENT_CODE = 1
 USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64; rv:52.0) Gecko/20100101 Firefox/52.0"
+FEED_TIMEOUT = 60
 
 
 def last_day_of_month(date: datetime.datetime) -> datetime.datetime:
@@ -39,17 +50,94 @@ def last_day_of_month(date: datetime.datetime) -> datetime.datetime:
     return next_month - datetime.timedelta(days=next_month.day)
 
 
-def sanitize_html(html_content: str, exclude: str | None = None) -> str:
-    soup = BeautifulSoup(html_content, "lxml")
-    for element in soup.find_all(True):
-        if isinstance(element, Tag):
-            if element.name in ["style", "script", "svg", "picture"]:
-                element.extract()
-    if exclude and exclude != "":
-        for element in soup.select(exclude):
-            element.extract()
-    raw_bytes = soup.encode_contents()
-    return raw_bytes.decode("utf-8")
+def normalizer_pool(workers: int) -> Executor | None:
+    """
+    Create the pool of processes normalizing the HTML of the articles, or
+    return None to normalize it in the calling thread if workers is 0.
+    Daemonic processes, like the children of the Celery prefork pool, cannot
+    start processes: there the pool is made of threads instead.
+    """
+    if workers <= 0:
+        return None
+    if multiprocessing.current_process().daemon:
+        return ThreadPoolExecutor(max_workers=workers)
+    # the workers only need news.normalizer, which does not depend on Django:
+    # fork them from a clean server process with the module already imported
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["news.normalizer"])
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+async def offload(pool: Executor | None, func, *args):
+    """Run the CPU-bound func in pool without blocking the event loop."""
+    if pool is None:
+        return func(*args)
+    return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+
+
+class ReadabilityClient:
+    """
+    Pooled asynchronous client for the readability service.
+
+    The connections to the service are kept alive across articles, the number
+    of extractions in flight is capped and requests failing because of
+    connection errors or timeouts are retried with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        url: str | None = None,
+        concurrency: int | None = None,
+        timeout: float | None = None,
+        retries: int | None = None,
+    ):
+        self.url = url or settings.READABILITY_URL
+        self.concurrency = concurrency or settings.READABILITY_CONCURRENCY
+        self.timeout = timeout or settings.READABILITY_TIMEOUT
+        self.retries = settings.READABILITY_RETRIES if retries is None else retries
+        self._session: aiohttp.ClientSession | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+
+    async def __aenter__(self) -> "ReadabilityClient":
+        connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self._session:
+            await self._session.close()
+        self._session = None
+
+    async def extract(self, href: str, html_content: str) -> bytes:
+        """
+        Return the readable content extracted from the HTML page at href;
+        raise aiohttp.ClientResponseError if the service answers an error.
+        """
+        headers = {"Content-Type": "text/html; charset=UTF-8"}
+        for attempt in range(self.retries + 1):
+            try:
+                async with (
+                    self._semaphore,
+                    self._session.post(
+                        self.url,
+                        params={"href": href},
+                        headers=headers,
+                        data=html_content.encode("utf-8"),
+                    ) as r,
+                ):
+                    r.raise_for_status()
+                    return await r.read()
+            except (aiohttp.ClientConnectionError, TimeoutError):
+                if attempt == self.retries:
+                    raise
+                logger.warning(f"=== retrying readability for {href}")
+            # back off without holding a slot of the service
+            await asyncio.sleep(2**attempt)
+        return b""
 
 
 async def download_content(
@@ -58,36 +146,45 @@ async def download_content(
     feed: Any,
     *,
     verbose: bool,
+    cookies: dict[str, str] | None = None,
+    host_limiter: "HostLimiter | None" = None,
+    readability: ReadabilityClient | None = None,
+    normalizer: Executor | None = None,
 ) -> tuple[bytes, int, int]:
     # use readability service to extract the content
+    if readability is None:
+        msg = "downloading the content of an article needs a ReadabilityClient"
+        raise ValueError(msg)
     proxy = None
+    slot = host_limiter(entry["link"]) if host_limiter else contextlib.nullcontext()
     try:
-        async with client.get(url=entry["link"], proxy=proxy) as response:
+        async with (
+            slot,
+            client.get(url=entry["link"], proxy=proxy, cookies=cookies) as response,
+        ):
             if verbose:
                 logger.info(f"=== queueing {entry['link']}")
             html = await response.read()
-            if response.status == HTTP_SUCCESS_CODE:
-                retrieved = 1
-                failed = 0
-                decoded_html = html.decode("utf-8", "ignore")
-                content_sanitized = sanitize_html(decoded_html, feed.exclude)
-                headers = {"Content-Type": "text/html; charset=UTF-8"}
-                r = requests.post(
-                    "http://readability:8081?href=" + entry["link"],
-                    headers=headers,
-                    data=content_sanitized.encode("utf-8"),
-                    timeout=30,
-                )
-                content = r.content
-            else:
-                content = ""
-                retrieved = 0
-                failed = 1
-                logger.error(
-                    f"=== url {entry['link']} returned error status {response.status}",
-                )
-                if verbose:
-                    logger.info("f=== content: {html}")
+        if response.status == HTTP_SUCCESS_CODE:
+            retrieved = 1
+            failed = 0
+            decoded_html = html.decode("utf-8", "ignore")
+            content_sanitized = await offload(
+                normalizer,
+                sanitize_html,
+                decoded_html,
+                feed.exclude,
+            )
+            content = await readability.extract(entry["link"], content_sanitized)
+        else:
+            content = ""
+            retrieved = 0
+            failed = 1
+            logger.error(
+                f"=== url {entry['link']} returned error status {response.status}",
+            )
+            if verbose:
+                logger.info("f=== content: {html}")
     except Exception:
         logger.exception(
             f"=== exception while asynchronously retrieving {entry['link']}",
@@ -105,10 +202,17 @@ async def retrieve(
     feed: Any,
     *,
     verbose: bool,
-) -> tuple[int, int, int]:
+    cookies: dict[str, str] | None = None,
+    host_limiter: "HostLimiter | None" = None,
+    readability: ReadabilityClient | None = None,
+    normalizer: Executor | None = None,
+) -> tuple[int, int, "ArticleDict | None"]:
+    """
+    Retrieve and normalize the content of a feed entry.
+    Returns the retrieved and failed counts and the article ready to be stored.
+    """
     retrieved = 0
     failed = 0
-    stored = 0
     url = entry["link"]
     if feed.incomplete and entry["link"]:
         content, retrieved, failed = await download_content(
@@ -116,6 +220,10 @@ async def retrieve(
             entry,
             feed,
             verbose=verbose,
+            cookies=cookies,
+            host_limiter=host_limiter,
+            readability=readability,
+            normalizer=normalizer,
         )
     elif "content" in entry:
         content = b"" if isinstance(entry["content"][0], bytes) else ""
@@ -126,7 +234,7 @@ async def retrieve(
     else:
         failed += 1
         logger.error(f"=== url {url} has no content and no summary")
-        return (retrieved, failed, stored)
+        return (retrieved, failed, None)
 
     decoded_content = content.decode() if isinstance(content, bytes) else content
 
@@ -134,41 +242,56 @@ async def retrieve(
         # add some cruft to the urls so that they are unique
         url = f"{url}#{int(time.time())}"
     if len(decoded_content) > 0:
-        parsed_url = urllib.parse.urlparse(url)
-        base_url = urllib.parse.urlunsplit(
-            (parsed_url.scheme, parsed_url.netloc, "", "", ""),
+        article = await prepare_article(
+            feed,
+            {
+                "author": entry.get("author", "anonimo"),
+                "content": decoded_content,
+                "stamp": entry.get("stamp", 0),
+                "title": entry.get("title", ""),
+                "url": url,
+            },
+            normalizer=normalizer,
         )
-        author = clean(entry.get("author", "anonimo"))
-        normalized_content = normalize_content(decoded_content, base_url, feed.exclude)
-        title = clean(entry.get("title", ""))
-        article: ArticleDict = {
-            "author": author,
-            "content": normalized_content,
-            "feed_id": feed.id,
-            "language": feed.language,
-            "stamp": entry.get("stamp", 0),
-            "title": title,
-            "url": url,
-        }
-        article_id = await store_article(article)
-        if article_id > 0:
-            stored += 1
-            if verbose:
-                logger.info(
-                    f"=== new article {entry["link"]} asynchronously stored with id {article_id}",  # noqa: E501
-                )
-        elif article_id < 0:
-            failed += 1
-    return (retrieved, failed, stored)
+        return (retrieved, failed, article)
+    return (retrieved, failed, None)
 
 
-async def main(
-    loop: asyncio.AbstractEventLoop,
-    entries: list[dict[str, Any]],
+async def prepare_article(
     feed: Any,
-    *,
-    verbose: bool,
-) -> list[tuple[int, int, int]]:
+    raw: dict[str, Any],
+    normalizer: Executor | None = None,
+) -> "ArticleDict":
+    """
+    Turn the author, title, url, raw HTML content and optional stamp of an
+    article into an article of the feed ready to be stored.
+    """
+    parsed_url = urllib.parse.urlparse(raw["url"])
+    base_url = urllib.parse.urlunsplit(
+        (parsed_url.scheme, parsed_url.netloc, "", "", ""),
+    )
+    author, title, normalized_content = await offload(
+        normalizer,
+        normalize_article,
+        raw["content"],
+        base_url,
+        feed.exclude,
+        raw["author"],
+        raw["title"],
+    )
+    return {
+        "author": author,
+        "content": normalized_content,
+        "feed_id": feed.id,
+        "language": feed.language,
+        "stamp": raw.get("stamp", 0),
+        "title": title,
+        "url": raw["url"],
+    }
+
+
+def load_cookies(feed: Any) -> dict[str, str]:
+    """Load the cookies to send when downloading the articles of the feed."""
     cookies: dict[str, str] = {}
     if feed.cookies and feed.cookies != "":
         cookies_file = feed.cookies.replace("/srv/calo.news/", "/app/")
@@ -181,205 +304,85 @@ async def main(
                     cookies[c.name] = c.value
         except Exception:
             logger.exception(f"=== could not load cookies from {cookies_file}")
+    return cookies
+
+
+def client_session() -> aiohttp.ClientSession:
+    """Create the aiohttp client session shared by all the feeds of a poll run."""
     headers = {
         "User-Agent": USER_AGENT,
     }
     timeout = aiohttp.ClientTimeout(total=30)
-    async with aiohttp.ClientSession(
-        loop=loop,
-        cookies=cookies,
+    return aiohttp.ClientSession(
         headers=headers,
         timeout=timeout,
-    ) as client:
-        return await asyncio.gather(
-            *[retrieve(client, entry, feed, verbose=verbose) for entry in entries],
-        )
+    )
 
 
-def normalize_structure(soup, exclude):
-    # remove blacklisted tags
-    for name in [
-        "img",
-        "figcaption",
-        "figure",
-        "hr",
-        "source",
-        "object",
-        "video",
-        "iframe",
-        "audio",
-        "track",
-        "embed",
-        "param",
-        "map",
-        "area",
-        "form",
-        "input",
-        "button",
-        "canvas",
-        "style",
-        "script",
-        "svg",
-        "picture",
-    ]:
-        for element in soup.find_all(name):
-            element.extract()
-
-    # remove excluded tags
-    if exclude and exclude != "":
-        for element in soup.select(exclude):
-            element.extract()
-
-    # turn divs into paragraphs
-    for div in soup.find_all("div"):
-        if isinstance(div, Tag):
-            div.name = "p"
-
-    # unpack graylisted tags
-    for tag in soup.find_all(True):
-        if isinstance(tag, Tag):
-            if tag.name not in [
-                "a",
-                "p",
-                "i",
-                "strong",
-                "b",
-                "br",
-                "table",
-                "tr",
-                "th",
-                "td",
-                "h1",
-                "h2",
-                "h3",
-                "h4",
-                "h5",
-                "h6",
-                "pre",
-                "hr",
-                "blockquote",
-                "ul",
-                "ol",
-                "li",
-                "dl",
-                "dt",
-                "dd",
-                "em",
-                "small",
-                "s",
-                "cite",
-                "code",
-                "sub",
-                "sup",
-                "span",
-                "tbody",
-                "thead",
-                "tfoot",
-            ]:
-                tag.replaceWithChildren()
-
-
-def normalize_content(
-    content: str,
-    base_url: str | None = None,
-    exclude: str | None = None,
-) -> str:
-    html = " ".join(line.strip() for line in content.split("\n"))
-    soup = BeautifulSoup(html, "lxml")
-
-    normalize_structure(soup, exclude)
-
-    # normalize links
-    if base_url:
-        for a in soup.find_all("a", href=True):
-            if isinstance(a, Tag):
-                a["target"] = "_blank"
-                href_value = a["href"]
-                if isinstance(href_value, str):
-                    parsed_link = urllib.parse.urlparse(href_value)
-                    if parsed_link.scheme == "":
-                        a["href"] = urllib.parse.urljoin(base_url, href_value)
-
-    # remove duplicate br tags
-    for br in soup.find_all("br"):
-        if isinstance(br.next_sibling, Tag) and br.next_sibling.name.lower() == "br":
-            br.extract()
-
-    # remove comments
-    comments = soup.find_all(string=lambda text: isinstance(text, Comment))
-    [comment.extract() for comment in comments]
-
-    # remove style attributes from all tags
-    for tag in soup.find_all(True):
-        if tag.has_attr("style"):
-            del tag["style"]
-
-    # identify top-level element
-    if soup.body:
-        top = soup.body
-    elif soup.html:
-        top = soup.html
-    else:
-        top = soup
-
-    # normalize paragraphs
-    new_soup = BeautifulSoup("", "lxml")
-    current_paragraph = new_soup.new_tag("p")
-    new_soup.append(current_paragraph)
-    inline_tags = [
-        "a",
-        "b",
-        "cite",
-        "code",
-        "em",
-        "i",
-        "s",
-        "small",
-        "span",
-        "strong",
-        "sub",
-        "sup",
-    ]
-    for s in top.children:
-        if isinstance(s, NavigableString) or s.name in inline_tags:
-            current_paragraph.append(copy.copy(s))
-        elif s.name == "p":
-            current_paragraph = copy.copy(s)
-            new_soup.append(current_paragraph)
-        else:
-            current_paragraph = new_soup.new_tag("p")
-            t = copy.copy(s)
-            new_soup.append(t)
-            t.wrap(current_paragraph)
-
-    # get rid of br's
-    fragment = "".join(str(c) for c in new_soup.contents)
-    html = fragment.replace("<br/>", "</p><p>")
-    soup = BeautifulSoup(html, "lxml")
-
-    # remove empty paragraphs
-    for p in soup.find_all("p"):
-        if len(p.get_text(strip=True)) == 0:
-            p.extract()
-
-    # flatten
-    soup.html.body.unwrap()
-    soup.html.unwrap()
-
-    prettified = soup.prettify(formatter="html5")
-    decoded = (
-        prettified.decode("utf-8") if isinstance(prettified, bytes) else prettified
-    )
-    # get rid of nbsp
-    return decoded.replace("&nbsp;", " ")
+class HostLimiter:
+    """Cap the number of concurrent requests to each host."""
 
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
 
-def clean(s: str) -> str:
-    if s:
-        t = html.unescape(s)
-        u = lxml.html.fromstring(t)
-        return u.text_content()
-    return s
+    def __call__(self, url: str) -> asyncio.Semaphore:
+        host = urllib.parse.urlparse(url).netloc.lower()
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.limit)
+        return self._semaphores[host]
+
+
+async def main(
+    client: aiohttp.ClientSession,
+    entries: list[dict[str, Any]],
+    feed: Any,
+    *,
+    verbose: bool,
+    host_limiter: HostLimiter | None = None,
+    readability: ReadabilityClient | None = None,
+    normalizer: Executor | None = None,
+) -> list[tuple[int, int, int]]:
+    cookies = load_cookies(feed)
+    async with contextlib.AsyncExitStack() as stack:
+        if readability is None and feed.incomplete:
+            # one client for all the entries, sharing its connections
+            readability = await stack.enter_async_context(ReadabilityClient())
+        results = await asyncio.gather(
+            *[
+                retrieve(
+                    client,
+                    entry,
+                    feed,
+                    verbose=verbose,
+                    cookies=cookies,
+                    host_limiter=host_limiter,
+                    readability=readability,
+                    normalizer=normalizer,
+                )
+                for entry in entries
+            ],
+        )
+
+    # Store all the articles of the feed at once
+    articles = [article for _, _, article in results if article is not None]
+    article_ids = iter(await sync_to_async(store_articles)(articles))
+    counts = []
+    for retrieved, failed, article in results:
+        stored = 0
+        store_failed = 0
+        if article is not None:
+            article_id = next(article_ids)
+            if article_id > 0:
+                stored = 1
+                if verbose:
+                    logger.info(
+                        f"=== new article {article['url']} stored with id {article_id}",
+                    )
+            elif article_id < 0:
+                store_failed = 1
+        counts.append((retrieved, failed + store_failed, stored))
+    return counts
 
 
 class ArticleDict(TypedDict, total=False):
@@ -387,11 +390,134 @@ class ArticleDict(TypedDict, total=False):
     content: str
     feed_id: int
     language: str
-    stamp: int
+    stamp: str | datetime.datetime | None
     title: str
     url: str
 
 
+INSERT_ARTICLES_SQL = """
+    INSERT INTO articles (
+        author,
+        title,
+        title_original,
+        content,
+        content_original,
+        feed_id,
+        language,
+        stamp,
+        url
+    )
+    SELECT DISTINCT ON (url)
+        author,
+        title,
+        title_original,
+        content,
+        content_original,
+        feed_id,
+        language,
+        COALESCE(stamp, now()),
+        url
+    FROM unnest(
+        %s::text[],
+        %s::text[],
+        %s::text[],
+        %s::text[],
+        %s::text[],
+        %s::integer[],
+        %s::text[],
+        %s::timestamptz[],
+        %s::text[]
+    ) AS a(
+        author,
+        title,
+        title_original,
+        content,
+        content_original,
+        feed_id,
+        language,
+        stamp,
+        url
+    )
+    -- articles is partitioned, so the URLs are unique through articles_urls
+    WHERE NOT EXISTS (
+        SELECT 1 FROM articles_urls WHERE articles_urls.url = a.url
+    )
+    RETURNING id, url
+"""
+
+
+def _insert_articles(articles: list[ArticleDict]) -> dict[str, int]:
+    """Insert the articles with a single statement, return the ids by URL."""
+    base_language = "it"
+    columns: list[list[Any]] = [[] for _ in range(9)]
+    for article in articles:
+        translated = article["language"] == base_language
+        stamp = article.get("stamp") or None
+        if isinstance(stamp, datetime.datetime):
+            stamp = stamp.isoformat()
+        row = [
+            article["author"],
+            article["title"] if translated else None,
+            None if translated else article["title"],
+            article["content"] if translated else None,
+            None if translated else article["content"],
+            article["feed_id"],
+            article["language"],
+            stamp,
+            article["url"],
+        ]
+        for column, value in zip(columns, row, strict=True):
+            column.append(value)
+    with connection.cursor() as cursor:
+        cursor.execute(INSERT_ARTICLES_SQL, columns)
+        return {url: article_id for article_id, url in cursor.fetchall()}
+
+
+def _url_already_stored(error: DatabaseError) -> bool:
+    """
+    Tell if error is the unique violation raised by the articles_claim_url
+    trigger, when another poller stored the same URL in the meantime.
+    """
+    diag = getattr(error.__cause__, "diag", None)
+    return getattr(diag, "constraint_name", None) == "articles_urls_pkey"
+
+
+def store_articles(articles: list[ArticleDict]) -> list[int]:
+    """
+    Store a batch of articles in the database with a single statement.
+    returns, for each article:
+    - a strictly positive integer (the id of the inserted article) on success
+    - 0 if an article with the same URL was already stored
+    - -1 on failure
+    """
+    if not articles:
+        return []
+    try:
+        with transaction.atomic():
+            ids = _insert_articles(articles)
+        outcomes = [ids.pop(article["url"], 0) for article in articles]
+    except DatabaseError:
+        # find out which articles are to blame, storing them one at a time
+        logger.exception("=== bulk insert failed, storing articles one by one")
+        outcomes = []
+        for article in articles:
+            try:
+                with transaction.atomic():
+                    ids = _insert_articles([article])
+                outcomes.append(ids.get(article["url"], 0))
+            except DatabaseError as e:
+                if _url_already_stored(e):
+                    outcomes.append(0)
+                else:
+                    logger.exception(f"=== could not store article {article['url']}")
+                    outcomes.append(-1)
+
+    for article, outcome in zip(articles, outcomes, strict=True):
+        if outcome > 0:
+            seen_urls.add(article["url"])
+    return outcomes
+
+
 @sync_to_async
 def store_article(
     article: ArticleDict,
@@ -399,35 +525,65 @@ def store_article(
     """
     Store an article in the database.
     returns:
-    - None on failure
     - a strictly positive integer (the id of the inserted article) on success
+    - 0 if an article with the same URL was already stored
+    - -1 on failure
     """
-    base_language = "it"
-
-    if article["language"] == base_language:
-        instance = Articles(
-            author=article["author"],
-            title=article["title"],
-            url=article["url"],
-            content=article["content"],
-            feed_id=article["feed_id"],
-            language=article["language"],
-            stamp=article["stamp"],
-        )
-        instance.save()
-        return instance.id
-
-    instance = Articles(
-        author=article["author"],
-        title_original=article["title"],
-        url=article["url"],
-        content_original=article["content"],
-        feed_id=article["feed_id"],
-        language=article["language"],
-        stamp=article["stamp"],
+    return store_articles([article])[0]
+
+
+REFRESH_FEEDS_DATA_SQL = """
+    WITH dirty AS (
+        DELETE FROM feeds_data_dirty RETURNING feed_id
+    ), counts AS (
+        SELECT feed_id, COUNT(*) AS article_count
+        FROM articles
+        WHERE feed_id IN (SELECT feed_id FROM dirty)
+        GROUP BY feed_id
+    ), diffs AS (
+        SELECT
+            feed_id,
+            stamp - LAG(stamp) OVER (PARTITION BY feed_id ORDER BY stamp)
+                AS time_from_last_post
+        FROM articles
+        WHERE feed_id IN (SELECT feed_id FROM dirty)
+            AND stamp > now() - interval '365 days'
+    ), tflp AS (
+        SELECT
+            feed_id,
+            date_part('epoch', AVG(time_from_last_post))::integer
+                AS average_time_from_last_post
+        FROM diffs
+        GROUP BY feed_id
     )
-    instance.save()
-    return instance.id
+    INSERT INTO feeds_data
+        (id, last_polled_epoch, article_count, average_time_from_last_post)
+    SELECT
+        feeds.id,
+        date_part('epoch', feeds.last_polled),
+        COALESCE(counts.article_count, 0),
+        tflp.average_time_from_last_post
+    FROM dirty
+    JOIN feeds ON feeds.id = dirty.feed_id
+    LEFT JOIN counts ON counts.feed_id = dirty.feed_id
+    LEFT JOIN tflp ON tflp.feed_id = dirty.feed_id
+    ON CONFLICT (id) DO UPDATE
+    SET
+        last_polled_epoch = EXCLUDED.last_polled_epoch,
+        article_count = EXCLUDED.article_count,
+        average_time_from_last_post = EXCLUDED.average_time_from_last_post
+"""
+
+
+def refresh_feeds_data() -> int:
+    """
+    Recompute the statistics in feeds_data of the feeds whose articles
+    changed since the last refresh, as queued by the triggers on articles,
+    with a single statement; return the number of feeds refreshed.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(REFRESH_FEEDS_DATA_SQL)
+        return cursor.rowcount
 
 
 def frequency_skip(frequency_string: str, feed_id: int) -> str | None:
@@ -473,23 +629,23 @@ def prune_duplicates(entries: list[dict[str, Any]]) -> list[dict[str, Any]]:
     return result
 
 
-def prune_already_retrieved(entries: list[dict[str, Any]]) -> int:
+def prune_already_retrieved(entries: list[Any], key: str = "link") -> int:
     """
-    prune in-place the articles we already stored in the DB
-    To remove elements from a list while iterating over it, you need to go backwards
-    http://stackoverflow.com/a/7573706
+    Prune in-place the entries whose URL we already stored in the DB.
+    Entries are either URLs or dictionaries holding the URL under key; most
+    already stored URLs are spotted by the in-memory seen URLs filter, the
+    others are checked with one query per batch.
     """
-    pruned = 0
-    for entry in entries[-1::-1]:
-        article = Articles.objects.filter(url=entry["link"]).first()
-        if article:
-            logger.info(
-                f"=== article {entry["link"]} already retrieved with id = {article.id}",
-            )
-            entries.remove(entry)
-            pruned += 1
-
-    return pruned
+    urls = [entry if isinstance(entry, str) else entry[key] for entry in entries]
+    stored = seen_urls.stored(urls)
+    if not stored:
+        return 0
+    for url in stored:
+        logger.info(f"=== article {url} already retrieved")
+    entries[:] = [
+        entry for entry, url in zip(entries, urls, strict=True) if url not in stored
+    ]
+    return len(urls) - len(entries)
 
 
 def generate_rss(json_data):
@@ -546,13 +702,13 @@ def generate_rss(json_data):
     return rss
 
 
-def _fetch_feed_response(feed_url):
+async def _fetch_feed_response(client, feed_url, headers=None):
     """
     Fetch the feed response with error handling.
 
     Returns:
-        tuple: (response, status_code)
-        response will be None if an error occurred
+        tuple: (body, status_code, response_headers)
+        body will be None if an error occurred
     """
     # -100: unextractable HTTP error status
     # -40: generic exception
@@ -561,43 +717,73 @@ def _fetch_feed_response(feed_url):
     # -10: timeout
     # -5: invalid feed
     # 0: default status code
-    # 200-5xx: HTTP status code
+    # 1: content unchanged since the last poll, parsing skipped
+    # 200-5xx: HTTP status code (304: not modified, parsing skipped)
     try:
-        response = requests.get(
+        async with client.get(
             feed_url,
-            timeout=60,
-            headers={"User-Agent": USER_AGENT},
-        )
-        status_code = response.status_code
-    except requests.exceptions.HTTPError as e:
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=FEED_TIMEOUT),
+        ) as response:
+            status_code = response.status
+            response_headers = response.headers
+            body = await response.read()
+    except aiohttp.ClientResponseError as e:
         logger.exception(f"== http error when reading RSS {feed_url}:")
-        status_code = e.response.status_code if e.response is not None else -100
-        return None, status_code
-    except requests.exceptions.ConnectionError:
-        logger.exception(f"== connection error when reading RSS {feed_url}")
-        return None, -20
-    except requests.exceptions.Timeout:
+        return None, e.status or -100, {}
+    except TimeoutError:
         logger.exception(f"== timeout when reading RSS {feed_url}")
-        return None, -10
-    except requests.exceptions.RequestException:
+        return None, -10, {}
+    except aiohttp.ClientConnectionError:
+        logger.exception(f"== connection error when reading RSS {feed_url}")
+        return None, -20, {}
+    except aiohttp.ClientError:
         logger.exception(
             f"== generic request exception when reading RSS {feed_url}",
         )
-        return None, -30
+        return None, -30, {}
     except Exception:  # Catching broader exceptions
         logger.exception(f"== generic exception when reading RSS {feed_url}")
-        return None, -40
+        return None, -40, {}
     else:
-        return response, status_code
+        return body, status_code, response_headers
+
+
+def _conditional_headers(feed_cache):
+    """Build the conditional GET request headers from the cached validators."""
+    headers = {}
+    if feed_cache:
+        if feed_cache.etag:
+            headers["If-None-Match"] = feed_cache.etag
+        if feed_cache.last_modified:
+            headers["If-Modified-Since"] = feed_cache.last_modified
+    return headers
+
+
+@sync_to_async
+def _load_feed_cache(feed):
+    return FeedCache.objects.filter(feed=feed).first()
+
+
+@sync_to_async
+def _save_feed_cache(feed, response_headers, content_hash):
+    FeedCache.objects.update_or_create(
+        feed=feed,
+        defaults={
+            "etag": response_headers.get("ETag", ""),
+            "last_modified": response_headers.get("Last-Modified", ""),
+            "content_hash": content_hash,
+        },
+    )
 
 
-def _parse_feed_content(feed, response):
+def _parse_feed_content(feed, body):
     """Parse feed content and handle special cases."""
     if feed.url[-29:] == "/api/v1/trends/links?limit=20":
-        json_data = json.loads(response.text)
+        json_data = json.loads(body)
         rss = generate_rss(json_data)
     else:
-        rss = response.text
+        rss = body
 
     return feedparser.parse(rss)
 
@@ -629,54 +815,101 @@ def _process_feed_entries(entries, *, verbose=True):
     return sorted(entries, key=lambda entry: entry["stamp"])
 
 
-def _retrieve_and_process_entries(sorted_entries, feed, *, verbose=True):
-    """Retrieve and process entries using async."""
-    loop = asyncio.new_event_loop()
-    results = loop.run_until_complete(
-        main(loop, sorted_entries, feed, verbose=verbose),
-    )
-
-    retrieved, failed, stored = 0, 0, 0
-    for r_item in results:
-        retrieved += r_item[0]
-        failed += r_item[1]
-        stored += r_item[2]
-
-    return retrieved, failed, stored
-
-
-def _poll_feed(feed):
-    verbose = True
-
-    # Initialize variables that will be saved in FeedPoller
-    retrieved, failed, stored = 0, 0, 0
-
-    # Fetch feed response with error handling
-    response, status_code = _fetch_feed_response(feed.url)
-
-    # If response is None, return early with error status
-    if not response:
-        return retrieved, failed, stored, status_code
-
-    # Check for HTTP error status code
-    if response.status_code != HTTP_SUCCESS_CODE:
-        logger.error(f"== url {feed.url} returned error status {response.status_code}")
-        return retrieved, failed, stored, status_code
+class PollingEngine:
+    """
+    Poll many feeds concurrently on a single event loop.
+
+    All feeds share one aiohttp client session; a global semaphore caps the
+    number of feeds in flight and a HostLimiter caps the concurrent requests
+    to each host, so that a slow host only delays its own feeds. The HTML
+    of the articles is normalized by a pool of worker processes, started
+    once per run, so that parsing large pages never blocks the downloads.
+    The statistics of the feeds that got new articles are refreshed once,
+    at the end of the run.
+    """
 
-    # Parse feed content
-    rss_feed = _parse_feed_content(feed, response)
+    def __init__(
+        self,
+        concurrency: int | None = None,
+        per_host_concurrency: int | None = None,
+        normalize_workers: int | None = None,
+        *,
+        verbose: bool = True,
+    ):
+        self.concurrency = concurrency or settings.POLLER_CONCURRENCY
+        self.per_host_concurrency = (
+            per_host_concurrency or settings.POLLER_PER_HOST_CONCURRENCY
+        )
+        self.normalize_workers = (
+            settings.POLLER_NORMALIZE_WORKERS
+            if normalize_workers is None
+            else normalize_workers
+        )
+        self.verbose = verbose
+        self.client: aiohttp.ClientSession | None = None
+        self.readability: ReadabilityClient | None = None
+        self.normalizer: Executor | None = None
+        self.host_limiter = HostLimiter(self.per_host_concurrency)
+
+    def run(self, pollers: list["Poller"]) -> None:
+        """Poll the feeds of the given pollers, blocking until all are done."""
+        # catch up with the articles stored by other processes
+        seen_urls.refresh()
+        asyncio.run(self.poll(pollers))
+        refreshed = refresh_feeds_data()
+        if self.verbose:
+            logger.info(f"== statistics of {refreshed} feeds refreshed")
+
+    async def poll(self, pollers: list["Poller"]) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        # semaphores are bound to the event loop they are first used in
+        self.host_limiter = HostLimiter(self.per_host_concurrency)
+
+        async def poll_one(p):
+            async with semaphore:
+                try:
+                    await p.apoll(self)
+                except Exception:
+                    logger.exception(f"== unexpected error polling feed {p.feed.id}")
+
+        self.normalizer = normalizer_pool(self.normalize_workers)
+        try:
+            async with (
+                client_session() as self.client,
+                ReadabilityClient() as self.readability,
+            ):
+                await asyncio.gather(*[poll_one(p) for p in pollers])
+        finally:
+            if self.normalizer is not None:
+                self.normalizer.shutdown(cancel_futures=True)
+        self.client = None
+        self.readability = None
+        self.normalizer = None
+
+
+class SingleFeedEngine(PollingEngine):
+    """
+    Lightweight engine polling a single feed on demand, e.g. from a request.
 
-    # Process feed entries
-    sorted_entries = _process_feed_entries(rss_feed["entries"], verbose=verbose)
+    The HTML of the articles is normalized in the calling thread rather than
+    in a pool of processes. The seen URLs filter is not built: the URLs are
+    looked up in the DB directly. The statistics of the feed are left to the
+    next run of the polling engine.
+    """
 
-    # Retrieve and process entries
-    retrieved, failed, stored = _retrieve_and_process_entries(
-        sorted_entries,
-        feed,
-        verbose=verbose,
-    )
+    def __init__(self, *, verbose: bool = True):
+        super().__init__(
+            concurrency=1,
+            per_host_concurrency=1,
+            normalize_workers=0,
+            verbose=verbose,
+        )
 
-    return retrieved, failed, stored, status_code
+    def run(self, pollers: list["Poller"]) -> None:
+        if seen_urls.bloom is not None:
+            # built by the polling engine in this process: keep it up to date
+            seen_urls.refresh()
+        asyncio.run(self.poll(pollers))
 
 
 class Poller:
@@ -686,6 +919,9 @@ class Poller:
         self.failed = 0
         self.feed = feed
         self.p = None
+        self.force = False
+        # Retry-After header of the last failed fetch of the feed
+        self.retry_after = None
 
     def invoke(self, script):
         self.p = subprocess.Popen(
@@ -778,7 +1014,151 @@ class Poller:
             http_status_code,
         )
 
-    def poll(self):
+    async def _poll_feed(self, engine):
+        """Fetch the feed, then retrieve and store its new entries."""
+        feed = self.feed
+
+        # Initialize variables that will be saved in FeedPoller
+        retrieved, failed, stored = 0, 0, 0
+
+        # Fetch feed response with error handling, sending the validators of
+        # the previous poll so that unchanged feeds can answer 304
+        feed_cache = await _load_feed_cache(feed)
+        async with engine.host_limiter(feed.url):
+            body, status_code, response_headers = await _fetch_feed_response(
+                engine.client,
+                feed.url,
+                headers=_conditional_headers(feed_cache),
+            )
+
+        # If body is None, return early with error status
+        if body is None:
+            return retrieved, failed, stored, status_code
+
+        if status_code == HTTP_NOT_MODIFIED_CODE:
+            logger.info(f"== url {feed.url} not modified")
+            return retrieved, failed, stored, status_code
+
+        # Check for HTTP error status code
+        if status_code != HTTP_SUCCESS_CODE:
+            logger.error(f"== url {feed.url} returned error status {status_code}")
+            self.retry_after = response_headers.get("Retry-After")
+            return retrieved, failed, stored, status_code
+
+        # Skip parsing if the server ignores the validators but the body is
+        # identical to the one we processed last time
+        content_hash = hashlib.sha256(body).hexdigest()
+        if feed_cache and feed_cache.content_hash == content_hash:
+            logger.info(f"== url {feed.url} content unchanged")
+            return retrieved, failed, stored, UNCHANGED_CONTENT_CODE
+
+        # Parse feed content
+        rss_feed = _parse_feed_content(feed, body)
+
+        # Process feed entries
+        sorted_entries = await sync_to_async(_process_feed_entries)(
+            rss_feed["entries"],
+            verbose=engine.verbose,
+        )
+
+        # Retrieve and process entries
+        results = await main(
+            engine.client,
+            sorted_entries,
+            feed,
+            verbose=engine.verbose,
+            host_limiter=engine.host_limiter,
+            readability=engine.readability,
+            normalizer=engine.normalizer,
+        )
+        for r_item in results:
+            retrieved += r_item[0]
+            failed += r_item[1]
+            stored += r_item[2]
+
+        # remember this version of the feed even if some of its entries
+        # failed: they are retried when the feed changes, rather than the
+        # whole feed being downloaded and parsed again at every poll
+        await _save_feed_cache(feed, response_headers, content_hash)
+
+        return retrieved, failed, stored, status_code
+
+    async def _scrape(self, engine, scraper_class):
+        """Poll the feed with its in-process scraper and store what it found."""
+        logger.info(f"== using scraper {scraper_class.__name__}")
+        scraper = scraper_class(
+            self.feed,
+            engine.client,
+            engine.host_limiter,
+            verbose=engine.verbose,
+        )
+        try:
+            raw_articles = await scraper.scrape()
+        except aiohttp.ClientResponseError as e:
+            logger.exception(f"== http error while scraping feed {self.feed.id}")
+            return scraper.retrieved, scraper.failed, 0, e.status or -100
+        except TimeoutError:
+            logger.exception(f"== timeout while scraping feed {self.feed.id}")
+            return scraper.retrieved, scraper.failed, 0, -10
+        except aiohttp.ClientConnectionError:
+            logger.exception(f"== connection error while scraping feed {self.feed.id}")
+            return scraper.retrieved, scraper.failed, 0, -20
+        except aiohttp.ClientError:
+            logger.exception(f"== request exception while scraping feed {self.feed.id}")
+            return scraper.retrieved, scraper.failed, 0, -30
+        except Exception:
+            logger.exception(f"== exception while scraping feed {self.feed.id}")
+            return scraper.retrieved, scraper.failed, 0, -40
+
+        articles = await asyncio.gather(
+            *[
+                prepare_article(self.feed, raw, normalizer=engine.normalizer)
+                for raw in raw_articles
+            ],
+        )
+        article_ids = await sync_to_async(store_articles)(articles)
+        try:
+            await scraper.stored(article_ids)
+        except Exception:
+            logger.exception(f"== exception after scraping feed {self.feed.id}")
+        stored = sum(1 for article_id in article_ids if article_id > 0)
+        failed = scraper.failed + sum(1 for article_id in article_ids if article_id < 0)
+        return scraper.retrieved, failed, stored, HTTP_SUCCESS_CODE
+
+    @sync_to_async
+    def _record_polling(
+        self,
+        poll_start_time,
+        poll_end_time,
+        http_status_code,
+        retrieved,
+        failed,
+        stored,
+    ):
+        FeedPolling.objects.create(
+            feed=self.feed,
+            poll_start_time=poll_start_time,
+            poll_end_time=poll_end_time,
+            http_status_code=http_status_code,
+            articles_retrieved=retrieved,
+            articles_failed=failed,
+            articles_stored=stored,
+        )
+
+        self.feed.last_polled = poll_end_time  # Use poll_end_time for consistency
+        self.feed.save()
+        feed_breaker = breaker.record(self.feed, http_status_code, self.retry_after)
+        return feed_breaker.opened_until
+
+    def poll(self, *, force: bool = False):
+        """
+        Poll this feed alone, blocking until done; if force is set, poll it
+        even if its circuit is open.
+        """
+        self.force = force
+        SingleFeedEngine().run([self])
+
+    async def apoll(self, engine):
         poll_start_time = datetime.datetime.now(datetime.UTC)
         http_status_code = 0
         # Using new names for counts for this specific poll run
@@ -788,44 +1168,75 @@ class Poller:
 
         # Check if polling should be skipped
         if self._should_skip_polling():
+            if self.feed.active:
+                # wait for the next time the frequency constraints allow
+                await sync_to_async(reschedule)(self.feed)
             return
 
-        logger.info(f"== polling feed {self.feed.id}")
+        # Leave alone the feeds that keep failing until their backoff elapses
+        if not self.force:
+            parked = await sync_to_async(breaker.allow)(self.feed)
+            if parked is not None:
+                logger.info(
+                    f"== skipping feed {self.feed.id} because its circuit is "
+                    f"{parked.state} until {parked.opened_until:%Y-%m-%d %H:%M}: "
+                    f"{parked.reason}",
+                )
+                await sync_to_async(reschedule)(
+                    self.feed,
+                    not_before=parked.opened_until,
+                )
+                return
 
-        # Handle either script-based or direct feed polling
-        if self.feed.script:
-            script_path = self.feed.script.replace("/srv/calo.news/py/", "/app/news/")
-            (
+        # the feed was claimed until the lease of the scheduler expires: hand
+        # it back to the scheduler even if the poll fails midway
+        not_before = None
+        try:
+            logger.info(f"== polling feed {self.feed.id}")
+
+            # Handle either scraper, script-based or direct feed polling
+            scraper = get_scraper(self.feed.script)
+            if scraper is not None:
+                (
+                    feed_polling_retrieved_count,
+                    feed_polling_failed_count,
+                    feed_polling_stored_count,
+                    http_status_code,
+                ) = await self._scrape(engine, scraper)
+            elif self.feed.script:
+                script_path = self.feed.script.replace(
+                    "/srv/calo.news/py/",
+                    "/app/news/",
+                )
+                (
+                    feed_polling_retrieved_count,
+                    feed_polling_failed_count,
+                    feed_polling_stored_count,
+                    http_status_code,
+                ) = await asyncio.to_thread(self._handle_script_polling, script_path)
+            else:
+                (
+                    feed_polling_retrieved_count,
+                    feed_polling_failed_count,
+                    feed_polling_stored_count,
+                    http_status_code,
+                ) = await self._poll_feed(engine)
+
+            poll_end_time = datetime.datetime.now(datetime.UTC)
+
+            # Update the main Poller instance cumulative counts
+            self.retrieved += feed_polling_retrieved_count
+            self.failed += feed_polling_failed_count
+            self.stored += feed_polling_stored_count
+
+            # Update database with polling results
+            not_before = await self._record_polling(
+                poll_start_time,
+                poll_end_time,
+                http_status_code,
                 feed_polling_retrieved_count,
                 feed_polling_failed_count,
                 feed_polling_stored_count,
-                http_status_code,
-            ) = self._handle_script_polling(script_path)
-        else:
-            retrieved, failed, stored, status_from_poll = _poll_feed(self.feed)
-            feed_polling_retrieved_count = retrieved
-            feed_polling_failed_count = failed
-            feed_polling_stored_count = stored
-            http_status_code = status_from_poll
-
-        poll_end_time = datetime.datetime.now(datetime.UTC)
-
-        # Update database with polling results
-
-        # Update the main Poller instance cumulative counts
-        self.retrieved += feed_polling_retrieved_count
-        self.failed += feed_polling_failed_count
-        self.stored += feed_polling_stored_count
-
-        FeedPolling.objects.create(
-            feed=self.feed,
-            poll_start_time=poll_start_time,
-            poll_end_time=poll_end_time,
-            http_status_code=http_status_code,
-            articles_retrieved=feed_polling_retrieved_count,
-            articles_failed=feed_polling_failed_count,
-            articles_stored=feed_polling_stored_count,
-        )
-
-        self.feed.last_polled = poll_end_time  # Use poll_end_time for consistency
-        self.feed.save()
+            )
+        finally:
+            await sync_to_async(reschedule)(self.feed, not_before=not_before)